@@ -0,0 +1,232 @@
+"""
+Pool of LLM clients and agents keyed by configuration
+
+同じ設定での再初期化では LLM クライアントとエージェントを作り直さず、
+構築済みのものを返す。キーは LLMConfig の全フィールド（API キーはハッシュ）
+とエージェントモード・ツール構成から作る。
+"""
+
+import os
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from config.llm_config import LLMConfig
+from .osint_agent import AGENT_MODE, OSINTAgent
+
+if TYPE_CHECKING:
+    from langchain.tools import Tool
+
+logger = logging.getLogger(__name__)
+
+POOL_MAX_AGENTS = int(os.getenv("OSINT_AGENT_POOL_SIZE", "8"))
+# セッション専用エージェントの上限数と、使われないまま破棄するまでの秒数
+MAX_SESSIONS = int(os.getenv("OSINT_MAX_SESSIONS", "32"))
+SESSION_IDLE_TTL = float(os.getenv("OSINT_SESSION_IDLE_TTL", "7200"))
+
+
+def config_fingerprint(llm_config: LLMConfig) -> str:
+    """Stable hash of every LLMConfig field"""
+    parts = []
+    for name, value in sorted(vars(llm_config).items()):
+        if name.endswith("api_key"):
+            # キーそのものは保持しない
+            value = hashlib.sha256(str(value).encode("utf-8")).hexdigest()[:16]
+        parts.append(f"{name}={value!r}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class AgentPool:
+    """Caches LLM clients by config and agents by config + mode + tool set
+
+    Shared agents (get_agent) are for single-user callers; browser sessions
+    use get_session_agent, which gives every session its own agent (memory,
+    metrics, run queue) built on the pooled LLM client.
+    """
+
+    def __init__(self, max_agents: int = POOL_MAX_AGENTS, max_sessions: int = MAX_SESSIONS,
+                 session_idle_ttl: float = SESSION_IDLE_TTL):
+        self.max_agents = max_agents
+        self.max_sessions = max_sessions
+        self.session_idle_ttl = session_idle_ttl
+        self._llms: Dict[str, Any] = {}
+        self._agents: "OrderedDict[str, OSINTAgent]" = OrderedDict()
+        # セッション ID -> (エージェントキー, エージェント, 最終利用時刻)
+        self._sessions: "OrderedDict[str, Tuple[str, OSINTAgent, float]]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._warmup_hooks: List[Callable[[], None]] = []
+        self._stats = {"agent_hits": 0, "agent_misses": 0, "llm_hits": 0, "llm_misses": 0,
+                       "session_hits": 0, "session_misses": 0, "sessions_expired": 0}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def _agent_key(self, fingerprint: str, mode: str, extra_tools: Sequence["Tool"]) -> str:
+        tool_names = ",".join(sorted(tool.name for tool in extra_tools))
+        return f"{fingerprint}:{mode}:{tool_names}"
+
+    def get_llm(self, llm_config: LLMConfig) -> Any:
+        """Return the pooled LLM client for a configuration"""
+        fingerprint = config_fingerprint(llm_config)
+        with self._lock:
+            if fingerprint in self._llms:
+                self._stats["llm_hits"] += 1
+                return self._llms[fingerprint]
+
+            start = time.monotonic()
+            llm = llm_config.get_llm()
+            self._llms[fingerprint] = llm
+            self._stats["llm_misses"] += 1
+            self._timings.setdefault(fingerprint, {})["llm_ms"] = round((time.monotonic() - start) * 1000, 1)
+            return llm
+
+    def get_agent(self, llm_config: LLMConfig, mode: str = AGENT_MODE,
+                  extra_tools: Sequence["Tool"] = ()) -> OSINTAgent:
+        """Return the pooled agent, building it (and its LLM client) on first use"""
+        fingerprint = config_fingerprint(llm_config)
+        key = self._agent_key(fingerprint, mode, extra_tools)
+        with self._lock:
+            agent = self._agents.get(key)
+            if agent is not None:
+                self._agents.move_to_end(key)
+                self._stats["agent_hits"] += 1
+                return agent
+
+            start = time.monotonic()
+            llm = self.get_llm(llm_config)
+            agent = OSINTAgent(llm_config, mode=mode, llm=llm, extra_tools=list(extra_tools))
+            elapsed_ms = round((time.monotonic() - start) * 1000, 1)
+
+            self._agents[key] = agent
+            while len(self._agents) > self.max_agents:
+                self._agents.popitem(last=False)
+            self._stats["agent_misses"] += 1
+            self._timings.setdefault(fingerprint, {})["agent_ms"] = elapsed_ms
+            logger.info(f"Built {llm_config.provider}/{llm_config.model_name} agent ({mode}) in {elapsed_ms:.0f} ms")
+            return agent
+
+    def get_session_agent(self, session_id: str, llm_config: LLMConfig, mode: str = AGENT_MODE,
+                          extra_tools: Sequence["Tool"] = ()) -> OSINTAgent:
+        """Return the agent owned by a session, rebuilding it when the settings change
+
+        The investigation memory is carried over to the rebuilt agent.
+        """
+        key = self._agent_key(config_fingerprint(llm_config), mode, extra_tools)
+        now = time.monotonic()
+        with self._lock:
+            self._expire_sessions(now)
+            entry = self._sessions.get(session_id)
+            if entry is not None and entry[0] == key:
+                self._sessions[session_id] = (key, entry[1], now)
+                self._sessions.move_to_end(session_id)
+                self._stats["session_hits"] += 1
+                return entry[1]
+
+        # 構築中に他のセッションを待たせないようロックの外で作る
+        start = time.monotonic()
+        agent = OSINTAgent(llm_config, mode=mode, llm=self.get_llm(llm_config),
+                           extra_tools=list(extra_tools), session_id=session_id)
+        elapsed_ms = round((time.monotonic() - start) * 1000, 1)
+        if entry is not None:
+            agent.memory = entry[1].memory
+
+        with self._lock:
+            self._sessions[session_id] = (key, agent, time.monotonic())
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["sessions_expired"] += 1
+            self._stats["session_misses"] += 1
+            self._timings.setdefault(config_fingerprint(llm_config), {})["agent_ms"] = elapsed_ms
+        logger.info(f"Built session agent {session_id[:8]} ({llm_config.provider}/{llm_config.model_name}, {mode}) "
+                    f"in {elapsed_ms:.0f} ms")
+        return agent
+
+    def _expire_sessions(self, now: float):
+        """Drop session agents unused for longer than the idle TTL (caller holds the lock)"""
+        expired = [session_id for session_id, (_, _, last_used) in self._sessions.items()
+                   if now - last_used > self.session_idle_ttl]
+        for session_id in expired:
+            del self._sessions[session_id]
+        self._stats["sessions_expired"] += len(expired)
+
+    def find_session_agent(self, session_id: str) -> Optional[OSINTAgent]:
+        """The session's agent if it is still pooled (e.g. after a page reload)"""
+        with self._lock:
+            self._expire_sessions(time.monotonic())
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], entry[1], time.monotonic())
+            return entry[1]
+
+    def drop_session(self, session_id: str):
+        """Forget a session's agent (and its memory)"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def construction_time(self, llm_config: LLMConfig) -> Dict[str, float]:
+        """LLM client and agent construction times (ms) of a configuration"""
+        with self._lock:
+            return dict(self._timings.get(config_fingerprint(llm_config), {}))
+
+    def register_warmup(self, hook: Callable[[], None]):
+        """Register a callable run by warm_up() (e.g. opening caches)"""
+        self._warmup_hooks.append(hook)
+
+    def warm_up(self, llm_config: Optional[LLMConfig] = None, mode: str = AGENT_MODE) -> Dict[str, float]:
+        """Run the warm-up hooks and optionally pre-build the agent for a config
+
+        Returns the time spent per step in milliseconds; a failing hook is
+        logged and skipped.
+        """
+        timings: Dict[str, float] = {}
+        for hook in self._warmup_hooks:
+            start = time.monotonic()
+            try:
+                hook()
+            except Exception as e:
+                logger.warning(f"Warm-up hook {getattr(hook, '__name__', hook)} failed: {e}")
+            timings[getattr(hook, "__name__", repr(hook))] = round((time.monotonic() - start) * 1000, 1)
+
+        if llm_config is not None:
+            start = time.monotonic()
+            self.get_agent(llm_config, mode)
+            timings["agent"] = round((time.monotonic() - start) * 1000, 1)
+        return timings
+
+    def clear(self):
+        with self._lock:
+            self._llms.clear()
+            self._agents.clear()
+            self._sessions.clear()
+            self._timings.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["llm_clients"] = len(self._llms)
+            stats["agents"] = len(self._agents)
+            stats["sessions"] = len(self._sessions)
+        return stats
+
+
+def _open_caches():
+    """Open the SQLite caches so the first lookup does not pay for it"""
+    from tools.crtsh import ct_cache
+    from tools.whois_client import record_cache, referral_cache
+    from utils.result_store import result_store
+    for cache in (ct_cache, record_cache, referral_cache, result_store):
+        cache.stats()
+
+
+def _prepare_resolver():
+    """Create the shared DNS resolver (reads resolv.conf once)"""
+    from tools.dns_resolver import get_resolver
+    get_resolver()
+
+
+agent_pool = AgentPool()
+agent_pool.register_warmup(_open_caches)
+agent_pool.register_warmup(_prepare_resolver)
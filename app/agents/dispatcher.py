@@ -0,0 +1,126 @@
+"""
+Fair dispatcher for agent runs from concurrent sessions
+
+エージェントの実行を上限付きのワーカーで処理する。待ち行列はセッションごとに
+持ち、セッション間はラウンドロビンで取り出すため、1人が大量に投入しても
+他の利用者の実行が後回しにならない。同じセッションの実行は投入順に1件ずつ行う。
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENT_RUNS = int(os.getenv("OSINT_MAX_CONCURRENT_RUNS", "4"))
+
+
+class RunDispatcher:
+    """Bounded worker pool with per-session FIFO queues served round-robin"""
+
+    def __init__(self, max_workers: int = MAX_CONCURRENT_RUNS):
+        self.max_workers = max_workers
+        # セッション ID -> 待ち行列（挿入順がラウンドロビンの順番）
+        self._queues: "OrderedDict[str, Deque[Tuple[Callable[[], Any], Future, float]]]" = OrderedDict()
+        self._in_flight: Set[str] = set()
+        self._condition = threading.Condition()
+        self._workers: list = []
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "wait_ms_total": 0.0, "run_ms_total": 0.0}
+
+    def _ensure_workers(self):
+        # 最初の投入まではスレッドを起動しない
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._work, name=f"agent-run-{len(self._workers)}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, session_id: str, func: Callable[[], Any]) -> Future:
+        """Queue func() for a session and return its future"""
+        future: Future = Future()
+        with self._condition:
+            self._queues.setdefault(session_id, deque()).append((func, future, time.monotonic()))
+            self._stats["submitted"] += 1
+            self._ensure_workers()
+            self._condition.notify()
+        return future
+
+    def position(self, session_id: str, future: Future) -> Optional[int]:
+        """Runs queued ahead of this one in round-robin order
+
+        None once it has started, or when an idle worker is about to take it.
+        """
+        with self._condition:
+            queue = self._queues.get(session_id, ())
+            for index, (_, queued, _) in enumerate(queue):
+                if queued is future:
+                    # 他のセッションからは1巡ごとに1件ずつ先に処理される
+                    ahead = index + sum(
+                        min(len(other_queue), index + 1)
+                        for other, other_queue in self._queues.items() if other != session_id
+                    )
+                    # 同じセッションの実行中がなく、先に取り出される分を除いても空きワーカーが残るなら待たない
+                    if index == 0 and session_id not in self._in_flight and len(self._in_flight) + ahead < self.max_workers:
+                        return None
+                    return ahead
+        return None
+
+    def _next(self) -> Optional[Tuple[str, Callable[[], Any], Future, float]]:
+        """Pop the head of the first idle session's queue and rotate it to the back"""
+        for session_id, queue in self._queues.items():
+            if queue and session_id not in self._in_flight:
+                func, future, queued_at = queue.popleft()
+                self._queues.move_to_end(session_id)
+                if not queue:
+                    del self._queues[session_id]
+                return session_id, func, future, queued_at
+        return None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                item = self._next()
+                while item is None:
+                    self._condition.wait()
+                    item = self._next()
+                session_id, func, future, queued_at = item
+                self._in_flight.add(session_id)
+                self._stats["wait_ms_total"] += (time.monotonic() - queued_at) * 1000
+
+            started = time.monotonic()
+            try:
+                if future.set_running_or_notify_cancel():
+                    future.set_result(func())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._condition:
+                    self._in_flight.discard(session_id)
+                    failed = future.cancelled() or future.exception() is not None
+                    self._stats["failed" if failed else "completed"] += 1
+                    self._stats["run_ms_total"] += (time.monotonic() - started) * 1000
+                    # 同じセッションの次の実行が取り出せるようになった
+                    self._condition.notify_all()
+
+    def run(self, session_id: str, func: Callable[[], Any]) -> Any:
+        """Queue func() and wait for its result"""
+        return self.submit(session_id, func).result()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, in-flight runs and average wait/run times"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats["queued"] = sum(len(queue) for queue in self._queues.values())
+            stats["queued_by_session"] = {session_id: len(queue) for session_id, queue in self._queues.items()}
+            stats["in_flight"] = len(self._in_flight)
+            stats["max_workers"] = self.max_workers
+        finished = stats["completed"] + stats["failed"]
+        stats["avg_wait_ms"] = stats.pop("wait_ms_total") / max(1, finished + stats["in_flight"])
+        stats["avg_run_ms"] = stats.pop("run_ms_total") / max(1, finished)
+        return stats
+
+
+dispatcher = RunDispatcher()
@@ -0,0 +1,251 @@
+"""
+Token-bounded investigation memory
+
+長い調査セッションでも1回あたりのプロンプトが一定の大きさに収まるよう、
+直近のやり取りはそのまま、古いやり取りは要約行にまとめ、調査対象・IP・
+発見済みサブドメインは固定の事実として残す。要約は抽出的に作り、
+追加の LLM 呼び出しは行わない。
+"""
+
+import os
+import re
+import ipaddress
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.tokens import estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+# bounded: トークン上限付き / buffer: 全履歴をそのまま / none: 履歴を使わない
+MEMORY_MODE = os.getenv("OSINT_MEMORY_MODE", "bounded").lower()
+MEMORY_TOKEN_LIMIT = int(os.getenv("OSINT_MEMORY_TOKEN_LIMIT", "1500"))
+MEMORY_RECENT_TURNS = int(os.getenv("OSINT_MEMORY_RECENT_TURNS", "3"))
+
+# 上限の配分（残りは直近のやり取り）
+PINNED_SHARE = 0.25
+SUMMARY_SHARE = 0.25
+# 要約1行あたりの依頼・回答のトークン数
+SUMMARY_REQUEST_TOKENS = 40
+SUMMARY_ANSWER_TOKENS = 60
+# 固定事実ごとに表示する件数
+PINNED_SHOWN = {"targets": 10, "ips": 20, "subdomains": 40}
+
+# re.ASCII: 日本語の文字は \w に含まれるため、「example.comの」のように続けて書かれた対象も取り出せるようにする
+_DOMAIN_PATTERN = re.compile(r"(?<![\w.-])((?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,63})(?![\w-])",
+                             re.IGNORECASE | re.ASCII)
+_IPV4_PATTERN = re.compile(r"(?<![\d.])(\d{1,3}(?:\.\d{1,3}){3})(?![\d.])", re.ASCII)
+_IPV6_PATTERN = re.compile(r"(?<![\w:])((?:[0-9a-f]{1,4}:){2,7}[0-9a-f:]{0,4})(?![\w:])", re.IGNORECASE | re.ASCII)
+# ツール名やファイル名をドメインと誤認しないための末尾
+_NOT_TLDS = {"py", "txt", "json", "xml", "html", "php", "js", "log", "csv", "sh"}
+
+
+@dataclass
+class Turn:
+    request: str
+    answer: str
+
+
+def extract_domains(text: str) -> List[str]:
+    domains = []
+    for match in _DOMAIN_PATTERN.finditer(text or ""):
+        name = match.group(1).lower().rstrip(".")
+        if name.rsplit(".", 1)[-1] not in _NOT_TLDS and name not in domains:
+            domains.append(name)
+    return domains
+
+
+def extract_ips(text: str) -> List[str]:
+    ips = []
+    for pattern in (_IPV4_PATTERN, _IPV6_PATTERN):
+        for match in pattern.finditer(text or ""):
+            try:
+                address = str(ipaddress.ip_address(match.group(1)))
+            except ValueError:
+                continue
+            if address not in ips:
+                ips.append(address)
+    return ips
+
+
+class InvestigationMemory:
+    """Recent turns verbatim, older turns as a rolling summary, pinned key facts
+
+    ``render()`` never exceeds ``token_limit`` (estimated) in bounded mode,
+    however many turns have been added.
+    """
+
+    def __init__(self, mode: str = MEMORY_MODE, token_limit: int = MEMORY_TOKEN_LIMIT,
+                 recent_turns: int = MEMORY_RECENT_TURNS):
+        self.mode = mode
+        self.token_limit = token_limit
+        self.recent_turns = recent_turns
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.turns: List[Turn] = []
+            self._summary: List[str] = []
+            self._folded = 0
+            self._dropped = 0
+            # 挿入順を保つため OrderedDict を集合として使う
+            self.facts: Dict[str, "OrderedDict[str, None]"] = {
+                "targets": OrderedDict(), "ips": OrderedDict(), "subdomains": OrderedDict(),
+            }
+
+    # --- 事実の抽出 ---
+
+    def _pin(self, kind: str, values: List[str]):
+        for value in values:
+            self.facts[kind][value] = None
+
+    def _pin_related(self, text: str):
+        """Pin IPs and subdomains of the known targets found in a text"""
+        self._pin("ips", extract_ips(text))
+        targets = list(self.facts["targets"])
+        self._pin("subdomains", [
+            name for name in extract_domains(text)
+            if name not in self.facts["targets"] and any(name.endswith("." + target) for target in targets)
+        ])
+
+    def note_request(self, request: str):
+        """Pin the targets named in a request before its tools run"""
+        if self.mode == "none":
+            return
+        with self._lock:
+            self._pin("targets", extract_domains(request))
+            self._pin("ips", extract_ips(request))
+
+    def observe(self, text: str):
+        """Pin facts from a tool output"""
+        if self.mode == "none":
+            return
+        with self._lock:
+            self._pin_related(str(text))
+
+    def add_turn(self, request: str, answer: str):
+        """Record a finished request and fold older turns when over budget"""
+        if self.mode == "none":
+            return
+        self.note_request(request)
+        with self._lock:
+            self._pin_related(answer)
+            self.turns.append(Turn(request, answer))
+            if self.mode == "bounded":
+                self._fold()
+
+    # --- 上限の維持 ---
+
+    def _recent_budget(self) -> int:
+        return int(self.token_limit * (1 - PINNED_SHARE - SUMMARY_SHARE))
+
+    def _fold(self):
+        while self.turns and (
+            len(self.turns) > self.recent_turns
+            or (len(self.turns) > 1 and self._turns_tokens() > self._recent_budget())
+        ):
+            turn = self.turns.pop(0)
+            answer = next((line.strip() for line in turn.answer.splitlines() if line.strip()), "")
+            self._summary.append(
+                f"- {truncate_to_tokens(' '.join(turn.request.split()), SUMMARY_REQUEST_TOKENS)}"
+                f" → {truncate_to_tokens(answer, SUMMARY_ANSWER_TOKENS)}"
+            )
+            self._folded += 1
+
+        summary_budget = int(self.token_limit * SUMMARY_SHARE)
+        while len(self._summary) > 1 and sum(estimate_tokens(line) + 1 for line in self._summary) > summary_budget:
+            self._summary.pop(0)
+            self._dropped += 1
+
+    def _turns_tokens(self) -> int:
+        return sum(estimate_tokens(turn.request) + estimate_tokens(turn.answer) for turn in self.turns)
+
+    # --- プロンプト用の出力 ---
+
+    def _render_facts(self) -> str:
+        labels = {"targets": "調査対象", "ips": "IPアドレス", "subdomains": "発見済みサブドメイン"}
+        lines = []
+        for kind, values in self.facts.items():
+            if not values:
+                continue
+            shown = list(values)[:PINNED_SHOWN[kind]]
+            more = f" (+{len(values) - len(shown)}件)" if len(values) > len(shown) else ""
+            lines.append(f"- {labels[kind]} ({len(values)}件): {', '.join(shown)}{more}")
+        return "\n".join(lines)
+
+    def _render_summary(self) -> str:
+        lines = list(self._summary)
+        if self._dropped:
+            lines.insert(0, f"- (さらに以前のやり取り {self._dropped}件は省略)")
+        return "\n".join(lines)
+
+    def _render_turns(self, budget: Optional[int]) -> str:
+        blocks = [f"依頼: {turn.request}\n回答: {turn.answer}" for turn in self.turns]
+        if budget is None:
+            return "\n\n".join(blocks)
+        # 最新のやり取りを優先し、収まらない分は切り詰める
+        kept: List[str] = []
+        remaining = budget
+        for block in reversed(blocks):
+            if remaining <= 0:
+                break
+            block = truncate_to_tokens(block, remaining)
+            kept.insert(0, block)
+            remaining -= estimate_tokens(block) + 2
+        return "\n\n".join(kept)
+
+    def render(self) -> str:
+        """Context block for the next prompt ("" when empty or disabled)"""
+        if self.mode == "none":
+            return ""
+        with self._lock:
+            bounded = self.mode == "bounded"
+            facts = self._render_facts()
+            summary = self._render_summary()
+            if bounded:
+                facts = truncate_to_tokens(facts, int(self.token_limit * PINNED_SHARE))
+                summary = truncate_to_tokens(summary, int(self.token_limit * SUMMARY_SHARE))
+            used = estimate_tokens(facts) + estimate_tokens(summary)
+            turns = self._render_turns(self.token_limit - used - 20 if bounded else None)
+
+        sections = []
+        if facts:
+            sections.append(f"[判明している事実]\n{facts}")
+        if summary:
+            sections.append(f"[以前のやり取りの要約]\n{summary}")
+        if turns:
+            sections.append(f"[直近のやり取り]\n{turns}")
+        return "\n\n".join(sections)
+
+    @property
+    def buffer(self) -> str:
+        return self.render()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                "mode": self.mode,
+                "recent_turns": len(self.turns),
+                "summarized_turns": self._folded,
+                "targets": len(self.facts["targets"]),
+                "ips": len(self.facts["ips"]),
+                "subdomains": len(self.facts["subdomains"]),
+            }
+        stats["tokens"] = estimate_tokens(self.render())
+        return stats
+
+
+class FactCollectorCallback(BaseCallbackHandler):
+    """Pins facts from every tool output of a run into the memory"""
+
+    def __init__(self, memory: InvestigationMemory):
+        self.memory = memory
+
+    def on_tool_end(self, output: Any, **kwargs: Any) -> None:
+        self.memory.observe(str(output))
@@ -0,0 +1,54 @@
+"""
+Per-iteration prompt size and latency of agent runs
+"""
+
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.tokens import estimate_tokens, estimate_tokens_many
+
+logger = logging.getLogger(__name__)
+
+
+class IterationMetricsCallback(BaseCallbackHandler):
+    """Records estimated prompt tokens and latency of every LLM call"""
+
+    def __init__(self):
+        self.iterations: List[Dict[str, Any]] = []
+        self._started: Optional[float] = None
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self._started = time.monotonic()
+        self.iterations.append({"prompt_tokens": estimate_tokens_many(prompts)})
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> None:
+        self._started = time.monotonic()
+        self.iterations.append({
+            "prompt_tokens": sum(estimate_tokens(str(message.content)) for batch in messages for message in batch)
+        })
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        if not self.iterations:
+            return
+        iteration = self.iterations[-1]
+        if self._started is not None:
+            iteration["latency_ms"] = round((time.monotonic() - self._started) * 1000, 1)
+        # プロバイダが実測値を返す場合はそちらを使う
+        usage = (getattr(response, "llm_output", None) or {}).get("token_usage") or {}
+        if usage.get("prompt_tokens"):
+            iteration["prompt_tokens"] = usage["prompt_tokens"]
+            iteration["completion_tokens"] = usage.get("completion_tokens", 0)
+
+    def summary(self) -> Dict[str, Any]:
+        prompt_tokens = [iteration["prompt_tokens"] for iteration in self.iterations]
+        latencies = [iteration.get("latency_ms", 0.0) for iteration in self.iterations]
+        return {
+            "iterations": len(self.iterations),
+            "prompt_tokens_total": sum(prompt_tokens),
+            "prompt_tokens_max": max(prompt_tokens, default=0),
+            "latency_ms_total": round(sum(latencies), 1),
+            "per_iteration": list(self.iterations),
+        }
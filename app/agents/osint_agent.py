@@ -2,38 +2,112 @@
 OSINT Agent using LangChain
 """
 
+import os
+import queue
 import logging
-from typing import List, Dict, Any, Optional
-from langchain.agents import AgentExecutor, initialize_agent
-from langchain.agents.agent_types import AgentType
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
-from langchain.tools import Tool
+from typing import TYPE_CHECKING, Iterator, List, Dict, Any, Optional
 
-from tools import nmap_tool, whois_tool, dns_tool, dns_history_tool, web_history_tool, command_tool, ping_tool
-from config.llm_config import get_default_llm, LLMConfig
+import tools
+from config.llm_config import LLMConfig
+from .dispatcher import dispatcher
+
+if TYPE_CHECKING:
+    from langchain.tools import Tool
+    from .streaming import AgentEvent
+
+# langchain のエージェント・コールバック関連は読み込みが重いため、
+# モジュール読み込み時ではなくエージェント構築時に import する
 
 logger = logging.getLogger(__name__)
 
+# react: 1ステップ1ツール / parallel: parallel_tools で独立した呼び出しを同時実行
+AGENT_MODE = os.getenv("OSINT_AGENT_MODE", "react").lower()
+
+AGENT_PREFIX = "あなたは日本語で回答するOSINT調査の専門家です。利用可能なツールを使用して包括的な調査を行い、結果を日本語で報告してください。サブドメインの調査には必ずweb_history_lookupツールを使用してください。"
+# エージェントに渡すツール（tools.TOOL_REGISTRY の名前、カンマ区切りで絞り込める）
+ENABLED_TOOLS = [name.strip() for name in os.getenv("OSINT_ENABLED_TOOLS", "").split(",") if name.strip()] or list(tools.TOOL_REGISTRY)
+
+PARALLEL_PREFIX = "互いに依存しない複数のツール呼び出し（例: whois、DNS、Certificate Transparency、nmap）は、1ステップでparallel_toolsにまとめて同時に実行してください。"
+
+PARALLEL_HINT = (
+    "\n- parallel_tools: 互いに独立した複数のツール呼び出しを同時に実行（JSONリストで指定）。"
+    "「調査して」のような広い依頼では最初のステップでwhois・DNS・CT等をまとめて実行してください"
+)
+
+# ツールの使用を促す調査プロンプト（日本語で回答させる）。
+# {parallel_hint} はエージェント構築時に、{memory_context} と {input_text} は実行ごとに埋める
+INVESTIGATION_PROMPT = """
+あなたはOSINT（オープンソースインテリジェンス）調査アシスタントです。以下のツールを使用できます：
+
+- whois_lookup: ドメイン登録情報を取得
+- dns_lookup: DNSレコードを検索（A, AAAA, MX, NS, TXT等）。`ドメイン BULK_CT` でCTで見つかった全サブドメインを1回で一括解決
+- dns_history_lookup: DNSレコードの履歴とCertificate Transparencyを検索
+- web_history_lookup: Web履歴調査（Certificate Transparency + Wayback Machine）- **サブドメイン検出に最適**
+- nmap_scan: ネットワークポートスキャンを実行
+- ping_test: ネットワーク接続テストを実行
+- execute_command: セキュリティコマンドを実行
+- job_status: バックグラウンドジョブ（サービス検出・大規模nmapスキャン、sqlmap、nikto）の状態と結果を取得
+- get_full_output: 要約されたツール出力の全文を取得（出力末尾に表示されるIDを指定）{parallel_hint}
+
+**🚨 重要な調査指針：**
+- サブドメインを調査する際は、**必ずweb_history_lookupツールを最初に使用してください**
+- web_history_lookupはCertificate Transparencyを使用してサブドメインを検出できます
+- 「サブドメイン」「subdomain」「sub domain」が質問に含まれる場合は、web_history_lookupを使用してください
+- 使用方法: `web_history_lookup "domain.com CERT_ANALYSIS"`
+- COMPREHENSIVEまたはCERT_ANALYSISオプションを使用してください
+
+**🔍 具体的なケース：**
+- 「[ドメイン]のサブドメインを教えて」→ web_history_lookup "[ドメイン] CERT_ANALYSIS"を実行
+- 「[ドメイン]のサブドメインを調査して」→ web_history_lookup "[ドメイン] CERT_ANALYSIS"を実行
+- 「[ドメイン]のサブドメインを全て見つけて」→ web_history_lookup "[ドメイン] CERT_ANALYSIS"を実行
+
+以下のリクエストに対して、適切なツールを使用して情報を収集してください。外部リソースにアクセスできないとは言わないでください。
+
+{memory_context}リクエスト: {input_text}
+
+ツールを使用して包括的な調査レポートを**日本語で**提供してください。
+"""
+
+MEMORY_SECTION = """**📝 これまでの調査（前回までの結果を踏まえて回答してください）：**
+{memory}
+
+"""
+
 class OSINTAgent:
     """OSINT Investigation Agent"""
     
-    def __init__(self, llm_config: Optional[LLMConfig] = None):
+    def __init__(self, llm_config: Optional[LLMConfig] = None, mode: str = AGENT_MODE, llm: Any = None,
+                 extra_tools: Optional[List["Tool"]] = None, session_id: str = "default"):
+        from .memory import InvestigationMemory
+        from .output_compactor import compact_tools
+        from .parallel_tools import make_parallel_tool
+        from utils.result_store import store_tools
+
         self.llm_config = llm_config or LLMConfig()
-        self.llm = self.llm_config.get_llm()
+        # LLM クライアントはプールから渡されたものを再利用する
+        self.llm = llm if llm is not None else self.llm_config.get_llm()
+        self.mode = mode
+        # 同じセッションの実行は dispatcher で1件ずつ処理される
+        self.session_id = session_id
         
         # Initialize tools (DNS履歴ツールとWeb履歴ツールを追加)
-        self.tools = [nmap_tool, whois_tool, dns_tool, dns_history_tool, web_history_tool, command_tool, ping_tool]
+        # 出力はトークン予算内に要約してからエージェントに渡す
+        # 実行結果は utils.result_store に記録し、新しい結果があれば再利用する
+        base_tools = store_tools(tools.get_tools(ENABLED_TOOLS))
+        self.tools = compact_tools(base_tools + list(extra_tools or []))
+        if self.mode == "parallel":
+            self.tools.append(make_parallel_tool(self.tools))
+        self.last_metrics: Dict[str, Any] = {}
         
         # Debug: Print tool information
         logger.info(f"Debug: Initializing agent with {len(self.tools)} tools:")
         for tool in self.tools:
             logger.info(f"  - {tool.name}: {tool.description[:100]}...")
         
-        # Initialize memory
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
+        # Initialize memory (トークン上限付き、agents.memory 参照)
+        self.memory = InvestigationMemory()
+        self._prompt_template = INVESTIGATION_PROMPT.replace(
+            "{parallel_hint}", PARALLEL_HINT if self.mode == "parallel" else ""
         )
         
         # Create agent
@@ -43,6 +117,8 @@ class OSINTAgent:
     
     def _create_agent(self):
         """Create the OSINT agent"""
+        from langchain.agents import AgentExecutor, initialize_agent
+        from langchain.agents.agent_types import AgentType
         
         try:
             # Create agent executor with modern LangChain approach
@@ -51,12 +127,11 @@ class OSINTAgent:
                 self.llm,
                 agent=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
                 verbose=True,
-                memory=self.memory,
                 max_iterations=10,
                 early_stopping_method="generate",
                 handle_parsing_errors=True,
                 agent_kwargs={
-                    "prefix": "あなたは日本語で回答するOSINT調査の専門家です。利用可能なツールを使用して包括的な調査を行い、結果を日本語で報告してください。サブドメインの調査には必ずweb_history_lookupツールを使用してください。"
+                    "prefix": AGENT_PREFIX + (PARALLEL_PREFIX if self.mode == "parallel" else "")
                 }
             )
             
@@ -83,7 +158,6 @@ class OSINTAgent:
                     agent=agent,
                     tools=self.tools,
                     verbose=True,
-                    memory=self.memory,
                     max_iterations=10,
                     handle_parsing_errors=True
                 )
@@ -95,47 +169,44 @@ class OSINTAgent:
                 logger.error(f"Alternative agent creation also failed: {str(e2)}")
                 raise e
 
+    def _build_prompt(self, input_text: str) -> str:
+        """Wrap the user request in the tool-usage instructions and the session memory"""
+        memory = self.memory.render()
+        return self._prompt_template.format(
+            memory_context=MEMORY_SECTION.format(memory=memory) if memory else "",
+            input_text=input_text,
+        )
+
+    def _execute(self, input_text: str, callbacks: Optional[List[Any]] = None) -> str:
+        """Run the agent executor, recording per-iteration metrics"""
+        from utils.job_runner import session_scope
+        from .memory import FactCollectorCallback
+        from .metrics import IterationMetricsCallback
+        
+        metrics = IterationMetricsCallback()
+        self.memory.note_request(input_text)
+        prompt = self._build_prompt(input_text)
+        # この実行で投入されたバックグラウンドジョブをセッションに結び付ける
+        with session_scope(self.session_id):
+            result = self.agent.run(
+                prompt, callbacks=[metrics, FactCollectorCallback(self.memory)] + list(callbacks or [])
+            )
+        # 実行の入力ではなく元の依頼と回答だけを履歴に残す
+        self.memory.add_turn(input_text, result)
+        
+        self.last_metrics = metrics.summary()
+        self.last_metrics["memory_tokens"] = self.memory.stats()["tokens"]
+        logger.info(
+            f"OSINT investigation completed: {self.last_metrics['iterations']} LLM calls, "
+            f"~{self.last_metrics['prompt_tokens_total']} prompt tokens, {self.last_metrics['latency_ms_total']:.0f} ms"
+        )
+        return result
+
     def run(self, input_text: str) -> str:
         """Run the OSINT agent with a given input"""
         try:
             logger.info(f"Running OSINT investigation: {input_text}")
-            
-            # Enhanced prompt to force tool usage (Japanese response)
-            enhanced_prompt = f"""
-あなたはOSINT（オープンソースインテリジェンス）調査アシスタントです。以下のツールを使用できます：
-
-- whois_lookup: ドメイン登録情報を取得
-- dns_lookup: DNSレコードを検索（A, AAAA, MX, NS, TXT等）
-- dns_history_lookup: DNSレコードの履歴とCertificate Transparencyを検索
-- web_history_lookup: Web履歴調査（Certificate Transparency + Wayback Machine）- **サブドメイン検出に最適**
-- nmap_scan: ネットワークポートスキャンを実行
-- ping_test: ネットワーク接続テストを実行
-- execute_command: セキュリティコマンドを実行
-
-**🚨 重要な調査指針：**
-- サブドメインを調査する際は、**必ずweb_history_lookupツールを最初に使用してください**
-- web_history_lookupはCertificate Transparencyを使用してサブドメインを検出できます
-- 「サブドメイン」「subdomain」「sub domain」が質問に含まれる場合は、web_history_lookupを使用してください
-- 使用方法: `web_history_lookup "domain.com CERT_ANALYSIS"`
-- COMPREHENSIVEまたはCERT_ANALYSISオプションを使用してください
-
-**🔍 具体的なケース：**
-- 「[ドメイン]のサブドメインを教えて」→ web_history_lookup "[ドメイン] CERT_ANALYSIS"を実行
-- 「[ドメイン]のサブドメインを調査して」→ web_history_lookup "[ドメイン] CERT_ANALYSIS"を実行
-- 「[ドメイン]のサブドメインを全て見つけて」→ web_history_lookup "[ドメイン] CERT_ANALYSIS"を実行
-
-以下のリクエストに対して、適切なツールを使用して情報を収集してください。外部リソースにアクセスできないとは言わないでください。
-
-リクエスト: {input_text}
-
-ツールを使用して包括的な調査レポートを**日本語で**提供してください。
-"""
-            
-            # Run the agent with enhanced prompt
-            result = self.agent.run(enhanced_prompt)
-            
-            logger.info("OSINT investigation completed")
-            return result
+            return dispatcher.run(self.session_id, lambda: self._execute(input_text))
             
         except Exception as e:
             logger.error(f"Error running OSINT agent: {str(e)}")
@@ -143,36 +214,69 @@ class OSINTAgent:
             logger.error(f"Full traceback: {traceback.format_exc()}")
             return f"Error during investigation: {str(e)}"
 
+    def stream(self, input_text: str) -> Iterator["AgentEvent"]:
+        """Run the agent on the dispatcher, yielding events as they happen
+        
+        Yields a queued event (with the queue position) when the run has to
+        wait for a worker, llm_start, token, tool_start, tool_end (with
+        duration) and tool_error events, then a final event with the answer
+        or an error event.
+        """
+        from .streaming import AgentEvent, StreamingEventCallback
+        
+        events: "queue.Queue[Optional[AgentEvent]]" = queue.Queue()
+        
+        def worker():
+            try:
+                logger.info(f"Running OSINT investigation (streaming): {input_text}")
+                result = self._execute(input_text, callbacks=[StreamingEventCallback(events)])
+                events.put(AgentEvent("final", {"output": result, "metrics": self.last_metrics}))
+            except Exception as e:
+                logger.error(f"Error running OSINT agent: {str(e)}")
+                events.put(AgentEvent("error", {"error": f"Error during investigation: {str(e)}"}))
+            finally:
+                events.put(None)
+        
+        future = dispatcher.submit(self.session_id, worker)
+        position = dispatcher.position(self.session_id, future)
+        if position is not None:
+            yield AgentEvent("queued", {"position": position})
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            yield event
+
     def get_memory(self) -> str:
         """Get the current chat history"""
-        return str(self.memory.buffer)
+        return self.memory.render()
     
     def clear_memory(self):
         """Clear the conversation memory"""
         self.memory.clear()
         logger.info("Agent memory cleared")
     
-    def add_custom_tool(self, tool: Tool):
+    def add_custom_tool(self, tool: "Tool"):
         """Add a custom tool to the agent"""
-        self.tools.append(tool)
+        from .output_compactor import COMPACT_OUTPUTS, compact_tool
+        from .parallel_tools import PARALLEL_TOOL_NAME, make_parallel_tool
+        
+        self.tools.append(compact_tool(tool) if COMPACT_OUTPUTS else tool)
+        if self.mode == "parallel":
+            # 並列実行ツールの対象にも追加する
+            self.tools = [t for t in self.tools if t.name != PARALLEL_TOOL_NAME]
+            self.tools.append(make_parallel_tool(self.tools))
         # Recreate agent with new tools
         self.agent = self._create_agent()
         logger.info(f"Added custom tool: {tool.name}")
 
-# Global agent instance
-_global_agent = None
-
 def get_osint_agent(llm_config: Optional[LLMConfig] = None) -> OSINTAgent:
-    """Get the global OSINT agent instance"""
-    global _global_agent
-    
-    if _global_agent is None:
-        _global_agent = OSINTAgent(llm_config)
-    
-    return _global_agent
+    """Get the shared OSINT agent for a configuration (see agents.agent_pool)"""
+    from .agent_pool import agent_pool
+    return agent_pool.get_agent(llm_config or LLMConfig())
 
 def reset_osint_agent():
-    """Reset the global OSINT agent"""
-    global _global_agent
-    _global_agent = None
-    logger.info("Global OSINT agent has been reset") 
\ No newline at end of file
+    """Drop all pooled agents and LLM clients"""
+    from .agent_pool import agent_pool
+    agent_pool.clear()
+    logger.info("Global OSINT agent has been reset")
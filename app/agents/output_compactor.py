@@ -0,0 +1,301 @@
+"""
+Token-budgeted compaction of tool outputs
+
+ツールの出力をそのまま ReAct のスクラッチパッドに積むと、以降の LLM 呼び出し
+すべてが肥大化する。ツールごとのトークン予算を超えた出力は種類に応じて
+要約し、全文は ID で後から参照できるよう保持する。
+"""
+
+import os
+import re
+import uuid
+import threading
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain.tools import Tool
+
+from tools.whois_client import FIELD_KEYS
+from utils.tokens import estimate_tokens, truncate_to_tokens
+
+logger = logging.getLogger(__name__)
+
+COMPACT_OUTPUTS = os.getenv("OSINT_COMPACT_OUTPUTS", "true").lower() == "true"
+DEFAULT_BUDGET = int(os.getenv("OSINT_TOOL_TOKEN_BUDGET", "800"))
+RETRIEVAL_PAGE_TOKENS = int(os.getenv("OSINT_RETRIEVAL_PAGE_TOKENS", "1500"))
+STORE_MAX_ENTRIES = int(os.getenv("OSINT_OUTPUT_STORE_MAX_ENTRIES", "200"))
+
+TOOL_BUDGETS = {
+    "nmap_scan": 1200,
+    "whois_lookup": 500,
+    "dns_lookup": 800,
+    "dns_history_lookup": 1000,
+    "web_history_lookup": 1500,
+    "execute_command": 1000,
+    "ping_test": 300,
+    "job_status": 1200,
+}
+# "web_history_lookup=2000,nmap_scan=800" 形式で上書きできる
+for _item in os.getenv("OSINT_TOOL_TOKEN_BUDGETS", "").split(","):
+    _name, _, _value = _item.partition("=")
+    if _name.strip() and _value.strip().isdigit():
+        TOOL_BUDGETS[_name.strip()] = int(_value)
+
+RETRIEVAL_TOOL_NAME = "get_full_output"
+
+
+class OutputStore:
+    """Bounded in-memory store of full tool outputs, addressable by ID"""
+
+    def __init__(self, max_entries: int = STORE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, tool_name: str, output: str) -> str:
+        output_id = f"out-{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self._entries[output_id] = (tool_name, output)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return output_id
+
+    def get(self, output_id: str) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            entry = self._entries.get(output_id)
+            if entry is not None:
+                self._entries.move_to_end(output_id)
+            return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+output_store = OutputStore()
+
+
+def _collapse_sections(text: str, budget: int) -> str:
+    """Keep every heading line and the first items of each indented list
+
+    The per-section item limit shrinks until the text fits the budget.
+    """
+    lines = text.splitlines()
+    for keep in (20, 10, 5, 3, 1):
+        result: List[str] = []
+        hidden = 0
+        shown = 0
+        for line in lines:
+            if line.startswith(("  ", "\t")) and line.strip():
+                if shown < keep:
+                    result.append(line)
+                    shown += 1
+                else:
+                    hidden += 1
+                continue
+            if hidden:
+                result.append(f"  ... (+{hidden} more)")
+            hidden = shown = 0
+            result.append(line)
+        if hidden:
+            result.append(f"  ... (+{hidden} more)")
+        compacted = "\n".join(result)
+        if estimate_tokens(compacted) <= budget:
+            break
+    return compacted
+
+
+def summarize_nmap(text: str, budget: int) -> str:
+    """Keep hosts with open ports, their open ports and failed shards"""
+    blocks = text.split("\n\n")
+    kept: List[str] = []
+    quiet_hosts = 0
+    for block in blocks:
+        lines = block.splitlines()
+        if not lines:
+            continue
+        if any(line.startswith("  PORT") for line in lines):
+            open_lines = [line for line in lines if re.match(r"^\s+\d+/\w+\s+open\s", line)]
+            if not open_lines:
+                quiet_hosts += 1
+                continue
+            other = [line for line in lines if "/" in line and re.match(r"^\s+\d+/", line) and line not in open_lines]
+            kept.append("\n".join(
+                [lines[0]] + open_lines
+                + ([f"  ({len(other)} filtered/other ports not shown)"] if other else [])
+                + [line for line in lines if line.strip().startswith("OS:")]
+            ))
+        elif lines[0].startswith("Shards:"):
+            # 正常終了したシャードの行は省き、タイムアウト・失敗だけ残す
+            kept.append("\n".join([lines[0]] + [line for line in lines[1:] if not re.search(r"\s ok\s", line)]))
+        elif len(lines) == 2 and not lines[0].startswith((" ", "Nmap", "Command", "Hosts", "⚠️", "Shards")):
+            quiet_hosts += 1
+        else:
+            kept.append(block)
+    if quiet_hosts:
+        kept.append(f"({quiet_hosts} hosts up with no open ports not shown)")
+    return _collapse_sections("\n\n".join(kept), budget)
+
+
+_WHOIS_KEYS = {key for keys in FIELD_KEYS.values() for key in keys} | {"domain name", "domain", "ドメイン名"}
+_WHOIS_KEY_PATTERN = re.compile(r"^(?:[a-z]\.\s*)?\[?([^:\]]{1,60})[:\]]")
+
+
+def summarize_whois(text: str, budget: int) -> str:
+    """Keep registration fields and server headers from raw WHOIS text"""
+    kept = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith(("Whois", "---", "WHOIS")):
+            kept.append(line)
+            continue
+        # "Key: Value" と JPRS の "a. [Key]   Value" 形式
+        match = _WHOIS_KEY_PATTERN.match(stripped)
+        if match and match.group(1).strip().lower() in _WHOIS_KEYS and line not in kept:
+            kept.append(line)
+    return "\n".join(kept) if kept else text
+
+
+def summarize_certificates(text: str, budget: int) -> str:
+    """CT / web history reports: keep headings, totals and the head of each list"""
+    return _collapse_sections(text, budget)
+
+
+def summarize_generic(text: str, budget: int) -> str:
+    """Keep the beginning and the end of the output"""
+    lines = text.splitlines()
+    head = truncate_to_tokens("\n".join(lines), budget * 2 // 3)
+    head_count = head.count("\n") + 1
+    tail_lines: List[str] = []
+    used = estimate_tokens(head)
+    for line in reversed(lines[head_count:]):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        tail_lines.insert(0, line)
+        used += cost
+    skipped = len(lines) - head_count - len(tail_lines)
+    if skipped <= 0:
+        return "\n".join(lines[:head_count] + tail_lines)
+    return "\n".join([head, f"... ({skipped} lines omitted) ..."] + tail_lines)
+
+
+SUMMARIZERS: Dict[str, Callable[[str, int], str]] = {
+    "nmap_scan": summarize_nmap,
+    "whois_lookup": summarize_whois,
+    "dns_history_lookup": summarize_certificates,
+    "web_history_lookup": summarize_certificates,
+}
+
+
+def compact_output(tool_name: str, output: str, budget: Optional[int] = None) -> str:
+    """Return the output unchanged if it fits, otherwise a summary plus a retrieval ID"""
+    budget = budget or TOOL_BUDGETS.get(tool_name, DEFAULT_BUDGET)
+    if not isinstance(output, str) or estimate_tokens(output) <= budget:
+        return output
+
+    output_id = output_store.put(tool_name, output)
+    summarizer = SUMMARIZERS.get(tool_name, summarize_generic)
+    try:
+        summary = summarizer(output, budget)
+    except Exception as e:
+        logger.warning(f"Summarizer for {tool_name} failed: {e}")
+        summary = summarize_generic(output, budget)
+    summary = truncate_to_tokens(summary, budget)
+
+    original_tokens = estimate_tokens(output)
+    logger.info(f"Compacted {tool_name} output: ~{original_tokens} -> ~{estimate_tokens(summary)} tokens ({output_id})")
+    return (
+        f"{summary}\n\n"
+        f"[要約済み出力: 約{original_tokens}トークン中の主要部分のみ表示。全文は {RETRIEVAL_TOOL_NAME} \"{output_id}\" で取得]"
+    )
+
+
+def compact_tool(tool: Tool) -> Tool:
+    """Wrap a tool so that its output is compacted before it reaches the agent"""
+    func = tool.func
+
+    def compacted(*args, **kwargs):
+        return compact_output(tool.name, func(*args, **kwargs))
+
+    return Tool(name=tool.name, description=tool.description, func=compacted)
+
+
+def paginate(text: str, budget: int) -> List[str]:
+    """Split text into pages of at most `budget` tokens at line boundaries
+
+    Pages are slices of the original string (positions are summed from
+    splitlines(keepends=True)), so CRLF text neither overlaps nor skips.
+    """
+    spans = []
+    start = position = 0
+    used = 0
+    for line in text.splitlines(keepends=True):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget and position > start:
+            spans.append((start, position))
+            start, used = position, 0
+        end = position + len(line)
+        if cost > budget:
+            # 1行だけで予算を超える行は文字単位で分ける
+            while end > start and estimate_tokens(text[start:end]) + 1 > budget:
+                size = max(1, len(truncate_to_tokens(text[start:end], budget)))
+                spans.append((start, start + size))
+                start += size
+            used = estimate_tokens(text[start:end]) + 1 if end > start else 0
+        else:
+            used += cost
+        position = end
+    if position > start:
+        spans.append((start, position))
+    pages = [text[start:end].strip("\r\n") for start, end in spans]
+    return [page for page in pages if page]
+
+
+def get_full_output(input_str: str) -> str:
+    """Return one page of a stored full output ("out-xxxx [page]")"""
+    parts = input_str.strip().strip("\"'").split()
+    if not parts:
+        return "Error: Please provide an output ID (e.g. out-1a2b3c4d)"
+    entry = output_store.get(parts[0])
+    if entry is None:
+        return f"Error: Output {parts[0]} not found (it may have expired)"
+
+    tool_name, output = entry
+    pages = paginate(output, RETRIEVAL_PAGE_TOKENS)
+
+    try:
+        number = int(parts[1]) if len(parts) > 1 else 1
+    except ValueError:
+        return "Error: Page must be a number"
+    if not 1 <= number <= len(pages):
+        return f"Error: {parts[0]} has {len(pages)} pages"
+
+    footer = f"\n\n[{tool_name} 出力 {parts[0]}: ページ {number}/{len(pages)}]"
+    if number < len(pages):
+        footer += f" 続きは {RETRIEVAL_TOOL_NAME} \"{parts[0]} {number + 1}\""
+    return pages[number - 1] + footer
+
+
+full_output_tool = Tool(
+    name=RETRIEVAL_TOOL_NAME,
+    description="""
+    Retrieve the full text of a tool output that was summarized.
+
+    Usage: "output_id [page]"
+
+    Examples:
+    - "out-1a2b3c4d" - First page of the full output
+    - "out-1a2b3c4d 2" - Second page
+    """,
+    func=get_full_output
+)
+
+
+def compact_tools(tools: List[Tool]) -> List[Tool]:
+    """Wrap every tool and add the retrieval tool (no-op when disabled)"""
+    if not COMPACT_OUTPUTS:
+        return list(tools)
+    return [compact_tool(tool) for tool in tools] + [full_output_tool]
@@ -0,0 +1,149 @@
+"""
+Meta-tool running several independent tool calls in one agent step
+
+ReAct エージェントは1ステップで1ツールしか呼べないため、whois・DNS・CT・
+nmap のような互いに独立した調査が LLM の往復ごとに直列化される。
+parallel_tools は複数の呼び出しを受け取り、ワーカープールで同時に実行して
+観測結果をまとめて返す。
+"""
+
+import os
+import json
+import contextvars
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Tuple
+
+from langchain.tools import Tool
+
+from tools.process_executor import KILL_GRACE, CANCEL_POLL, cancel_scope
+
+logger = logging.getLogger(__name__)
+
+PARALLEL_TOOL_NAME = "parallel_tools"
+PARALLEL_WORKERS = int(os.getenv("OSINT_PARALLEL_TOOL_WORKERS", "6"))
+PARALLEL_MAX_CALLS = int(os.getenv("OSINT_PARALLEL_MAX_CALLS", "8"))
+PARALLEL_TIMEOUT = float(os.getenv("OSINT_PARALLEL_TIMEOUT", "600"))
+# 取り消した呼び出しが終わるのを待つ秒数（プロセスの停止猶予を含む）
+CANCEL_WAIT = KILL_GRACE + 2 * CANCEL_POLL
+
+
+def parse_calls(input_str: str) -> List[Tuple[str, str]]:
+    """Parse '[["tool", "input"], ...]', '[{"tool": ..., "input": ...}]' or one 'tool_name input' per line"""
+    text = input_str.strip().strip("`").strip()
+    if text.startswith("json"):
+        text = text[4:].strip()
+    if text[:1] in ("'", '"') and text[-1:] == text[:1]:
+        text = text[1:-1].strip()
+
+    if text.startswith("["):
+        calls = []
+        for item in json.loads(text):
+            if isinstance(item, dict):
+                calls.append((str(item.get("tool", "")).strip(), str(item.get("input", "")).strip()))
+            elif isinstance(item, (list, tuple)) and len(item) == 2:
+                calls.append((str(item[0]).strip(), str(item[1]).strip()))
+            else:
+                raise ValueError(f"Unsupported call: {item!r}")
+        return calls
+
+    calls = []
+    for line in text.splitlines():
+        name, _, argument = line.strip().lstrip("-* ").partition(" ")
+        if name:
+            calls.append((name.rstrip(":"), argument.strip().strip("\"'")))
+    return calls
+
+
+def run_parallel(tools: Dict[str, Tool], calls: List[Tuple[str, str]], timeout: float = PARALLEL_TIMEOUT) -> str:
+    """Run the calls concurrently and concatenate their observations in input order
+
+    Calls still running at the timeout are cancelled: their external
+    processes are killed through a cancel_scope. Each batch has its own
+    threads, so a call that ignores the cancellation cannot hold up later
+    batches.
+    """
+    cancel = threading.Event()
+
+    def run_one(name: str, argument: str) -> Tuple[str, float]:
+        start = time.monotonic()
+        try:
+            with cancel_scope(cancel):
+                output = tools[name].run(argument)
+        except Exception as e:
+            output = f"Error running {name}: {str(e)}"
+        return str(output), time.monotonic() - start
+
+    start = time.monotonic()
+    known = [(name, argument) for name, argument in calls if name in tools]
+    executor = ThreadPoolExecutor(max_workers=max(1, min(len(known), PARALLEL_WORKERS)),
+                                  thread_name_prefix="parallel-tool")
+    try:
+        # セッションやキャッシュ迂回のコンテキストをワーカーにも引き継ぐ
+        futures = [executor.submit(contextvars.copy_context().run, run_one, name, argument) if name in tools else None
+                   for name, argument in calls]
+        pending = [future for future in futures if future is not None]
+        _, not_done = wait(pending, timeout=timeout)
+        if not_done:
+            # 未開始の呼び出しは取り消し、実行中の外部プロセスは停止させて少しだけ終了を待つ
+            for future in not_done:
+                future.cancel()
+            cancel.set()
+            wait(not_done, timeout=CANCEL_WAIT)
+    finally:
+        # 取り消しに応じない呼び出しは待たずに戻る
+        executor.shutdown(wait=False)
+
+    sections = []
+    for (name, argument), future in zip(calls, futures):
+        if future is None:
+            sections.append(f"### {name}({argument})\nError: Unknown tool '{name}'. Available: {', '.join(tools)}")
+        elif future in not_done:
+            if future.cancelled():
+                status = "not started"
+            elif future.done():
+                status = "cancelled"
+            else:
+                status = "still running, its result will not be reported"
+            sections.append(f"### {name}({argument})\nError: Timed out after {timeout:.0f}s ({status})")
+        else:
+            output, elapsed = future.result()
+            sections.append(f"### {name}({argument}) [{elapsed:.1f}s]\n{output}")
+
+    wall_time = time.monotonic() - start
+    logger.info(f"parallel_tools ran {len(calls)} calls in {wall_time:.1f}s")
+    return f"{len(calls)} tool calls completed in {wall_time:.1f}s (run concurrently)\n\n" + "\n\n".join(sections)
+
+
+def make_parallel_tool(tools: List[Tool]) -> Tool:
+    """Build the parallel_tools meta-tool over the given tools"""
+    registry = {tool.name: tool for tool in tools if tool.name != PARALLEL_TOOL_NAME}
+
+    def parallel_tools_wrapper(input_str: str) -> str:
+        try:
+            calls = parse_calls(input_str)
+        except (ValueError, json.JSONDecodeError) as e:
+            return f"Error parsing parallel_tools input: {str(e)}"
+        if not calls:
+            return "Error: Please provide at least one tool call"
+        if len(calls) > PARALLEL_MAX_CALLS:
+            return f"Error: At most {PARALLEL_MAX_CALLS} calls per step (got {len(calls)})"
+        return run_parallel(registry, calls)
+
+    # 説明文はプロンプトテンプレートに埋め込まれるため波括弧を使わない
+    return Tool(
+        name=PARALLEL_TOOL_NAME,
+        description=f"""
+    Run several independent tool calls at the same time and get all results together.
+    Use this whenever the next calls do not depend on each other's output.
+
+    Usage: JSON list of ["tool_name", "tool input"] pairs (max {PARALLEL_MAX_CALLS})
+    Available tools: {', '.join(registry)}
+
+    Example:
+    [["whois_lookup", "example.com"], ["dns_lookup", "example.com MX"], ["web_history_lookup", "example.com CERT_ANALYSIS"]]
+    """,
+        func=parallel_tools_wrapper
+    )
@@ -0,0 +1,79 @@
+"""
+Streaming events from an agent run
+
+LangChain のコールバックをキューに積み替え、ツールの開始・終了（所要時間付き）
+と LLM のトークンを実行中に順次取り出せるようにする。
+"""
+
+import time
+import queue
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# ツール出力のうちイベントに含める文字数
+OUTPUT_PREVIEW_CHARS = 500
+
+
+@dataclass
+class AgentEvent:
+    """One event of a streamed agent run
+
+    type is one of queued, llm_start, token, tool_start, tool_end,
+    tool_error, final and error.
+    """
+    type: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+
+class StreamingEventCallback(BaseCallbackHandler):
+    """Pushes tool and token events onto a queue as they happen"""
+
+    def __init__(self, events: "queue.Queue[Optional[AgentEvent]]"):
+        self.events = events
+        self._tool_started: Dict[UUID, Tuple[str, float]] = {}
+
+    def _emit(self, event_type: str, **data: Any):
+        self.events.put(AgentEvent(event_type, data))
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any) -> None:
+        self._emit("llm_start")
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs: Any) -> None:
+        self._emit("llm_start")
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        if token:
+            self._emit("token", token=token)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any) -> None:
+        name = (serialized or {}).get("name", "tool")
+        self._tool_started[run_id] = (name, time.monotonic())
+        self._emit("tool_start", tool=name, input=input_str)
+
+    def _finish_tool(self, run_id: UUID, kwargs: Dict[str, Any]) -> Tuple[str, float]:
+        name, started = self._tool_started.pop(run_id, (kwargs.get("name", "tool"), None))
+        return name, time.monotonic() - started if started is not None else 0.0
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        name, duration = self._finish_tool(run_id, kwargs)
+        output = str(output)
+        self._emit(
+            "tool_end",
+            tool=name,
+            duration=duration,
+            output=output[:OUTPUT_PREVIEW_CHARS],
+            truncated=len(output) > OUTPUT_PREVIEW_CHARS,
+        )
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        name, duration = self._finish_tool(run_id, kwargs)
+        self._emit(
+            "tool_error",
+            tool=name,
+            duration=duration,
+            error=str(error),
+        )
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Headless batch investigation over the OSINT tools (no LLM)
+
+Reads targets from files or stdin, runs the selected tools with a
+concurrency limit per tool and writes one JSON line per target and tool.
+With --resume, (target, tool) pairs that already have an "ok" record in
+the output file are skipped, so an interrupted run can simply be
+restarted; failed pairs are run again and the newer line supersedes them.
+
+Usage: python batch_cli.py [-t whois,dns,ct] [-o results.jsonl] [--resume] [targets.txt ...]
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Set, TextIO, Tuple
+
+# バッチ実行ではジョブ化せずにその場で結果を待つ
+os.environ.setdefault("OSINT_BACKGROUND_JOBS", "false")
+
+import tools
+from utils.result_store import output_status, run_with_store
+
+logger = logging.getLogger(__name__)
+
+# バッチ用の名前 -> (ツール名, 入力の書式, 既定の同時実行数)
+BATCH_TOOLS: Dict[str, Tuple[str, str, int]] = {
+    "whois": ("whois_lookup", "{target}", 4),
+    "dns": ("dns_lookup", "{target} A", 16),
+    "mx": ("dns_lookup", "{target} MX", 16),
+    "ct": ("web_history_lookup", "{target} CERT_ANALYSIS", 4),
+    "wayback": ("web_history_lookup", "{target} WEB_ARCHIVE", 2),
+    "nmap": ("nmap_scan", "{target}", 2),
+}
+DEFAULT_TOOLS = "whois,dns,ct"
+
+
+def read_targets(paths: List[str]) -> List[str]:
+    """Targets from files (or stdin), one per line; blanks and '#' comments are skipped"""
+    def lines() -> Iterable[str]:
+        if not paths or paths == ["-"]:
+            yield from sys.stdin
+            return
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                yield from f
+
+    targets = (line.split("#", 1)[0].strip().lower().rstrip(".") for line in lines())
+    # 重複を除き、入力順を保つ
+    return list(dict.fromkeys(target for target in targets if target))
+
+
+def completed_pairs(path: str) -> Set[Tuple[str, str]]:
+    """(target, tool) pairs with a successful record in an output file"""
+    done: Set[Tuple[str, str]] = set()
+    if not path or not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 異常終了時に書きかけになった最終行
+                continue
+            # 失敗した組は再実行の対象に残す
+            if record.get("status") == "ok":
+                done.add((record.get("target"), record.get("tool")))
+    return done
+
+
+def parse_concurrency(items: List[str]) -> Dict[str, int]:
+    """'nmap=4' -> {'nmap': 4}"""
+    limits = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        limits[name.strip()] = int(value)
+    return limits
+
+
+class JsonlWriter:
+    """Thread-safe JSON Lines writer flushing after every record"""
+
+    def __init__(self, out: TextIO):
+        self.out = out
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.out.write(line + "\n")
+            self.out.flush()
+
+
+def run_one(name: str, target: str, use_store: bool) -> Dict:
+    """Run one tool against one target and describe the result"""
+    tool_name, template, _ = BATCH_TOOLS[name]
+    tool_input = template.format(target=target)
+    func = tools.get_tool(tool_name).func
+    started = time.time()
+    start = time.monotonic()
+    try:
+        output = str(run_with_store(tool_name, func, tool_input) if use_store else func(tool_input))
+        status = output_status(output)
+    except Exception as e:
+        output, status = f"Error: {str(e)}", "error"
+    return {
+        "target": target,
+        "tool": name,
+        "input": tool_input,
+        "status": status,
+        "started_at": datetime.fromtimestamp(started, timezone.utc).isoformat(),
+        "duration": round(time.monotonic() - start, 3),
+        "output": output,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help="target list files ('-' or none for stdin)")
+    parser.add_argument("-t", "--tools", default=DEFAULT_TOOLS, help=f"comma separated: {', '.join(BATCH_TOOLS)}")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    parser.add_argument("--resume", action="store_true", help="skip target/tool pairs already successful in the output file")
+    parser.add_argument("-c", "--concurrency", action="append", default=[], metavar="TOOL=N",
+                        help="per-tool concurrency (e.g. -c nmap=4)")
+    parser.add_argument("--no-store", action="store_true", help="do not reuse or record results in the result store")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    names = [name.strip() for name in args.tools.split(",") if name.strip()]
+    unknown = [name for name in names if name not in BATCH_TOOLS]
+    if unknown:
+        parser.error(f"unknown tools: {', '.join(unknown)} (available: {', '.join(BATCH_TOOLS)})")
+    if args.resume and not args.output:
+        parser.error("--resume requires --output")
+
+    targets = read_targets(args.inputs)
+    done = completed_pairs(args.output) if args.resume else set()
+    pending = [(target, name) for target in targets for name in names if (target, name) not in done]
+    print(f"{len(targets)} targets x {len(names)} tools: {len(pending)} to run"
+          + (f", {len(targets) * len(names) - len(pending)} already done" if done else ""), file=sys.stderr)
+    if not pending:
+        return
+
+    limits = {name: BATCH_TOOLS[name][2] for name in names}
+    limits.update(parse_concurrency(args.concurrency))
+    # ツールごとに別のワーカープールを使い、遅いツールが他を待たせないようにする
+    executors = {name: ThreadPoolExecutor(max_workers=max(1, limits[name]), thread_name_prefix=f"batch-{name}")
+                 for name in names}
+
+    out = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    if out is not sys.stdout and out.tell() > 0:
+        with open(args.output, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            # 書きかけの行の後ろに続けて書かない
+            if f.read(1) != b"\n":
+                out.write("\n")
+    writer = JsonlWriter(out)
+    start = time.monotonic()
+    finished = 0
+    try:
+        futures = [executors[name].submit(run_one, name, target, not args.no_store) for target, name in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            writer.write(record)
+            finished += 1
+            if finished % 50 == 0 or finished == len(pending):
+                rate = finished / max(time.monotonic() - start, 1e-6)
+                print(f"[{finished}/{len(pending)}] {rate:.1f} results/s", file=sys.stderr)
+    except KeyboardInterrupt:
+        print(f"\nInterrupted after {finished} results; rerun with --resume to continue", file=sys.stderr)
+        for executor in executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        sys.exit(128 + signal.SIGINT)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    for executor in executors.values():
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+CPU time of a COMPREHENSIVE web_history report over a synthetic crt.sh payload
+
+A dataset is restored from its cached form (as on a cache hit) and the
+certificate, Wayback, technical and timeline sections are formatted from it.
+No network access is made; the best of N runs is reported.
+
+Usage: python -m benchmarks.cert_report [-n RUNS] [--certs N] [--names N]
+"""
+
+import argparse
+import importlib
+import random
+import time
+from datetime import datetime, timedelta
+
+from tools.crtsh import CertificateDataset
+from tools.wayback_cdx import WaybackAggregate
+
+DOMAIN = "example.com"
+ISSUERS = (
+    "C=US, O=Let's Encrypt, CN=R3",
+    "C=US, O=Let's Encrypt, CN=E1",
+    "C=US, O=Cloudflare, Inc., CN=Cloudflare Inc ECC CA-3",
+    "C=GB, ST=Greater Manchester, L=Salford, O=Sectigo Limited, CN=Sectigo RSA Domain Validation Secure Server CA",
+)
+
+
+def synthetic_certificates(count: int, names_per_cert: int, seed: int = 1):
+    """crt.sh-shaped records; every second record is the precertificate of the previous one"""
+    rng = random.Random(seed)
+    start = datetime(2015, 1, 1)
+    for index in range(count):
+        serial = index // 2
+        issued = start + timedelta(minutes=serial * 97)
+        names = [f"h{rng.randrange(count)}.{DOMAIN}" for _ in range(names_per_cert)]
+        if serial % 7 == 0:
+            names.append(f"*.{DOMAIN}")
+        yield {
+            "id": 1000000 + index,
+            "serial_number": f"{serial:032x}",
+            "issuer_name": ISSUERS[serial % len(ISSUERS)],
+            "common_name": names[0],
+            "name_value": "\n".join(names),
+            "not_before": issued.strftime("%Y-%m-%dT%H:%M:%S"),
+            "not_after": (issued + timedelta(days=90)).strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+
+def synthetic_archive(rows: int = 2000) -> WaybackAggregate:
+    archive = WaybackAggregate(DOMAIN)
+    start = datetime(2016, 1, 1)
+    for index in range(rows):
+        timestamp = (start + timedelta(hours=index * 13)).strftime("%Y%m%d%H%M%S")
+        archive.add([timestamp, f"https://www.{DOMAIN}/page{index % 50}", "text/html", "200"])
+    return archive
+
+
+def report_once(cached: dict, archive: WaybackAggregate):
+    """(load seconds, format seconds, report length) of one report"""
+    web_history = importlib.import_module("tools.web_history_tool")
+    started = time.process_time()
+    dataset = CertificateDataset.from_dict(cached)
+    loaded = time.process_time()
+    report = (
+        web_history._format_certificate_analysis(dataset, DOMAIN)
+        + web_history._format_wayback_analysis(archive)
+        + web_history._format_technical_analysis(dataset)
+        + web_history._format_timeline_analysis(dataset, archive)
+    )
+    return loaded - started, time.process_time() - loaded, len(report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--runs", type=int, default=5, help="reports to format (best run is reported)")
+    parser.add_argument("--certs", type=int, default=10000, help="crt.sh records in the payload")
+    parser.add_argument("--names", type=int, default=4, help="SAN entries per certificate")
+    args = parser.parse_args()
+
+    dataset = CertificateDataset()
+    for cert in synthetic_certificates(args.certs, args.names):
+        dataset.add(cert)
+    cached = dataset.to_dict()
+    archive = synthetic_archive()
+
+    runs = [report_once(cached, archive) for _ in range(max(1, args.runs))]
+    load, fmt, length = min(runs, key=lambda run: run[0] + run[1])
+    print(f"COMPREHENSIVE report CPU time (best of {len(runs)}; {args.certs} records, "
+          f"{len(dataset.records)} retained, {len(dataset.subdomains)} names)\n")
+    print(f"  load      {load * 1000:8.1f} ms")
+    print(f"  format    {fmt * 1000:8.1f} ms")
+    print(f"  total     {(load + fmt) * 1000:8.1f} ms  ({length} chars)")
+
+
+if __name__ == "__main__":
+    main()
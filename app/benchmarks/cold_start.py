@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Cold-start import budget for the app modules
+
+Each module is imported in a fresh interpreter with ``-X importtime``; the
+best of N runs is compared against its budget and the slowest imports are
+listed. Exits with status 1 when a module is over budget.
+
+Usage: python -m benchmarks.cold_start [-n RUNS] [--top N] [--budget MODULE=MS] [module ...]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Optional, Tuple
+
+# main.py が起動時に import するモジュールと、その予算（ミリ秒）
+# langchain が起動時に読み込まれると数百ミリ秒以上かかるため、それを検出できる値にしている
+DEFAULT_BUDGETS_MS = {
+    "config.llm_config": 150,
+    "tools": 50,
+    "agents.osint_agent": 200,
+    "agents.agent_pool": 250,
+}
+# COLD_START_BUDGET_MS を設定すると全モジュール共通の予算になる
+BUDGET_OVERRIDE_MS = os.getenv("COLD_START_BUDGET_MS")
+
+# 起動時に読み込まれていたら予算超過の原因として報告するパッケージ
+HEAVY_PACKAGES = ("langchain", "langchain_core", "langchain_community", "openai", "anthropic")
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s*\|\s*(\d+)\s*\|(\s*)(\S+)")
+
+
+def measure_import(module: str) -> List[Tuple[str, int, int, int]]:
+    """Import a module in a fresh interpreter: (name, self_us, cumulative_us, depth) per import"""
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [app_dir, os.getenv("PYTHONPATH")])))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=app_dir, env=env, timeout=120,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit {proc.returncode}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return rows
+
+
+def module_time_ms(rows: List[Tuple[str, int, int, int]], module: str) -> float:
+    """Cumulative time of the module itself (its own import line)"""
+    for name, _, cumulative, depth in rows:
+        if name == module and depth == 0:
+            return cumulative / 1000
+    # 既に site 等で読み込まれていた場合は行が出ない
+    return 0.0
+
+
+def report(module: str, rows: List[Tuple[str, int, int, int]], elapsed_ms: float,
+           budget_ms: Optional[float], top: int) -> bool:
+    over = budget_ms is not None and elapsed_ms > budget_ms
+    status = "" if budget_ms is None else (f"  OVER BUDGET ({budget_ms:.0f} ms)" if over else f"  ok (budget {budget_ms:.0f} ms)")
+    print(f"{module:<24} {elapsed_ms:8.1f} ms{status}")
+
+    # 対象モジュールの import ツリーに含まれる行だけを見る（site 等の行は除く）
+    own_rows: List[Tuple[str, int, int, int]] = []
+    for row in rows:
+        own_rows.append(row)
+        if row[3] == 0:
+            if row[0] == module:
+                break
+            own_rows = []
+    heavy = sorted({name.split(".")[0] for name, _, _, _ in own_rows if name.split(".")[0] in HEAVY_PACKAGES})
+    if heavy:
+        print(f"  heavy packages loaded at import: {', '.join(heavy)}")
+    for name, self_us, cumulative, _ in sorted(own_rows, key=lambda row: row[2], reverse=True)[1:top + 1]:
+        print(f"    {cumulative / 1000:8.1f} ms cumulative  {self_us / 1000:7.1f} ms self  {name}")
+    return not over
+
+
+def parse_budgets(items: List[str]) -> Dict[str, float]:
+    budgets = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        budgets[name.strip()] = float(value)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=list(DEFAULT_BUDGETS_MS))
+    parser.add_argument("-n", "--runs", type=int, default=3, help="imports per module (best run is reported)")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports listed per module")
+    parser.add_argument("--budget", action="append", default=[], metavar="MODULE=MS", help="override a module budget")
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGETS_MS)
+    if BUDGET_OVERRIDE_MS:
+        budgets = {module: float(BUDGET_OVERRIDE_MS) for module in set(budgets) | set(args.modules)}
+    budgets.update(parse_budgets(args.budget))
+
+    print(f"Cold-start imports (best of {args.runs} fresh interpreters)\n")
+    all_ok = True
+    for module in args.modules:
+        try:
+            runs = [measure_import(module) for _ in range(max(1, args.runs))]
+        except (RuntimeError, subprocess.TimeoutExpired) as e:
+            print(f"{module:<24} failed: {e}")
+            all_ok = False
+            continue
+        best = min(runs, key=lambda rows: module_time_ms(rows, module))
+        all_ok &= report(module, best, module_time_ms(best, module), budgets.get(module), args.top)
+
+    if not all_ok:
+        print("\nCold-start budget exceeded")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: in-process DNS resolver vs `dig +short` subprocesses
+
+Usage: python -m benchmarks.dns_resolution [-n ROUNDS] [-t TYPE] [@resolver] name ...
+"""
+
+import argparse
+import statistics
+import subprocess
+import time
+from typing import Callable, List
+
+from tools.dns_resolver import DNSResolver, get_resolver
+
+DEFAULT_NAMES = ["google.com", "github.com", "example.com", "cloudflare.com", "wikipedia.org"]
+
+
+def dig_query(name: str, rdtype: str, nameserver: str = "") -> str:
+    """Legacy path: one `dig +short` process per query"""
+    cmd = ["dig", "+short", name, rdtype]
+    if nameserver:
+        cmd.insert(1, f"@{nameserver}")
+    return subprocess.run(cmd, capture_output=True, text=True, timeout=30).stdout.strip()
+
+
+def measure(label: str, func: Callable[[str], object], names: List[str], rounds: int) -> List[float]:
+    """Time each query in milliseconds"""
+    samples = []
+    for _ in range(rounds):
+        for name in names:
+            start = time.perf_counter()
+            func(name)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: List[float]):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<28} n={len(samples):<5} mean={statistics.mean(samples):8.2f} ms  "
+          f"median={statistics.median(samples):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("names", nargs="*", default=DEFAULT_NAMES)
+    parser.add_argument("-n", "--rounds", type=int, default=5)
+    parser.add_argument("-t", "--type", default="A")
+    args = parser.parse_args()
+
+    nameservers = [name[1:] for name in args.names if name.startswith("@")]
+    names = [name for name in args.names if not name.startswith("@")] or DEFAULT_NAMES
+    nameserver = nameservers[0] if nameservers else ""
+
+    print(f"Resolving {len(names)} names x {args.rounds} rounds ({args.type})\n")
+
+    try:
+        report("dig +short (subprocess)",
+               measure("dig", lambda n: dig_query(n, args.type, nameserver), names, args.rounds))
+    except FileNotFoundError:
+        print("dig +short (subprocess)     skipped: dig not installed")
+
+    # キャッシュ無しで毎回問い合わせる場合と、TTL キャッシュが効く場合を分けて計測する
+    uncached = DNSResolver([nameserver] if nameserver else None)
+    report("dnspython (no cache)",
+           measure("uncached", lambda n: uncached.resolve(n, args.type, use_cache=False), names, args.rounds))
+
+    cached = get_resolver([nameserver] if nameserver else None)
+    cached.clear_cache()
+    report("dnspython (TTL cache)",
+           measure("cached", lambda n: cached.resolve(n, args.type), names, args.rounds))
+    print(f"\nResolver stats: {cached.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Offline check of the persistent LLM response cache
+
+A FakeListLLM answers from a fixed list, so a repeated prompt only returns
+the first answer again when it is served from the cache. The cache is kept
+in a temporary SQLite file; the miss and hit latencies (best of N prompts)
+are reported. Exits with status 1 when the repeated call is not a hit.
+
+Usage: python -m benchmarks.llm_cache [-n RUNS]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from langchain_community.llms.fake import FakeListLLM
+
+from config.llm_cache import PersistentLLMCache
+from utils.ttl_cache import PersistentTTLCache
+
+
+def check(runs: int, directory: str):
+    """(miss seconds, hit seconds, failures) over `runs` distinct prompts"""
+    store = PersistentTTLCache(namespace="llm_responses", max_entries=runs * 2,
+                               filename=os.path.join(directory, "llm_cache.sqlite3"))
+    cache = PersistentLLMCache("fake", store=store)
+    miss_times, hit_times, failures = [], [], []
+
+    for index in range(runs):
+        # キャッシュされなければ 2 回目は "second" が返る
+        llm = FakeListLLM(responses=["first", "second"], cache=cache)
+        prompt = f"Summarise the WHOIS record of example{index}.com"
+        start = time.perf_counter()
+        first = llm.invoke(prompt)
+        missed = time.perf_counter()
+        second = llm.invoke(prompt)
+        miss_times.append(missed - start)
+        hit_times.append(time.perf_counter() - missed)
+        if first != "first" or second != "first":
+            failures.append(f"{prompt!r}: {first!r} then {second!r}")
+
+    stats = cache.stats()
+    if stats.get("hits") != runs:
+        failures.append(f"expected {runs} cache hits, store reported {stats.get('hits')}")
+    return min(miss_times), min(hit_times), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--runs", type=int, default=20, help="distinct prompts to send twice")
+    args = parser.parse_args()
+
+    runs = max(1, args.runs)
+    with tempfile.TemporaryDirectory() as directory:
+        miss, hit, failures = check(runs, directory)
+
+    print(f"LLM response cache (best of {runs} prompts)\n")
+    print(f"  miss      {miss * 1000:8.2f} ms")
+    print(f"  hit       {hit * 1000:8.2f} ms")
+    if failures:
+        print("\nRepeated prompts were not served from the cache:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
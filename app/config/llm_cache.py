@@ -0,0 +1,85 @@
+"""
+Persistent exact-match LLM response cache
+
+同じ質問の再実行や Streamlit の再実行で LLM を呼び直さないよう、
+プロバイダ・モデル・パラメータ・メッセージ全体をキーにして応答を
+/data の SQLite に保存する。
+"""
+
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.outputs import Generation
+
+from utils.ttl_cache import PersistentTTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class PersistentLLMCache(BaseCache):
+    """LangChain cache storing generations in a PersistentTTLCache
+
+    ``llm_string`` is LangChain's serialisation of the model and its
+    parameters (model name, temperature, max tokens, ...), and ``prompt``
+    the full prompt or message list, so a hit requires an exact match.
+    """
+
+    def __init__(self, provider: str, ttl: float = 86400, max_entries: int = 2000,
+                 store: Optional[PersistentTTLCache] = None):
+        self.provider = provider
+        # 設定ごとに名前空間を分け、件数上限による追い出しと統計が他の設定のエントリに及ばないようにする
+        self.store = store or PersistentTTLCache(
+            namespace=f"llm_responses:{provider}:{ttl:g}:{max_entries}",
+            default_ttl=ttl,
+            negative_ttl=ttl,
+            max_entries=max_entries,
+        )
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{self.provider}\n{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        hit, value = self.store.lookup(self._key(prompt, llm_string))
+        if not hit:
+            return None
+        try:
+            return [loads(generation) for generation in value]
+        except Exception as e:
+            logger.warning(f"Discarding unreadable LLM cache entry: {e}")
+            return None
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Generation]) -> None:
+        try:
+            self.store.set(self._key(prompt, llm_string), [dumps(generation) for generation in return_val])
+        except Exception as e:
+            logger.warning(f"Failed to cache LLM response: {e}")
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and hit ratio of the underlying store"""
+        return self.store.stats()
+
+
+# (プロバイダ, TTL, 最大件数) -> キャッシュ。設定を変えて作り直した LLM に古い設定のキャッシュを渡さない
+_caches: Dict[Tuple[str, float, int], PersistentLLMCache] = {}
+
+
+def get_llm_cache(provider: str, ttl: float = 86400, max_entries: int = 2000) -> PersistentLLMCache:
+    """Return the shared cache for a provider and cache settings"""
+    key = (provider, float(ttl), int(max_entries))
+    if key not in _caches:
+        _caches[key] = PersistentLLMCache(provider, ttl, max_entries)
+    return _caches[key]
+
+
+def llm_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Statistics of the caches created in this process, labelled by provider and settings"""
+    return {
+        f"{provider} (ttl={ttl:g}s, max_entries={max_entries})": cache.stats()
+        for (provider, ttl, max_entries), cache in _caches.items()
+    }
@@ -3,15 +3,15 @@ LLM Configuration for OSINT Agent
 """
 
 import os
+import logging
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
-from langchain.llms import OpenAI
-from langchain.chat_models import ChatOpenAI
-from langchain.llms import Ollama
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class LLMConfig:
     """Configuration for LLM providers"""
     
@@ -30,31 +30,65 @@ class LLMConfig:
         
         # Gemini specific
         self.gemini_api_key = os.getenv("GEMINI_API_KEY", "")
+        
+        # Response cache (opt-in)
+        self.cache_enabled = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+        self.cache_ttl = float(os.getenv("LLM_CACHE_TTL", "86400"))
+        self.cache_max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+        self.cache_force = os.getenv("LLM_CACHE_FORCE", "false").lower() == "true"
     
     def get_llm(self):
         """Get configured LLM instance"""
         
         if self.provider == "openai":
-            return self._get_openai_llm()
+            llm = self._get_openai_llm()
         elif self.provider == "claude":
-            return self._get_claude_llm()
+            llm = self._get_claude_llm()
         elif self.provider == "gemini":
-            return self._get_gemini_llm()
+            llm = self._get_gemini_llm()
         elif self.provider == "ollama":
-            return self._get_ollama_llm()
+            llm = self._get_ollama_llm()
         else:
             raise ValueError(f"Unsupported LLM provider: {self.provider}")
+        
+        return self.attach_cache(llm)
+    
+    @property
+    def cache_active(self) -> bool:
+        """Whether responses are cached (temperature > 0 bypasses unless forced)"""
+        return self.cache_enabled and (self.temperature == 0 or self.cache_force)
+    
+    def attach_cache(self, llm):
+        """Attach the persistent response cache to an LLM instance"""
+        if not self.cache_active:
+            if self.cache_enabled:
+                logger.info(f"LLM cache bypassed (temperature={self.temperature}); set LLM_CACHE_FORCE=true to cache anyway")
+            return llm
+        
+        from .llm_cache import get_llm_cache
+        llm.cache = get_llm_cache(self.provider, self.cache_ttl, self.cache_max_entries)
+        return llm
+    
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Hit ratio and size of this provider's response cache (None when inactive)"""
+        if not self.cache_active:
+            return None
+        from .llm_cache import get_llm_cache
+        return get_llm_cache(self.provider, self.cache_ttl, self.cache_max_entries).stats()
     
     def _get_openai_llm(self):
         """Get OpenAI LLM"""
         if not self.api_key:
             raise ValueError("OpenAI API key is required. Set LLM_API_KEY environment variable.")
         
+        # langchain のモデル群は重いため、使うプロバイダのものだけ読み込む
+        from langchain.chat_models import ChatOpenAI
         return ChatOpenAI(
             model_name=self.model_name,
             temperature=self.temperature,
             max_tokens=self.max_tokens,
             openai_api_key=self.api_key,
+            streaming=True,
             model_kwargs={"system_message": "あなたは日本語で回答するOSINT調査の専門家です。必ず日本語で回答してください。英語での回答は禁止されています。"}
         )
     
@@ -71,6 +105,7 @@ class LLMConfig:
                 temperature=self.temperature,
                 max_tokens=self.max_tokens,
                 anthropic_api_key=self.claude_api_key,
+                streaming=True,
                 system_message="あなたは日本語で回答するOSINT調査の専門家です。必ず日本語で回答してください。英語での回答は禁止されています。"
             )
         except ImportError:
@@ -107,12 +142,25 @@ class LLMConfig:
         except ImportError:
             raise ImportError("langchain-ollama package is required for Ollama support")
 
-# Default configuration
-DEFAULT_LLM_CONFIG = LLMConfig()
+# Default configuration (built on first use, not at import time)
+_default_llm_config: Optional[LLMConfig] = None
+
+def get_default_llm_config() -> LLMConfig:
+    """Get the shared default configuration"""
+    global _default_llm_config
+    if _default_llm_config is None:
+        _default_llm_config = LLMConfig()
+    return _default_llm_config
 
 def get_default_llm():
     """Get default LLM instance"""
-    return DEFAULT_LLM_CONFIG.get_llm()
+    return get_default_llm_config().get_llm()
+
+def __getattr__(name: str):
+    # 旧来の DEFAULT_LLM_CONFIG 参照は初回アクセス時に構築する
+    if name == "DEFAULT_LLM_CONFIG":
+        return get_default_llm_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Available LLM providers
 AVAILABLE_PROVIDERS = {
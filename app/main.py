@@ -6,6 +6,7 @@ LangChain-based OSINT system with Streamlit UI
 import streamlit as st
 import logging
 import os
+import uuid
 from typing import Optional, Dict, Any
 from datetime import datetime
 
@@ -17,7 +18,9 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Import our modules
-from agents.osint_agent import get_osint_agent, reset_osint_agent
+from agents.agent_pool import agent_pool
+from agents.dispatcher import dispatcher
+from utils.job_runner import STATUS_LABELS, job_runner
 from config.llm_config import LLMConfig, get_provider_info, AVAILABLE_PROVIDERS
 
 # Page configuration
@@ -29,23 +32,33 @@ st.set_page_config(
 )
 
 # Initialize session state
+# セッション ID は URL に残し、再読み込み後も同じエージェント（調査メモリ）を使う
+if "session_id" not in st.session_state:
+    st.session_state.session_id = st.query_params.get("session") or uuid.uuid4().hex
+    st.query_params["session"] = st.session_state.session_id
 if "messages" not in st.session_state:
     st.session_state.messages = []
 if "agent" not in st.session_state:
-    st.session_state.agent = None
+    st.session_state.agent = agent_pool.find_session_agent(st.session_state.session_id)
 if "llm_config" not in st.session_state:
-    st.session_state.llm_config = None
+    st.session_state.llm_config = st.session_state.agent.llm_config if st.session_state.agent else None
+
+@st.cache_resource
+def warm_up_pool() -> Dict[str, float]:
+    """Open caches and shared clients once per server process"""
+    return agent_pool.warm_up()
 
 def initialize_agent(llm_config: LLMConfig) -> bool:
-    """Initialize the OSINT agent"""
+    """Initialize this session's OSINT agent (reused when the settings are unchanged)"""
     try:
-        # Reset the global agent to force new initialization
-        reset_osint_agent()
-        
-        # Initialize new agent
-        st.session_state.agent = get_osint_agent(llm_config)
+        st.session_state.agent = agent_pool.get_session_agent(st.session_state.session_id, llm_config)
         st.session_state.llm_config = llm_config
         
+        timings = agent_pool.construction_time(llm_config)
+        if timings:
+            st.info(f"Debug: Agent construction: {timings.get('agent_ms', 0):.0f} ms "
+                    f"(LLM client {timings.get('llm_ms', 0):.0f} ms)")
+        
         # Debug: Show agent tools
         if hasattr(st.session_state.agent, 'tools'):
             tool_names = [tool.name for tool in st.session_state.agent.tools]
@@ -66,6 +79,8 @@ def initialize_agent(llm_config: LLMConfig) -> bool:
 def main():
     """Main application"""
     
+    warm_up_pool()
+    
     # Header
     st.title("🔍 MenZ-OSINT Agent")
     st.markdown("**LangChain-powered OSINT Investigation Assistant**")
@@ -138,10 +153,6 @@ def main():
                 try:
                     llm_config = LLMConfig()
                     
-                    # Test LLM initialization
-                    test_llm = llm_config.get_llm()
-                    st.info(f"Debug: LLM type: {type(test_llm)}")
-                    
                     # Initialize agent
                     if initialize_agent(llm_config):
                         st.success(f"Agent initialized with {provider_names[selected_provider]}!")
@@ -158,9 +169,17 @@ def main():
             st.success("✅ Agent Ready")
             st.info(f"Provider: {st.session_state.llm_config.provider}")
             st.info(f"Model: {st.session_state.llm_config.model_name}")
+            cache_stats = st.session_state.llm_config.cache_stats()
+            if cache_stats:
+                st.info(f"LLM Cache: {cache_stats['hit_ratio']:.0%} hit ratio "
+                        f"({cache_stats['hits']} hits / {cache_stats['misses']} misses)")
         else:
             st.warning("⚠️ Agent Not Initialized")
         
+        run_stats = dispatcher.stats()
+        st.caption(f"Runs: {run_stats['in_flight']}/{run_stats['max_workers']} running, "
+                   f"{run_stats['queued']} queued | Sessions: {agent_pool.stats()['sessions']}")
+        
         # Clear Memory Button
         if st.session_state.agent:
             if st.button("Clear Memory"):
@@ -169,6 +188,22 @@ def main():
                 st.success("Memory cleared!")
                 st.rerun()
         
+        # Background Jobs (ページを再読み込みしても結果は残る)
+        st.subheader("Background Jobs")
+        jobs = job_runner.list_jobs(10, session_id=st.session_state.session_id)
+        if jobs:
+            if st.button("Refresh Jobs"):
+                st.rerun()
+            for job in jobs:
+                with st.expander(f"{STATUS_LABELS.get(job.status, job.status)} {job.tool}: {job.input} ({job.elapsed:.0f}s)"):
+                    st.caption(job.id)
+                    if job.status == "done":
+                        st.code(job_runner.get(job.id).output)
+                    elif job.error:
+                        st.error(job.error)
+        else:
+            st.caption("No background jobs")
+        
         # Available Tools
         st.subheader("Available Tools")
         st.markdown("""
@@ -179,6 +214,7 @@ def main():
         - **🌍 Web History** - Certificate Transparency + Wayback Machine (サブドメイン検出)
         - **🏓 Ping Test** - Network connectivity test
         - **⚡ Command Execution** - Security tools
+        - **🗂️ Job Status** - Results of background scans
         """)
     
     # Main chat interface
@@ -226,30 +262,55 @@ def main():
             st.markdown(prompt)
             st.caption(f"⏰ {timestamp}")
         
-        # Get agent response
+        # Get agent response (streamed: tool progress and tokens as they arrive)
         with st.chat_message("assistant"):
-            with st.spinner("🔍 Investigating..."):
-                try:
-                    response = st.session_state.agent.run(prompt)
-                    st.markdown(response)
-                    
-                    # Add assistant message
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": response,
-                        "timestamp": timestamp
-                    })
-                    st.caption(f"⏰ {timestamp}")
-                    
-                except Exception as e:
-                    error_msg = f"Error during investigation: {str(e)}"
-                    st.error(error_msg)
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": error_msg,
-                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    })
+            status = st.status("🔍 Investigating...", expanded=True)
+            answer_placeholder = st.empty()
+            response = None
+            tokens = ""
+            
+            try:
+                for event in st.session_state.agent.stream(prompt):
+                    if event.type == "queued":
+                        status.update(label=f"⏳ Waiting for a free worker ({event.data['position']} runs ahead)...")
+                    elif event.type == "llm_start":
+                        status.update(label="🔍 Investigating...")
+                        tokens = ""
+                    elif event.type == "token":
+                        tokens += event.data["token"]
+                        answer_placeholder.markdown(tokens + "▌")
+                    elif event.type == "tool_start":
+                        status.write(f"🛠️ `{event.data['tool']}` を実行中: {event.data['input']}")
+                    elif event.type == "tool_end":
+                        status.write(f"✅ `{event.data['tool']}` 完了 ({event.data['duration']:.1f}秒)")
+                    elif event.type == "tool_error":
+                        status.write(f"❌ `{event.data['tool']}` 失敗 ({event.data['duration']:.1f}秒): {event.data['error']}")
+                    elif event.type == "final":
+                        response = event.data["output"]
+                    elif event.type == "error":
+                        raise RuntimeError(event.data["error"])
+                
+                status.update(label="✅ Investigation complete", state="complete", expanded=False)
+                answer_placeholder.markdown(response or "")
+                
+                # Add assistant message
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": response or "",
+                    "timestamp": timestamp
+                })
+                st.caption(f"⏰ {timestamp}")
+                
+            except Exception as e:
+                status.update(label="❌ Investigation failed", state="error")
+                error_msg = str(e) if str(e).startswith("Error during investigation") else f"Error during investigation: {str(e)}"
+                st.error(error_msg)
+                st.session_state.messages.append({
+                    "role": "assistant", 
+                    "content": error_msg,
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                })
 
 # Run the main application
 main()
\ No newline at end of file
@@ -6,16 +6,18 @@ MCP OSINT Server (LEGACY - 使用されていません)
 """
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-import subprocess
 import asyncio
 import json
 import os
-from typing import Dict, List, Optional, Any
+import time
+from typing import AsyncIterator, Dict, List, Optional, Any
 import logging
 import requests
 
+from tools.process_executor import process_executor
+
 # ログ設定
 logging.basicConfig(
     level=logging.INFO,
@@ -160,7 +162,7 @@ async def call_tool(request: MCPRequest):
     else:
         raise HTTPException(status_code=400, detail=f"Unknown tool: {tool_name}")
 
-async def execute_nmap(arguments: dict, request_id: str):
+async def execute_nmap(arguments: dict, request_id: str, timeout: int = 60):
     """Nmapスキャンの実行"""
     target = arguments.get("target")
     options = arguments.get("options", "-sS")
@@ -173,7 +175,7 @@ async def execute_nmap(arguments: dict, request_id: str):
     
     try:
         cmd = ["nmap"] + options.split() + [target]
-        result = await run_command(cmd)
+        result = await run_command(cmd, timeout)
         
         return MCPResponse(
             result={
@@ -192,7 +194,7 @@ async def execute_nmap(arguments: dict, request_id: str):
             id=request_id
         )
 
-async def execute_whois(arguments: dict, request_id: str):
+async def execute_whois(arguments: dict, request_id: str, timeout: int = 60):
     """WHOIS情報の取得"""
     domain = arguments.get("domain")
     
@@ -204,7 +206,7 @@ async def execute_whois(arguments: dict, request_id: str):
     
     try:
         cmd = ["whois", domain]
-        result = await run_command(cmd)
+        result = await run_command(cmd, timeout)
         
         return MCPResponse(
             result={
@@ -223,7 +225,7 @@ async def execute_whois(arguments: dict, request_id: str):
             id=request_id
         )
 
-async def execute_system_command(arguments: dict, request_id: str):
+async def execute_system_command(arguments: dict, request_id: str, timeout: int = 60):
     """システムコマンドの実行（セキュリティ制限付き）"""
     command = arguments.get("command")
     args = arguments.get("args", [])
@@ -243,7 +245,7 @@ async def execute_system_command(arguments: dict, request_id: str):
     
     try:
         cmd = [command] + args
-        result = await run_command(cmd)
+        result = await run_command(cmd, timeout)
         
         return MCPResponse(
             result={
@@ -263,24 +265,18 @@ async def execute_system_command(arguments: dict, request_id: str):
         )
 
 async def run_command(cmd: List[str], timeout: int = 60):
-    """コマンドの非同期実行"""
+    """コマンドの非同期実行（ツールと同じ同時実行数の上限を共有する）"""
     try:
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
-        
-        if process.returncode != 0:
-            raise Exception(f"Command failed with return code {process.returncode}: {stderr.decode()}")
-        
-        return stdout.decode()
-    except asyncio.TimeoutError:
-        raise Exception(f"Command timed out after {timeout} seconds")
+        result = await process_executor.run_async(cmd, timeout=timeout)
     except Exception as e:
         raise Exception(f"Command execution error: {str(e)}")
+    
+    if result.timed_out:
+        raise Exception(f"Command timed out after {timeout} seconds")
+    if result.returncode != 0:
+        raise Exception(f"Command failed with return code {result.returncode}: {result.stderr}")
+    
+    return result.stdout
 
 # ChatGPT/Gemini用の簡単なエンドポイントを追加
 class SimpleOSINTRequest(BaseModel):
@@ -294,6 +290,88 @@ class SimpleOSINTResponse(BaseModel):
     details: Dict[str, Any]
     recommendations: List[str]
 
+# 調査ごとのタイムアウト（秒）。超えたものはエラーとして結果に含める
+PROBE_TIMEOUTS = {
+    "whois": int(os.getenv("OSINT_API_WHOIS_TIMEOUT", "30")),
+    "nmap": int(os.getenv("OSINT_API_NMAP_TIMEOUT", "120")),
+    "dns": int(os.getenv("OSINT_API_DNS_TIMEOUT", "30")),
+}
+# バッチ調査で同時に調べるターゲット数と、1リクエストあたりのターゲット数の上限
+BATCH_CONCURRENCY = int(os.getenv("OSINT_API_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("OSINT_API_BATCH_MAX_CONCURRENCY", "16"))
+BATCH_MAX_TARGETS = int(os.getenv("OSINT_API_BATCH_MAX_TARGETS", "500"))
+# asyncio.to_thread が使う既定エグゼキュータのスレッド数（Python の既定値と同じ式）
+DEFAULT_EXECUTOR_THREADS = min(32, (os.cpu_count() or 1) + 4)
+
+async def run_probe(name: str, probe, timeout: int) -> Any:
+    """1つの調査を実行し、結果またはエラーを返す"""
+    try:
+        # タイムアウトはプロセスの実行時間にだけ適用する（空き枠の待ち時間は含めない）
+        response = await probe(timeout)
+    except Exception as e:
+        return {"error": str(e)}
+    if hasattr(response, 'result'):
+        if response.result:
+            return response.result
+        return {"error": (response.error or {}).get("message", "No result")}
+    return response
+
+async def investigate_target(target: str, tools: List[str]) -> SimpleOSINTResponse:
+    """WHOIS・Nmap・DNS の調査を同時に実行して結果をまとめる"""
+    probes = {
+        "whois": lambda timeout: execute_whois({"domain": target}, "whois_simple", timeout),
+        "nmap": lambda timeout: execute_nmap({"target": target, "options": "-sS -p 80,443,8080"}, "nmap_simple", timeout),
+        "dns": lambda timeout: execute_system_command({"command": "dig", "args": [target, "ANY"]}, "dns_simple", timeout),
+    }
+    selected = [name for name in probes if name in tools]
+    outputs = await asyncio.gather(*(run_probe(name, probes[name], PROBE_TIMEOUTS[name]) for name in selected))
+    results = dict(zip(selected, outputs))
+    
+    # 結果の解析とサマリー生成
+    summary = f"🔍 {target} の調査結果:\n\n"
+    
+    # WHOIS結果の分析
+    if "whois" in results and "error" not in results["whois"]:
+        summary += "✅ WHOIS情報: 正常に取得されました\n"
+    else:
+        summary += "❌ WHOIS情報: 取得に失敗しました\n"
+    
+    # Nmap結果の分析
+    if "nmap" in results and "error" not in results["nmap"]:
+        nmap_content = results["nmap"].get("content", []) if isinstance(results["nmap"], dict) else []
+        if nmap_content and "open" in str(nmap_content):
+            summary += "⚠️  開放ポートが検出されました\n"
+        else:
+            summary += "✅ 開放ポートは検出されませんでした\n"
+    else:
+        summary += "❌ ポートスキャン: 実行に失敗しました\n"
+    
+    # DNS結果の分析
+    if "dns" in results and "error" not in results["dns"]:
+        summary += "✅ DNS情報: 正常に取得されました\n"
+    else:
+        summary += "❌ DNS情報: 取得に失敗しました\n"
+    
+    # 推奨事項の生成
+    recommendations = []
+    if "nmap" in results and "error" not in results["nmap"]:
+        nmap_content = results["nmap"].get("content", []) if isinstance(results["nmap"], dict) else []
+        if nmap_content and "open" in str(nmap_content):
+            recommendations.append("開放ポートが検出されました。不要なサービスは停止を検討してください。")
+            recommendations.append("ファイアウォール設定の見直しを推奨します。")
+    
+    recommendations.extend([
+        "定期的なセキュリティ監査を実施してください。",
+        "脆弱性スキャンを定期的に実行してください。"
+    ])
+    
+    return SimpleOSINTResponse(
+        success=True,
+        summary=summary,
+        details=results,
+        recommendations=recommendations
+    )
+
 @app.post("/investigate", response_model=SimpleOSINTResponse)
 async def simple_investigate(request: SimpleOSINTRequest):
     """
@@ -301,88 +379,7 @@ async def simple_investigate(request: SimpleOSINTRequest):
     既存のMCPサーバー機能を活用
     """
     try:
-        results = {}
-        
-        # 1. WHOIS調査
-        if "whois" in request.tools:
-            try:
-                whois_args = {"domain": request.target}
-                whois_result = await execute_whois(whois_args, "whois_simple")
-                if hasattr(whois_result, 'result'):
-                    results["whois"] = whois_result.result if whois_result.result else {"error": "No result"}
-                else:
-                    results["whois"] = whois_result
-            except Exception as e:
-                results["whois"] = {"error": str(e)}
-        
-        # 2. Nmap調査
-        if "nmap" in request.tools:
-            try:
-                nmap_args = {"target": request.target, "options": "-sS -p 80,443,8080"}
-                nmap_result = await execute_nmap(nmap_args, "nmap_simple")
-                if hasattr(nmap_result, 'result'):
-                    results["nmap"] = nmap_result.result if nmap_result.result else {"error": "No result"}
-                else:
-                    results["nmap"] = nmap_result
-            except Exception as e:
-                results["nmap"] = {"error": str(e)}
-        
-        # 3. DNS調査
-        if "dns" in request.tools:
-            try:
-                dns_args = {"command": "dig", "args": [request.target, "ANY"]}
-                dns_result = await execute_system_command(dns_args, "dns_simple")
-                if hasattr(dns_result, 'result'):
-                    results["dns"] = dns_result.result if dns_result.result else {"error": "No result"}
-                else:
-                    results["dns"] = dns_result
-            except Exception as e:
-                results["dns"] = {"error": str(e)}
-        
-        # 結果の解析とサマリー生成
-        summary = f"🔍 {request.target} の調査結果:\n\n"
-        
-        # WHOIS結果の分析
-        if "whois" in results and "error" not in results["whois"]:
-            summary += "✅ WHOIS情報: 正常に取得されました\n"
-        else:
-            summary += "❌ WHOIS情報: 取得に失敗しました\n"
-        
-        # Nmap結果の分析
-        if "nmap" in results and "error" not in results["nmap"]:
-            nmap_content = results["nmap"].get("content", []) if isinstance(results["nmap"], dict) else []
-            if nmap_content and "open" in str(nmap_content):
-                summary += "⚠️  開放ポートが検出されました\n"
-            else:
-                summary += "✅ 開放ポートは検出されませんでした\n"
-        else:
-            summary += "❌ ポートスキャン: 実行に失敗しました\n"
-        
-        # DNS結果の分析
-        if "dns" in results and "error" not in results["dns"]:
-            summary += "✅ DNS情報: 正常に取得されました\n"
-        else:
-            summary += "❌ DNS情報: 取得に失敗しました\n"
-        
-        # 推奨事項の生成
-        recommendations = []
-        if "nmap" in results and "error" not in results["nmap"]:
-            nmap_content = results["nmap"].get("content", []) if isinstance(results["nmap"], dict) else []
-            if nmap_content and "open" in str(nmap_content):
-                recommendations.append("開放ポートが検出されました。不要なサービスは停止を検討してください。")
-                recommendations.append("ファイアウォール設定の見直しを推奨します。")
-        
-        recommendations.extend([
-            "定期的なセキュリティ監査を実施してください。",
-            "脆弱性スキャンを定期的に実行してください。"
-        ])
-        
-        return SimpleOSINTResponse(
-            success=True,
-            summary=summary,
-            details=results,
-            recommendations=recommendations
-        )
+        return await investigate_target(request.target, request.tools)
     
     except Exception as e:
         logger.error(f"Simple investigate error: {str(e)}")
@@ -393,6 +390,58 @@ async def simple_investigate(request: SimpleOSINTRequest):
             recommendations=["エラーログを確認してください。"]
         )
 
+class BatchOSINTRequest(BaseModel):
+    targets: List[str]
+    investigation_type: str = "domain"
+    tools: List[str] = ["whois", "nmap", "dns"]
+    concurrency: int = BATCH_CONCURRENCY
+
+async def stream_batch(targets: List[str], tools: List[str], concurrency: int) -> AsyncIterator[str]:
+    """ターゲットごとの結果を完了した順に NDJSON の1行として返す"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def investigate_one(index: int, target: str) -> Dict[str, Any]:
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                response = (await investigate_target(target, tools)).model_dump()
+            except Exception as e:
+                logger.error(f"Batch investigate error for {target}: {str(e)}")
+                response = {"success": False, "summary": f"調査中にエラーが発生しました: {str(e)}",
+                            "details": {"error": str(e)}, "recommendations": []}
+            return {"index": index, "target": target, "elapsed": round(time.monotonic() - start, 3), **response}
+    
+    tasks = [asyncio.create_task(investigate_one(index, target)) for index, target in enumerate(targets)]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield json.dumps(await finished, ensure_ascii=False) + "\n"
+    finally:
+        # クライアントが切断した場合は残りの調査を取り消す（待機中の枠は手放し、実行中のプロセスは停止される）
+        for task in tasks:
+            task.cancel()
+
+@app.post("/investigate/batch")
+async def batch_investigate(request: BatchOSINTRequest):
+    """
+    複数ターゲットの一括調査
+    上限付きの同時実行で調べ、完了したターゲットから NDJSON で順次返す
+    """
+    # 重複を除き、入力順を保つ
+    targets = list(dict.fromkeys(target.strip() for target in request.targets if target.strip()))
+    if not targets:
+        raise HTTPException(status_code=400, detail="No targets given")
+    if len(targets) > BATCH_MAX_TARGETS:
+        raise HTTPException(status_code=400, detail=f"Too many targets ({len(targets)} > {BATCH_MAX_TARGETS})")
+    
+    # 調査1件につき probe ごとに1スレッドを使うため、既定エグゼキュータに収まる同時実行数に抑える
+    probes = max(1, len({"whois", "nmap", "dns"} & set(request.tools)))
+    concurrency = max(1, min(request.concurrency, BATCH_MAX_CONCURRENCY, DEFAULT_EXECUTOR_THREADS // probes))
+    logger.info(f"Batch investigation of {len(targets)} targets (concurrency {concurrency})")
+    return StreamingResponse(
+        stream_batch(targets, request.tools, concurrency),
+        media_type="application/x-ndjson"
+    )
+
 @app.get("/chatgpt-config")
 async def get_chatgpt_config():
     """
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# アプリは app/ をカレントディレクトリとして実行されるため、同じ import パスにする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,33 @@
+"""Target extraction of the investigation memory"""
+
+import pytest
+
+from agents.memory import InvestigationMemory, extract_domains, extract_ips
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("magn8soft.tokyoのサブドメインを調べて", ["magn8soft.tokyo"]),
+    ("example.comの過去のWebサイトを調べて", ["example.com"]),
+    ("「www.example.co.jp」と「example.org」", ["www.example.co.jp", "example.org"]),
+    ("check example.com and api.example.com", ["example.com", "api.example.com"]),
+    ("run.py と notes.txt を読んで", []),
+])
+def test_extract_domains_next_to_japanese(text, expected):
+    assert extract_domains(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("192.168.1.1のポートスキャンを実行して", ["192.168.1.1"]),
+    ("2001:db8::1のポート", ["2001:db8::1"]),
+    ("バージョン1.2.3.4.5は対象外", []),
+])
+def test_extract_ips_next_to_japanese(text, expected):
+    assert extract_ips(text) == expected
+
+
+def test_subdomains_of_japanese_request_are_pinned():
+    memory = InvestigationMemory(mode="bounded")
+    memory.note_request("magn8soft.tokyoのサブドメインを調べて")
+    memory.observe("Found: www.magn8soft.tokyo、mail.magn8soft.tokyo と other.example")
+    assert list(memory.facts["targets"]) == ["magn8soft.tokyo"]
+    assert list(memory.facts["subdomains"]) == ["www.magn8soft.tokyo", "mail.magn8soft.tokyo"]
@@ -1,13 +1,53 @@
 """
 OSINT Tools for LangChain Agent
+
+ツールモジュールは langchain を含め読み込みが重いため、最初に参照された
+時点で import する。エージェントは get_tools() で名前から取得する。
 """
 
-from .nmap_tool import nmap_tool
-from .whois_tool import whois_tool
-from .dns_tool import dns_tool
-from .dns_history_tool import dns_history_tool
-from .web_history_tool import web_history_tool
-from .command_tool import command_tool
-from .ping_tool import ping_tool
+import importlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# ツール名 -> (モジュール, 属性名)
+TOOL_REGISTRY: Dict[str, Tuple[str, str]] = {
+    "nmap_scan": ("nmap_tool", "nmap_tool"),
+    "whois_lookup": ("whois_tool", "whois_tool"),
+    "dns_lookup": ("dns_tool", "dns_tool"),
+    "dns_history_lookup": ("dns_history_tool", "dns_history_tool"),
+    "web_history_lookup": ("web_history_tool", "web_history_tool"),
+    "execute_command": ("command_tool", "command_tool"),
+    "ping_test": ("ping_tool", "ping_tool"),
+    "job_status": ("job_status_tool", "job_status_tool"),
+}
+
+__all__ = ['nmap_tool', 'whois_tool', 'dns_tool', 'dns_history_tool', 'web_history_tool', 'command_tool', 'ping_tool',
+           'job_status_tool', 'TOOL_REGISTRY', 'get_tool', 'get_tools']
+
+_ATTRIBUTES = {attribute: module for module, attribute in TOOL_REGISTRY.values()}
+
+
+def _load(module_name: str, attribute: str) -> Any:
+    module = importlib.import_module(f".{module_name}", __name__)
+    tool = getattr(module, attribute)
+    # サブモジュールの import でパッケージ属性がモジュールに置き換わるため Tool に戻す
+    globals()[attribute] = tool
+    return tool
+
+
+def get_tool(name: str) -> Any:
+    """Return the Tool registered under an agent-facing name (e.g. "nmap_scan")"""
+    if name not in TOOL_REGISTRY:
+        raise KeyError(f"Unknown tool '{name}'. Available: {', '.join(TOOL_REGISTRY)}")
+    return _load(*TOOL_REGISTRY[name])
+
+
+def get_tools(names: Optional[Iterable[str]] = None) -> List[Any]:
+    """Return the Tools for the given names (all registered tools by default)"""
+    return [get_tool(name) for name in (TOOL_REGISTRY if names is None else names)]
+
 
-__all__ = ['nmap_tool', 'whois_tool', 'dns_tool', 'dns_history_tool', 'web_history_tool', 'command_tool', 'ping_tool'] 
\ No newline at end of file
+def __getattr__(name: str) -> Any:
+    # from tools import nmap_tool などの従来の参照
+    if name in _ATTRIBUTES:
+        return _load(_ATTRIBUTES[name], name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,9 +3,11 @@ Command Tool for LangChain Agent
 """
 
 from langchain.tools import Tool
-import subprocess
 import logging
 
+from .process_executor import process_executor
+from utils.job_runner import BACKGROUND_JOBS, run_in_background
+
 logger = logging.getLogger(__name__)
 
 # Allowed commands for security
@@ -17,6 +19,9 @@ ALLOWED_COMMANDS = [
     "python3", "python", "bash", "sh"
 ]
 
+# 数分かかるためバックグラウンドジョブとして実行するコマンド
+BACKGROUND_COMMANDS = ["sqlmap", "nikto"]
+
 def run_command(command: str) -> str:
     """Execute command in Docker environment"""
     
@@ -35,14 +40,12 @@ def run_command(command: str) -> str:
         logger.info(f"Running command: {command}")
         
         # Execute directly in current environment
-        result = subprocess.run(
-            ["sh", "-c", command], 
-            capture_output=True, 
-            text=True, 
-            timeout=180,  # 3 minutes timeout
-            cwd=None
-        )
+        # 同時実行数は実際に起動するコマンド名ごとに制限する
+        result = process_executor.run(["sh", "-c", command], timeout=180, binary=base_command)  # 3 minutes timeout
         
+        if result.timed_out:
+            logger.error(f"Command timed out: {command}")
+            return f"Command timed out: {command}"
         if result.returncode == 0:
             output = result.stdout.strip()
             logger.info(f"Command completed successfully: {command}")
@@ -52,9 +55,6 @@ def run_command(command: str) -> str:
             logger.error(f"Command failed: {error_msg}")
             return f"Command failed: {error_msg}"
             
-    except subprocess.TimeoutExpired:
-        logger.error(f"Command timed out: {command}")
-        return f"Command timed out: {command}"
     except Exception as e:
         logger.error(f"Command error: {str(e)}")
         return f"Command error: {str(e)}"
@@ -66,6 +66,8 @@ def command_wrapper(input_str: str) -> str:
         if not command:
             return "Error: Please provide a command to execute"
         
+        if BACKGROUND_JOBS and command.split()[0] in BACKGROUND_COMMANDS:
+            return run_in_background("execute_command", command, lambda: run_command(command))
         return run_command(command)
     except Exception as e:
         return f"Error parsing command input: {str(e)}"
@@ -86,6 +88,8 @@ command_tool = Tool(
     - "python3 -c 'import socket; print(socket.gethostbyname(\"google.com\"))'" - Python script
     - "nikto -h google.com" - Web vulnerability scan
     - "sqlmap -u 'http://target.com/page?id=1' --batch" - SQL injection test
+    
+    {', '.join(BACKGROUND_COMMANDS)} run as background jobs and return a job ID; use job_status to get the result.
     """,
     func=command_wrapper
 ) 
\ No newline at end of file
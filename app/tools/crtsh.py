@@ -0,0 +1,292 @@
+"""
+Certificate Transparency (crt.sh) client shared by all CT consumers
+
+crt.sh の JSON 応答は大規模な組織では数百MBになるため、レスポンスを
+ソケットから逐次パースし、集計値を構築しながら保持するレコード数を
+CRTSH_MAX_RECORDS 件に制限する。保持したレコードはフォーマッタが最初に
+参照した時点で CertificateRecord に一度だけ変換する。
+"""
+
+import os
+import heapq
+import logging
+import requests
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Tuple
+
+from utils.json_stream import iter_json_array
+from utils.ttl_cache import PersistentTTLCache
+from .http_client import http_client
+from .subdomain_extractor import SubdomainIndex
+
+logger = logging.getLogger(__name__)
+
+CRTSH_URL = "https://crt.sh/"
+CRTSH_TIMEOUT = int(os.getenv("CRTSH_TIMEOUT", "30"))
+CRTSH_MAX_RECORDS = int(os.getenv("CRTSH_MAX_RECORDS", "5000"))
+CRTSH_CHUNK_SIZE = 64 * 1024
+
+# フォーマッタが参照するフィールドだけを保持する
+RECORD_FIELDS = ("id", "serial_number", "issuer_name", "common_name", "name_value", "not_before", "not_after")
+
+# crt.sh は応答に 10〜30 秒かかるため結果をディスクにキャッシュする
+ct_cache = PersistentTTLCache(
+    namespace="crtsh_dataset",
+    default_ttl=float(os.getenv("CRTSH_CACHE_TTL", "86400")),
+    negative_ttl=float(os.getenv("CRTSH_NEGATIVE_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("CRTSH_CACHE_MAX_ENTRIES", "500")),
+    max_bytes=int(os.getenv("CRTSH_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+)
+
+
+class CTLookupError(Exception):
+    """Raised when crt.sh cannot be queried"""
+
+
+_fromisoformat = datetime.fromisoformat
+
+
+def parse_ct_time(value: Optional[str]) -> Optional[datetime]:
+    """crt.sh timestamp as an aware UTC datetime (crt.sh omits the offset)"""
+    if not value:
+        return None
+    # オフセットを文字列で補う方が datetime.replace より速い
+    tail = value[19:]
+    if tail.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    elif '+' not in tail and '-' not in tail:
+        value += '+00:00'
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo is timezone.utc else parsed.astimezone(timezone.utc)
+
+
+def _parse_fast(value: str) -> Optional[datetime]:
+    """parse_ct_time with a shortcut for crt.sh's usual offset-less, second precision format"""
+    if len(value) == 19:
+        try:
+            return _fromisoformat(value + '+00:00')
+        except ValueError:
+            # 不正な日時はそのレコードの日付だけを欠損として扱う
+            return None
+    return parse_ct_time(value)
+
+
+class CertificateRecord:
+    """A retained crt.sh record decoded once for the formatters"""
+
+    __slots__ = ("id", "serial_number", "issuer_id", "common_name", "names", "wildcard",
+                 "not_before", "not_after", "not_before_text", "not_after_text")
+
+    def __init__(self, cert: Dict[str, Any], issuer_id: int):
+        get = cert.get
+        self.id = get('id')
+        self.serial_number = get('serial_number')
+        self.issuer_id = issuer_id
+        self.common_name = get('common_name') or ''
+        # crt.sh の name_value は改行区切りで前後に空白を含まない
+        name_value = get('name_value') or ''
+        self.names = tuple(name_value.split('\n')) if name_value else ()
+        self.wildcard = '*.' in name_value or '*.' in self.common_name
+        # 表示には crt.sh の文字列をそのまま使う
+        not_before = self.not_before_text = get('not_before') or ''
+        not_after = self.not_after_text = get('not_after') or ''
+        self.not_before = _parse_fast(not_before)
+        self.not_after = _parse_fast(not_after)
+
+
+class CertificateDataset:
+    """Aggregates built on the fly from a stream of crt.sh records
+
+    Totals, issuer counts, per-year counts and subdomains cover every
+    certificate (precertificate/leaf pairs are counted once); only the
+    most recent ``max_records`` records are retained for the detail
+    formatters.
+    """
+
+    def __init__(self, max_records: int = CRTSH_MAX_RECORDS):
+        self.max_records = max_records
+        self.total = 0
+        self.issuers: Counter = Counter()
+        self.years: Counter = Counter()
+        self.subdomains = SubdomainIndex()
+        self.duplicates = 0
+        self.first_record: Optional[Dict[str, Any]] = None
+        self.last_record: Optional[Dict[str, Any]] = None
+        # この解析で増えた RSS（取得直後のみ。キャッシュからの復元時は None）
+        self.parse_memory_mb: Optional[float] = None
+        # 発行者名 -> ID（CertificateRecord は ID だけを持つ）
+        self.issuer_names: List[str] = []
+        self._issuer_ids: Dict[str, int] = {}
+        self._heap: List = []
+        self._records: Optional[List[CertificateRecord]] = None
+        self._boundaries: Optional[Tuple[Optional[CertificateRecord], Optional[CertificateRecord]]] = None
+
+    def add(self, cert: Dict[str, Any]):
+        """Fold a single crt.sh record into the aggregates"""
+        # 同じ証明書のプレ証明書と本証明書は1件として数える
+        if not self.subdomains.add_certificate(cert):
+            self.duplicates += 1
+            return
+        record = {field: cert.get(field) for field in RECORD_FIELDS if cert.get(field) is not None}
+        self.total += 1
+
+        self.issuers[record.get('issuer_name', 'Unknown')] += 1
+
+        not_before = record.get('not_before', '')
+        if not_before:
+            self.years[not_before[:4]] += 1
+            if self.first_record is None or not_before < self.first_record.get('not_before', ''):
+                self.first_record = record
+                self._boundaries = None
+            if self.last_record is None or not_before >= self.last_record.get('not_before', ''):
+                self.last_record = record
+                self._boundaries = None
+
+        # 発行日が新しい順に max_records 件だけ保持する（最小ヒープ）
+        item = (not_before, self.total, record)
+        if len(self._heap) < self.max_records:
+            heapq.heappush(self._heap, item)
+            self._records = None
+        elif item > self._heap[0]:
+            heapq.heapreplace(self._heap, item)
+            self._records = None
+
+    def issuer_id(self, issuer_name: str) -> int:
+        """ID of an issuer name, assigned on first use"""
+        issuer_id = self._issuer_ids.get(issuer_name)
+        if issuer_id is None:
+            issuer_id = self._issuer_ids[issuer_name] = len(self.issuer_names)
+            self.issuer_names.append(issuer_name)
+        return issuer_id
+
+    def issuer_name(self, record: CertificateRecord) -> str:
+        return self.issuer_names[record.issuer_id]
+
+    def _decode(self, cert: Optional[Dict[str, Any]]) -> Optional[CertificateRecord]:
+        if cert is None:
+            return None
+        return CertificateRecord(cert, self.issuer_id(cert.get('issuer_name', 'Unknown')))
+
+    @property
+    def records(self) -> List[CertificateRecord]:
+        """Retained records sorted by not_before (oldest first), decoded on first access"""
+        if self._records is None:
+            # crt.sh の日時は固定書式なので文字列順が時系列順になる
+            issuer_id = self.issuer_id
+            self._records = [
+                CertificateRecord(cert, issuer_id(cert.get('issuer_name', 'Unknown')))
+                for _, _, cert in sorted(self._heap)
+            ]
+        return self._records
+
+    @property
+    def boundaries(self) -> Tuple[Optional[CertificateRecord], Optional[CertificateRecord]]:
+        """(first, last) certificate by not_before over every record"""
+        if self._boundaries is None:
+            self._boundaries = (self._decode(self.first_record), self._decode(self.last_record))
+        return self._boundaries
+
+    @property
+    def retained(self) -> int:
+        """Number of retained records (without decoding them)"""
+        return len(self._heap)
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > len(self._heap)
+
+    def __len__(self) -> int:
+        return self.total
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "max_records": self.max_records,
+            "total": self.total,
+            "issuers": dict(self.issuers),
+            "years": dict(self.years),
+            "subdomains": self.subdomains.to_list(),
+            "duplicates": self.duplicates,
+            "first_record": self.first_record,
+            "last_record": self.last_record,
+            "records": [record for _, _, record in sorted(self._heap)],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CertificateDataset":
+        dataset = cls(data.get("max_records", CRTSH_MAX_RECORDS))
+        dataset.total = data["total"]
+        dataset.issuers = Counter(data["issuers"])
+        dataset.years = Counter(data["years"])
+        dataset.subdomains = SubdomainIndex.from_list(data["subdomains"])
+        dataset.duplicates = data.get("duplicates", 0)
+        dataset.first_record = data["first_record"]
+        dataset.last_record = data["last_record"]
+        dataset._heap = [(r.get('not_before', ''), i, r) for i, r in enumerate(data["records"])]
+        heapq.heapify(dataset._heap)
+        return dataset
+
+
+def _rss_mb() -> Optional[float]:
+    """Current resident set size of this process (None where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def fetch_certificates(domain: str, max_records: int = CRTSH_MAX_RECORDS) -> CertificateDataset:
+    """Query crt.sh directly, streaming the response into a dataset"""
+    try:
+        response = http_client.get(CRTSH_URL, params={"q": domain, "output": "json"},
+                                   timeout=CRTSH_TIMEOUT, stream=True)
+    except requests.exceptions.RequestException as e:
+        raise CTLookupError(str(e)) from e
+
+    dataset = CertificateDataset(max_records)
+    # プロセス全体のピークではなく、この解析の前後の RSS の差を記録する
+    rss_before = _rss_mb()
+    try:
+        if response.status_code != 200:
+            raise CTLookupError(f"HTTP {response.status_code}")
+
+        for cert in iter_json_array(response.iter_content(chunk_size=CRTSH_CHUNK_SIZE)):
+            if isinstance(cert, dict):
+                dataset.add(cert)
+    except (ValueError, requests.exceptions.RequestException) as e:
+        raise CTLookupError(f"crt.sh応答の解析に失敗しました: {e}") from e
+    finally:
+        response.close()
+
+    rss_after = _rss_mb()
+    if rss_before is not None and rss_after is not None:
+        dataset.parse_memory_mb = max(rss_after - rss_before, 0.0)
+    logger.info(
+        f"crt.sh streamed {dataset.total} certificates for {domain} "
+        f"({dataset.duplicates} duplicates, {len(dataset.subdomains)} names, retained {dataset.retained}"
+        + (f", RSS +{dataset.parse_memory_mb:.1f} MB)" if dataset.parse_memory_mb is not None else ")")
+    )
+    return dataset
+
+
+def get_certificates(domain: str) -> CertificateDataset:
+    """Return the crt.sh dataset for a domain, reading through the cache
+
+    Empty results are cached for a shorter TTL; errors are never cached.
+    """
+    key = domain.strip().lower()
+
+    hit, cached = ct_cache.lookup(key)
+    if hit:
+        dataset = CertificateDataset.from_dict(cached)
+        logger.info(f"crt.sh cache hit for {key} ({dataset.total} certificates)")
+    else:
+        logger.info(f"crt.sh cache miss for {key}, querying crt.sh")
+        dataset = fetch_certificates(key)
+        ct_cache.set(key, dataset.to_dict(), negative=dataset.total == 0)
+
+    return dataset
@@ -12,6 +12,8 @@ import json
 from typing import Dict, List, Any
 from datetime import datetime, timedelta
 
+from .crtsh import get_certificates, CTLookupError
+
 logger = logging.getLogger(__name__)
 
 def is_valid_domain(domain: str) -> bool:
@@ -30,38 +32,32 @@ def is_valid_ipv4(ip: str) -> bool:
 def search_certificate_transparency(domain: str) -> str:
     """Search Certificate Transparency logs for domain history"""
     try:
-        # crt.sh APIを使用（実際のAPIコール）
-        url = f"https://crt.sh/?q={domain}&output=json"
-        response = requests.get(url, timeout=30)
-        
-        if response.status_code == 200:
-            certificates = response.json()
-            if certificates:
-                result = f"Certificate Transparency検索結果 for {domain}:\n\n"
-                
-                # 最新の10件を表示
-                for i, cert in enumerate(certificates[:10]):
-                    common_name = cert.get('common_name', 'N/A')
-                    not_before = cert.get('not_before', 'N/A')
-                    not_after = cert.get('not_after', 'N/A')
-                    issuer = cert.get('issuer_name', 'N/A')
-                    
-                    result += f"証明書 #{i+1}:\n"
-                    result += f"  Common Name: {common_name}\n"
-                    result += f"  有効期間: {not_before} ～ {not_after}\n"
-                    result += f"  発行者: {issuer}\n\n"
-                
-                if len(certificates) > 10:
-                    result += f"... 他 {len(certificates) - 10} 件の証明書が見つかりました\n"
+        # crt.sh APIを使用（キャッシュ経由）
+        dataset = get_certificates(domain)
+        if dataset.total:
+            result = f"Certificate Transparency検索結果 for {domain}:\n\n"
+            
+            # 最新の10件を表示
+            for i, cert in enumerate(reversed(dataset.records[-10:])):
+                common_name = cert.common_name or 'N/A'
+                not_before = cert.not_before_text or 'N/A'
+                not_after = cert.not_after_text or 'N/A'
+                issuer = dataset.issuer_name(cert)
                 
-                return result
-            else:
-                return f"Certificate Transparency logsで {domain} の証明書が見つかりませんでした"
+                result += f"証明書 #{i+1}:\n"
+                result += f"  Common Name: {common_name}\n"
+                result += f"  有効期間: {not_before} ～ {not_after}\n"
+                result += f"  発行者: {issuer}\n\n"
+            
+            if dataset.total > 10:
+                result += f"... 他 {dataset.total - 10} 件の証明書が見つかりました\n"
+            
+            return result
         else:
-            return f"Certificate Transparency検索でエラーが発生しました (HTTP {response.status_code})"
+            return f"Certificate Transparency logsで {domain} の証明書が見つかりませんでした"
     
-    except requests.exceptions.RequestException as e:
-        return f"Certificate Transparency検索エラー: {str(e)}"
+    except CTLookupError as e:
+        return f"Certificate Transparency検索でエラーが発生しました ({str(e)})"
     except Exception as e:
         return f"Certificate Transparency検索エラー: {str(e)}"
 
@@ -0,0 +1,261 @@
+"""
+In-process DNS resolution engine built on dnspython
+
+Returns structured answers with TTLs and keeps a TTL-respecting local
+answer cache, replacing per-query `dig` subprocesses.
+"""
+
+import os
+import time
+import asyncio
+import contextvars
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import dns.asyncresolver
+import dns.exception
+import dns.message
+import dns.rdatatype
+import dns.resolver
+
+from utils.ttl_cache import caches_bypassed
+
+logger = logging.getLogger(__name__)
+
+# 応答に SOA が無い否定応答のキャッシュ秒数
+NEGATIVE_TTL = int(os.getenv("DNS_NEGATIVE_TTL", "60"))
+# ネームサーバーの組み合わせごとに保持するリゾルバーの上限
+MAX_RESOLVERS = int(os.getenv("DNS_MAX_RESOLVERS", "32"))
+
+
+class DNSRecord(NamedTuple):
+    """A single resource record from the answer section"""
+    name: str
+    rdtype: str
+    ttl: int
+    value: str
+
+
+class DNSAnswer:
+    """Structured result of a DNS query"""
+
+    def __init__(self, name: str, rdtype: str, status: str, records: Optional[List[DNSRecord]] = None,
+                 nameserver: Optional[str] = None, elapsed_ms: float = 0.0, error: str = "",
+                 negative_ttl: int = NEGATIVE_TTL):
+        self.name = name
+        self.rdtype = rdtype
+        self.status = status  # NOERROR, NXDOMAIN, NOANSWER, TIMEOUT, ERROR
+        self.records = records or []
+        self.nameserver = nameserver
+        self.elapsed_ms = elapsed_ms
+        self.error = error
+        self.negative_ttl = negative_ttl
+        self.from_cache = False
+
+    @property
+    def ttl(self) -> int:
+        """Smallest TTL in the answer, or the negative TTL when it has no records (cache lifetime)"""
+        return min((record.ttl for record in self.records), default=self.negative_ttl)
+
+    def values(self, rdtype: Optional[str] = None) -> List[str]:
+        """Record values, optionally filtered by type"""
+        return [record.value for record in self.records if rdtype is None or record.rdtype == rdtype]
+
+    def to_text(self) -> str:
+        """Render like `dig +short` (CNAME chain followed by the final records)"""
+        return "\n".join(record.value for record in self.records)
+
+
+class DNSResolver:
+    """dnspython resolver with an LRU answer cache that honours record TTLs"""
+
+    def __init__(self, nameservers: Optional[Sequence[str]] = None, timeout: float = 5.0,
+                 lifetime: float = 10.0, cache_size: int = 4096):
+        self.resolver = dns.resolver.Resolver(configure=not nameservers)
+        if nameservers:
+            self.resolver.nameservers = list(nameservers)
+        self.resolver.timeout = timeout
+        self.resolver.lifetime = lifetime
+        self.cache_size = cache_size
+
+        self._async_resolver = None
+        self._cache: "OrderedDict[Tuple[str, str], Tuple[DNSAnswer, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "cache_hits": 0, "cache_misses": 0}
+
+    @property
+    def nameservers(self) -> List[str]:
+        return list(self.resolver.nameservers)
+
+    def _cache_get(self, key: Tuple[str, str]) -> Optional[DNSAnswer]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self._stats["cache_misses"] += 1
+                return None
+            answer, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._cache[key]
+                self._stats["cache_misses"] += 1
+                return None
+            self._cache.move_to_end(key)
+            self._stats["cache_hits"] += 1
+            return answer
+
+    def _cache_put(self, key: Tuple[str, str], answer: DNSAnswer):
+        # タイムアウト等の一時的な失敗はキャッシュしない
+        if answer.status not in ("NOERROR", "NXDOMAIN", "NOANSWER"):
+            return
+        with self._lock:
+            self._cache[key] = (answer, time.monotonic() + answer.ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _lookup_cached(self, name: str, rdtype: str, use_cache: bool) -> Tuple[Tuple[str, str], Optional[DNSAnswer]]:
+        key = (name.rstrip(".").lower(), rdtype)
+        with self._lock:
+            self._stats["queries"] += 1
+        if not use_cache or caches_bypassed():
+            return key, None
+
+        cached = self._cache_get(key)
+        if cached is None:
+            return key, None
+        hit = DNSAnswer(cached.name, cached.rdtype, cached.status, cached.records,
+                        cached.nameserver, 0.0, cached.error, cached.negative_ttl)
+        hit.from_cache = True
+        return key, hit
+
+    @staticmethod
+    def _negative_ttl(response: Optional[dns.message.Message]) -> int:
+        """min(SOA TTL, SOA minimum) from the authority section (RFC 2308), else NEGATIVE_TTL"""
+        for rrset in getattr(response, "authority", None) or ():
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min([rrset.ttl] + [rdata.minimum for rdata in rrset])
+        return NEGATIVE_TTL
+
+    @classmethod
+    def _answer_from_result(cls, name: str, rdtype: str, result: dns.resolver.Answer) -> DNSAnswer:
+        records = [
+            DNSRecord(rrset.name.to_text(), dns.rdatatype.to_text(rrset.rdtype), rrset.ttl, rdata.to_text())
+            for rrset in result.response.answer
+            for rdata in rrset
+        ]
+        return DNSAnswer(name, rdtype, "NOERROR" if result.rrset is not None else "NOANSWER",
+                         records, result.nameserver, negative_ttl=cls._negative_ttl(result.response))
+
+    @classmethod
+    def _answer_from_error(cls, name: str, rdtype: str, error: dns.exception.DNSException) -> DNSAnswer:
+        if isinstance(error, dns.resolver.NXDOMAIN):
+            response = next(iter(error.responses().values()), None)
+            return DNSAnswer(name, rdtype, "NXDOMAIN", negative_ttl=cls._negative_ttl(response))
+        if isinstance(error, dns.exception.Timeout):
+            return DNSAnswer(name, rdtype, "TIMEOUT", error="timed out")
+        return DNSAnswer(name, rdtype, "ERROR", error=str(error))
+
+    def resolve(self, name: str, rdtype: str = "A", use_cache: bool = True) -> DNSAnswer:
+        """Resolve a name, returning a structured answer (never raises)"""
+        rdtype = rdtype.upper()
+        key, cached = self._lookup_cached(name, rdtype, use_cache)
+        if cached is not None:
+            return cached
+
+        start = time.monotonic()
+        try:
+            result = self.resolver.resolve(name, rdtype, raise_on_no_answer=False)
+            answer = self._answer_from_result(name, rdtype, result)
+        except dns.exception.DNSException as e:
+            answer = self._answer_from_error(name, rdtype, e)
+
+        answer.elapsed_ms = (time.monotonic() - start) * 1000
+        self._cache_put(key, answer)
+        return answer
+
+    async def resolve_async(self, name: str, rdtype: str = "A", use_cache: bool = True) -> DNSAnswer:
+        """asyncio variant of resolve() sharing the same answer cache"""
+        rdtype = rdtype.upper()
+        key, cached = self._lookup_cached(name, rdtype, use_cache)
+        if cached is not None:
+            return cached
+
+        if self._async_resolver is None:
+            self._async_resolver = dns.asyncresolver.Resolver(configure=False)
+            self._async_resolver.nameservers = self.resolver.nameservers
+            self._async_resolver.timeout = self.resolver.timeout
+            self._async_resolver.lifetime = self.resolver.lifetime
+
+        start = time.monotonic()
+        try:
+            result = await self._async_resolver.resolve(name, rdtype, raise_on_no_answer=False)
+            answer = self._answer_from_result(name, rdtype, result)
+        except dns.exception.DNSException as e:
+            answer = self._answer_from_error(name, rdtype, e)
+
+        answer.elapsed_ms = (time.monotonic() - start) * 1000
+        self._cache_put(key, answer)
+        return answer
+
+    async def resolve_many_async(self, names: Sequence[str], rdtypes: Sequence[str] = ("A", "AAAA"),
+                                 concurrency: int = 50) -> Dict[str, Dict[str, DNSAnswer]]:
+        """Resolve every (name, rdtype) pair with at most `concurrency` queries in flight"""
+        semaphore = asyncio.Semaphore(concurrency)
+        results: Dict[str, Dict[str, DNSAnswer]] = {name: {} for name in names}
+
+        async def worker(name: str, rdtype: str):
+            async with semaphore:
+                results[name][rdtype] = await self.resolve_async(name, rdtype)
+
+        await asyncio.gather(*(worker(name, rdtype) for name in names for rdtype in rdtypes))
+        return results
+
+    def resolve_many(self, names: Sequence[str], rdtypes: Sequence[str] = ("A", "AAAA"),
+                     concurrency: int = 50) -> Dict[str, Dict[str, DNSAnswer]]:
+        """Synchronous entry point for resolve_many_async()"""
+        coroutine = self.resolve_many_async(names, rdtypes, concurrency)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(coroutine)
+
+        # 既にイベントループ上にいる場合は別スレッドで実行する
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(contextvars.copy_context().run, asyncio.run, coroutine).result()
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cache_entries"] = len(self._cache)
+        return stats
+
+
+# 最近使った順に MAX_RESOLVERS 個まで保持する（"@ns" 指定ごとに増え続けないように）
+_resolvers: "OrderedDict[Tuple[str, ...], DNSResolver]" = OrderedDict()
+_resolvers_lock = threading.Lock()
+
+
+def get_resolver(nameservers: Optional[Sequence[str]] = None) -> DNSResolver:
+    """Return a shared resolver for the given nameservers
+
+    Without explicit nameservers, DNS_NAMESERVERS (comma separated) is used,
+    falling back to the system configuration.
+    """
+    if not nameservers:
+        env = os.getenv("DNS_NAMESERVERS", "")
+        nameservers = [ns.strip() for ns in env.split(",") if ns.strip()]
+    key = tuple(nameservers)
+
+    with _resolvers_lock:
+        if key not in _resolvers:
+            _resolvers[key] = DNSResolver(nameservers or None)
+            while len(_resolvers) > max(1, MAX_RESOLVERS):
+                _resolvers.popitem(last=False)
+        _resolvers.move_to_end(key)
+        return _resolvers[key]
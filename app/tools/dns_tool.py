@@ -3,15 +3,21 @@ DNS Tool for LangChain Agent
 """
 
 from langchain.tools import Tool
-import subprocess
 import logging
 import re
-import requests
-import json
-from typing import List, Dict
+import os
+import time
+from typing import List, Dict, Optional
+
+from .crtsh import get_certificates, CTLookupError
+from .dns_resolver import get_resolver
 
 logger = logging.getLogger(__name__)
 
+# 一括解決モードの同時問い合わせ数と1回あたりの最大ホスト数
+BULK_CONCURRENCY = int(os.getenv("DNS_BULK_CONCURRENCY", "50"))
+BULK_MAX_NAMES = int(os.getenv("DNS_BULK_MAX_NAMES", "2000"))
+
 def is_valid_ipv4(ip: str) -> bool:
     """Check if string is a valid IPv4 address"""
     pattern = r'^(\d{1,3}\.){3}\d{1,3}$'
@@ -20,6 +26,10 @@ def is_valid_ipv4(ip: str) -> bool:
         return all(0 <= int(part) <= 255 for part in parts)
     return False
 
+def is_valid_domain_name(name: str) -> bool:
+    """Check if string looks like a resolvable host name"""
+    return bool(re.match(r'^[a-z0-9_]([a-z0-9_\-]{0,62}\.)*[a-z0-9\-]{1,63}\.?$', name, re.IGNORECASE)) and len(name) <= 253
+
 def ipv4_to_reverse_dns(ip: str) -> str:
     """Convert IPv4 address to reverse DNS format"""
     parts = ip.split('.')
@@ -56,8 +66,8 @@ def reverse_ip_lookup(ip: str) -> str:
     except Exception as e:
         return f"リバースIP検索エラー: {str(e)}"
 
-def run_dns_query(domain: str, record_type: str = "A") -> str:
-    """Execute DNS query directly"""
+def run_dns_query(domain: str, record_type: str = "A", nameserver: Optional[str] = None) -> str:
+    """Execute DNS query with the in-process resolver"""
     
     valid_types = ["A", "AAAA", "MX", "NS", "TXT", "CNAME", "SOA", "PTR", "REVERSE_IP"]
     if record_type.upper() not in valid_types:
@@ -78,47 +88,111 @@ def run_dns_query(domain: str, record_type: str = "A") -> str:
     try:
         logger.info(f"Running DNS query for: {domain} (type: {record_type})")
         
-        # Execute directly in current environment
-        cmd = ["dig", "+short", domain, record_type.upper()]
-        
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            timeout=30,  # 30 seconds timeout
-            cwd=None
-        )
+        resolver = get_resolver([nameserver] if nameserver else None)
+        answer = resolver.resolve(domain, record_type)
         
-        if result.returncode == 0:
-            output = result.stdout.strip()
+        if answer.status in ("NOERROR", "NOANSWER", "NXDOMAIN"):
+            output = answer.to_text()
             if not output:
                 return f"No {record_type} records found for {domain}"
             
-            logger.info(f"DNS query completed successfully for {domain}")
+            logger.info(f"DNS query completed successfully for {domain}"
+                        f" ({'cache' if answer.from_cache else f'{answer.elapsed_ms:.1f} ms'})")
             return f"DNS {record_type} records for {domain}:\n\n{output}"
+        elif answer.status == "TIMEOUT":
+            logger.error(f"DNS query timed out for {domain}")
+            return f"DNS query timed out for {domain}"
         else:
-            error_msg = result.stderr.strip() or "Unknown error"
+            error_msg = answer.error or "Unknown error"
             logger.error(f"DNS query failed: {error_msg}")
             return f"DNS query failed for {domain}: {error_msg}"
             
-    except subprocess.TimeoutExpired:
-        logger.error(f"DNS query timed out for {domain}")
-        return f"DNS query timed out for {domain}"
     except Exception as e:
         logger.error(f"DNS query error: {str(e)}")
         return f"DNS query error for {domain}: {str(e)}"
 
+def _names_from_ct(domain: str) -> List[str]:
+    """Subdomains of a domain from Certificate Transparency (cached, so cheap after web_history_lookup)"""
+    dataset = get_certificates(domain)
+    # ワイルドカードは親ドメインにまとめて正規化済み
+    return [name for name in dataset.subdomains.hosts() if is_valid_domain_name(name)]
+
+def run_bulk_dns_query(names: List[str], nameserver: Optional[str] = None, concurrency: int = BULK_CONCURRENCY) -> str:
+    """Resolve many host names concurrently and return a compact table"""
+    names = list(dict.fromkeys(name.strip().rstrip('.').lower() for name in names if name.strip()))
+    if not names:
+        return "Error: No host names to resolve"
+    
+    skipped = 0
+    if len(names) > BULK_MAX_NAMES:
+        skipped = len(names) - BULK_MAX_NAMES
+        names = names[:BULK_MAX_NAMES]
+    
+    logger.info(f"Running bulk DNS resolution for {len(names)} names (concurrency: {concurrency})")
+    start = time.monotonic()
+    resolver = get_resolver([nameserver] if nameserver else None)
+    answers = resolver.resolve_many(names, ("A", "AAAA"), concurrency)
+    elapsed = time.monotonic() - start
+    
+    live, dead = [], []
+    for name in names:
+        a_answer = answers[name]["A"]
+        aaaa_answer = answers[name]["AAAA"]
+        ipv4 = a_answer.values("A")
+        ipv6 = aaaa_answer.values("AAAA")
+        cnames = [value.rstrip('.') for value in a_answer.values("CNAME") or aaaa_answer.values("CNAME")]
+        
+        if ipv4 or ipv6:
+            live.append(f"{name} | {','.join(ipv4) or '-'} | {','.join(ipv6) or '-'} | {' > '.join(cnames) or '-'}")
+        else:
+            status = a_answer.status if a_answer.status != "NOERROR" else aaaa_answer.status
+            dead.append(f"{name} ({status}{': ' + ' > '.join(cnames) if cnames else ''})")
+    
+    result = f"一括DNS解決結果: {len(names)}件 (生存: {len(live)}, 解決不可: {len(dead)}, 所要時間: {elapsed:.1f}秒)\n\n"
+    if live:
+        result += "NAME | A | AAAA | CNAME\n"
+        result += "\n".join(live) + "\n\n"
+    if dead:
+        result += "解決できなかったホスト:\n"
+        result += "\n".join(dead) + "\n"
+    if skipped:
+        result += f"\n... 上限 {BULK_MAX_NAMES} 件を超えたため {skipped} 件は未解決です\n"
+    
+    return result
+
 def dns_query_wrapper(input_str: str) -> str:
     """Wrapper function for DNS tool"""
     try:
         parts = input_str.strip().split()
+        # dig と同じく "@8.8.8.8" で問い合わせ先リゾルバを指定できる
+        nameservers = [part[1:] for part in parts if part.startswith("@")]
+        parts = [part for part in parts if not part.startswith("@")]
         if not parts:
             return "Error: Please provide a domain name"
         
+        nameserver = nameservers[0] if nameservers else None
+        
+        # 一括解決: "BULK host1 host2,host3" / "example.com BULK_CT"
+        if parts[0].upper() == "BULK":
+            names = [name for part in parts[1:] for name in part.split(",")]
+            return run_bulk_dns_query(names, nameserver)
+        if "BULK_CT" in (part.upper() for part in parts):
+            # 直前の検索結果は別のセッションのものかもしれないため、ドメインの指定を必須にする
+            domain = next((part for part in parts if part.upper() != "BULK_CT"), None)
+            if not domain:
+                return "Error: Specify the domain for BULK_CT, e.g. \"example.com BULK_CT\""
+            try:
+                names = _names_from_ct(domain)
+            except CTLookupError as e:
+                return f"Error: Certificate Transparency lookup failed for {domain}: {str(e)}"
+            if not names:
+                return f"Error: No Certificate Transparency subdomains available for {domain}"
+            return f"{domain} のCT由来サブドメイン\n" + run_bulk_dns_query(names, nameserver)
+        
         domain = parts[0]
         record_type = parts[1] if len(parts) > 1 else "A"
         
-        return run_dns_query(domain, record_type)
+        return run_dns_query(domain, record_type, nameserver)
     except Exception as e:
         return f"Error parsing DNS input: {str(e)}"
 
@@ -128,17 +202,24 @@ dns_tool = Tool(
     description="""
     Perform DNS lookups for various record types including reverse IP lookup.
     
-    Usage: "domain.com [record_type]"
+    Usage: "domain.com [record_type] [@resolver]"
     - domain: Domain name to query (required)
     - record_type: A, AAAA, MX, NS, TXT, CNAME, SOA, PTR, REVERSE_IP (default: A)
+    - @resolver: DNS server to query, e.g. @8.8.8.8 (default: system resolver)
+    
+    Bulk mode (resolves A/AAAA/CNAME for many hosts concurrently in one call):
+    - "BULK host1 host2,host3" - Resolve a list of host names
+    - "example.com BULK_CT" - Resolve every subdomain found by Certificate Transparency for example.com
     
     Examples:
     - "google.com" - Get A records
     - "google.com MX" - Get mail server records
     - "google.com NS" - Get nameserver records
     - "google.com TXT" - Get text records
+    - "google.com A @1.1.1.1" - Query a specific resolver
     - "8.8.8.8 PTR" - Get reverse DNS for IP address (automatically converted to in-addr.arpa format)
     - "202.212.71.93 REVERSE_IP" - Get all domains hosted on this IP address
+    - "example.com BULK_CT" - Check which CT subdomains are live in one call
     """,
     func=dns_query_wrapper
 ) 
\ No newline at end of file
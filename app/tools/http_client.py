@@ -0,0 +1,286 @@
+"""
+Shared HTTP client for OSINT data sources
+
+Keeps pooled keep-alive connections, limits concurrent requests per host,
+retries 429/5xx with jittered exponential backoff and revalidates cached
+responses with ETag / If-Modified-Since. A streamed response holds its
+host slot until it is closed, and its body is kept for revalidation once
+it has been read to the end.
+"""
+
+import os
+import random
+import threading
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class _HostStats:
+    """Latency counters for a single host"""
+
+    __slots__ = ("requests", "errors", "retries", "not_modified", "total_time", "min_time", "max_time")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.not_modified = 0
+        self.total_time = 0.0
+        self.min_time = None
+        self.max_time = 0.0
+
+    def record(self, elapsed: float):
+        self.requests += 1
+        self.total_time += elapsed
+        self.min_time = elapsed if self.min_time is None else min(self.min_time, elapsed)
+        self.max_time = max(self.max_time, elapsed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "not_modified": self.not_modified,
+            "avg_ms": round(self.total_time / self.requests * 1000, 1) if self.requests else 0.0,
+            "min_ms": round((self.min_time or 0.0) * 1000, 1),
+            "max_ms": round(self.max_time * 1000, 1),
+        }
+
+
+class OSINTHttpClient:
+    """Pooled requests.Session with retry, per-host limits and revalidation"""
+
+    def __init__(
+        self,
+        pool_size: int = 20,
+        per_host_limit: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 1.0,
+        backoff_max: float = 30.0,
+        validator_cache_size: int = 256,
+        validator_max_body: int = 8 * 1024 * 1024,
+    ):
+        self.per_host_limit = per_host_limit
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.validator_cache_size = validator_cache_size
+        self.validator_max_body = validator_max_body
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Accept-Encoding": "gzip, deflate",
+            "User-Agent": "MenZ-OSINT/1.0",
+        })
+
+        self._lock = threading.Lock()
+        self._host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_stats: Dict[str, _HostStats] = {}
+        self._validators: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def _host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_stats[host] = _HostStats()
+            return self._host_semaphores[host]
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After when present"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _cache_key(self, url: str, params: Optional[Dict[str, Any]]) -> str:
+        return f"{url}?{urlencode(sorted(params.items()))}" if params else url
+
+    def _conditional_headers(self, key: str) -> Dict[str, str]:
+        with self._lock:
+            entry = self._validators.get(key)
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def _remember(self, key: str, response: requests.Response, content: Optional[bytes] = None):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not (etag or last_modified):
+            return
+        if content is None:
+            content = response.content
+        if len(content) > self.validator_max_body:
+            return
+        with self._lock:
+            self._validators[key] = {
+                "etag": etag,
+                "last_modified": last_modified,
+                "content": content,
+                "headers": dict(response.headers),
+                "encoding": response.encoding,
+                "url": response.url,
+            }
+            self._validators.move_to_end(key)
+            while len(self._validators) > self.validator_cache_size:
+                self._validators.popitem(last=False)
+
+    def _replay(self, key: str, not_modified: requests.Response) -> Optional[requests.Response]:
+        """Rebuild a 200 response from the validator cache after a 304"""
+        with self._lock:
+            entry = self._validators.get(key)
+            if entry is None:
+                return None
+            self._validators.move_to_end(key)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = entry["content"]
+        # iter_content() が保存済みの本文を返すようにする
+        response._content_consumed = True
+        response.headers.update(entry["headers"])
+        response.encoding = entry["encoding"]
+        response.url = entry["url"]
+        response.request = not_modified.request
+        response.elapsed = not_modified.elapsed
+        return response
+
+    def _remember_when_read(self, key: str, response: requests.Response):
+        """Remember a streamed body once the caller has read it to the end"""
+        if not (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            return
+        iter_content = response.iter_content
+
+        def recording(chunk_size: int = 1, decode_unicode: bool = False):
+            chunks: Optional[list] = [] if not decode_unicode else None
+            size = 0
+            for chunk in iter_content(chunk_size=chunk_size, decode_unicode=decode_unicode):
+                if chunks is not None:
+                    size += len(chunk)
+                    # 上限を超えた本文は保存しない
+                    if size > self.validator_max_body:
+                        chunks = None
+                    else:
+                        chunks.append(chunk)
+                yield chunk
+            # 途中で読むのをやめた場合はここに来ないので、不完全な本文は保存されない
+            if chunks is not None:
+                self._remember(key, response, b"".join(chunks))
+
+        response.iter_content = recording
+
+    def _send(self, semaphore: threading.BoundedSemaphore, url: str, stream: bool, **kwargs) -> requests.Response:
+        """session.get under the host slot; a streamed response keeps the slot until it is closed"""
+        semaphore.acquire()
+        try:
+            response = self.session.get(url, stream=stream, **kwargs)
+        except BaseException:
+            semaphore.release()
+            raise
+        if not stream:
+            semaphore.release()
+            return response
+
+        # 本文は呼び出し側が後から読むので、close() されるまで枠を返さない
+        close = response.close
+        released = threading.Lock()
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                if released.acquire(blocking=False):
+                    semaphore.release()
+
+        response.close = close_and_release
+        return response
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None, timeout: float = 30,
+            stream: bool = False, **kwargs) -> requests.Response:
+        """GET with retry/backoff; raises requests exceptions once retries are exhausted
+
+        Close a streamed response (or use it as a context manager) to give
+        its host slot back.
+        """
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphore(host)
+        stats = self._host_stats[host]
+
+        key = self._cache_key(url, params)
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers.update(self._conditional_headers(key))
+
+        attempt = 0
+        while True:
+            response = None
+            start = time.monotonic()
+            try:
+                response = self._send(semaphore, url, stream, params=params, timeout=timeout,
+                                      headers=headers, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                with self._lock:
+                    stats.errors += 1
+                if attempt >= self.max_retries:
+                    raise
+                logger.warning(f"{host}: {e.__class__.__name__}, retrying ({attempt + 1}/{self.max_retries})")
+            finally:
+                with self._lock:
+                    stats.record(time.monotonic() - start)
+
+            if response is not None:
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    break
+                logger.warning(f"{host}: HTTP {response.status_code}, retrying ({attempt + 1}/{self.max_retries})")
+                response.close()
+
+            with self._lock:
+                stats.retries += 1
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+        if response.status_code == 304:
+            replayed = self._replay(key, response)
+            response.close()
+            if replayed is not None:
+                with self._lock:
+                    stats.not_modified += 1
+                return replayed
+            # 検証用キャッシュが追い出された場合は条件なしで取り直す
+            kwargs["headers"] = {k: v for k, v in headers.items()
+                                 if k not in ("If-None-Match", "If-Modified-Since")}
+            return self.get(url, params=params, timeout=timeout, stream=stream, **kwargs)
+        if response.status_code == 200:
+            if stream:
+                self._remember_when_read(key, response)
+            else:
+                self._remember(key, response)
+        return response
+
+    def host_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-host latency and retry statistics"""
+        with self._lock:
+            return {host: stats.to_dict() for host, stats in self._host_stats.items()}
+
+
+http_client = OSINTHttpClient(
+    pool_size=int(os.getenv("HTTP_POOL_SIZE", "20")),
+    per_host_limit=int(os.getenv("HTTP_PER_HOST_LIMIT", "4")),
+    max_retries=int(os.getenv("HTTP_MAX_RETRIES", "3")),
+)
@@ -0,0 +1,70 @@
+"""
+Job Status Tool for LangChain Agent
+"""
+
+from langchain.tools import Tool
+import os
+import logging
+
+from utils.job_runner import STATUS_LABELS, current_session, job_runner
+
+logger = logging.getLogger(__name__)
+
+# "wait" 指定時に完了を待つ最大秒数
+JOB_WAIT_TIMEOUT = float(os.getenv("OSINT_JOB_WAIT_TIMEOUT", "120"))
+
+def format_job_list(limit: int = 10) -> str:
+    """Recent jobs of the current session, newest first"""
+    jobs = job_runner.list_jobs(limit, session_id=current_session.get())
+    if not jobs:
+        return "No background jobs"
+    lines = ["Background jobs (newest first):"]
+    for job in jobs:
+        lines.append(f"  {job.id}  {STATUS_LABELS.get(job.status, job.status)}  {job.tool} {job.input}  ({job.elapsed:.0f}s)")
+    return "\n".join(lines)
+
+def job_status(job_id: str, wait: bool = False) -> str:
+    """Status of a job, with its output once finished"""
+    # 他のセッションのジョブは存在しないものとして扱う
+    job = job_runner.get(job_id, session_id=current_session.get())
+    if job is None:
+        return f"Error: Job {job_id} not found"
+    if wait and not job.finished:
+        job = job_runner.wait(job.id, JOB_WAIT_TIMEOUT)
+
+    header = f"{job.id} {STATUS_LABELS.get(job.status, job.status)} ({job.tool}: {job.input}, {job.elapsed:.0f}s)"
+    if job.status == "done":
+        return f"{header}\n\n{job.output}"
+    if job.finished:
+        return f"{header}\n{job.error or ''}".rstrip()
+    return f"{header}\nまだ完了していません。しばらくしてから再確認するか \"{job.id} wait\" で待機してください。"
+
+def job_status_wrapper(input_str: str) -> str:
+    """Wrapper function for job status tool"""
+    try:
+        parts = input_str.strip().strip("\"'").split()
+        if not parts:
+            return format_job_list()
+
+        wait = len(parts) > 1 and parts[1].lower() == "wait"
+        return job_status(parts[0], wait)
+    except Exception as e:
+        return f"Error checking job status: {str(e)}"
+
+# Create LangChain Tool
+job_status_tool = Tool(
+    name="job_status",
+    description=f"""
+    Check background jobs started by long-running tools (service/sharded nmap scans, sqlmap, nikto).
+
+    Usage: "job_id [wait]"
+    - job_id: ID returned when the job was started (e.g. job-1a2b3c4d)
+    - wait: block until the job finishes (up to {JOB_WAIT_TIMEOUT:.0f}s)
+    - empty input: list recent jobs
+
+    Examples:
+    - "job-1a2b3c4d" - Current status (and result if finished)
+    - "job-1a2b3c4d wait" - Wait for the result
+    """,
+    func=job_status_wrapper
+)
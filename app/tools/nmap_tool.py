@@ -4,10 +4,23 @@ Nmap Tool for LangChain Agent
 
 from langchain.tools import Tool
 from langchain.pydantic_v1 import BaseModel, Field
+import os
+import re
+import time
+import contextvars
 import subprocess
+import tempfile
+import ipaddress
 import json
 import logging
-from typing import Dict, Any
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple
+
+from .nmap_xml import NmapScanResult, merge_results, parse_nmap_xml
+from .process_executor import process_executor
+from utils.job_runner import BACKGROUND_JOBS, run_in_background
 
 logger = logging.getLogger(__name__)
 
@@ -23,49 +36,259 @@ class NmapInput(BaseModel):
         description="Specific ports to scan (e.g., '22,80,443' or '1-1000')"
     )
 
-def run_nmap(target: str, scan_type: str = "basic", ports: str = "") -> str:
-    """Execute nmap scan in Docker environment"""
+# スキャン種別ごとの nmap オプション（対象は末尾に付ける）
+SCAN_OPTIONS = {
+    "basic": ["-sS", "-O"],
+    "port": ["-sS"],
+    "service": ["-sS", "-sV", "-O"],
+    "stealth": ["-sS", "-T2", "-f"],
+}
+
+NMAP_TIMEOUT = int(os.getenv("NMAP_TIMEOUT", "300"))
+NMAP_SHARD_TIMEOUT = int(os.getenv("NMAP_SHARD_TIMEOUT", "120"))
+NMAP_SHARD_HOSTS = int(os.getenv("NMAP_SHARD_HOSTS", "16"))
+NMAP_SHARD_PORTS = int(os.getenv("NMAP_SHARD_PORTS", "1000"))
+# nmap はネットワーク待ちが主なので CPU 数より多めに並列化する
+NMAP_MAX_PARALLEL = int(os.getenv("NMAP_MAX_PARALLEL", str(max(4, os.cpu_count() or 1))))
+NMAP_MAX_SHARDS = int(os.getenv("NMAP_MAX_SHARDS", "256"))
+
+@dataclass
+class NmapShard:
+    """One chunk of a sharded scan and how it went"""
+    targets: List[str]
+    ports: str = ""
+    elapsed: float = 0.0
+    status: str = "pending"  # ok, timeout, error
+    hosts_up: int = 0
+    error: str = ""
+    
+    @property
+    def label(self) -> str:
+        label = " ".join(self.targets) if len(self.targets) <= 2 else f"{self.targets[0]} .. {self.targets[-1]} ({len(self.targets)})"
+        return f"{label} -p {self.ports}" if self.ports else label
+
+def run_nmap_scan(target: str, scan_type: str = "basic", ports: str = "", timeout: int = NMAP_TIMEOUT,
+                  targets: Optional[List[str]] = None) -> NmapScanResult:
+    """Execute nmap with XML output and parse it while it streams
     
-    # Build nmap command based on scan type
-    nmap_commands = {
-        "basic": ["nmap", "-sS", "-O", target],
-        "port": ["nmap", "-sS", "-p", ports or "1-1000", target],
-        "service": ["nmap", "-sS", "-sV", "-O", target],
-        "stealth": ["nmap", "-sS", "-T2", "-f", target]
-    }
+    `targets` scans several hosts/networks in one process; `target` is then
+    only used as the result label.
+    """
+    if scan_type not in SCAN_OPTIONS:
+        raise ValueError(f"Unknown scan type '{scan_type}'. Available: basic, port, service, stealth")
     
-    if scan_type not in nmap_commands:
-        return f"Error: Unknown scan type '{scan_type}'. Available: basic, port, service, stealth"
+    # XML を標準出力に書かせて逐次パースする
+    cmd = ["nmap"] + SCAN_OPTIONS[scan_type]
+    if scan_type == "port":
+        cmd += ["-p", ports or "1-1000"]
+    cmd += ["-oX", "-"] + (targets or [target])
+    logger.info(f"Running nmap scan: {' '.join(cmd)}")
     
-    cmd = nmap_commands[scan_type]
+    # 上限に達している場合は共有エグゼキュータの空きを待ち、タイムアウト時はプロセスグループごと停止する
+    # stderr は一時ファイルに書かせ、警告が多くてもパイプが詰まって stdout の読み取りが止まらないようにする
+    with tempfile.TemporaryFile() as stderr_file:
+        with process_executor.spawn(cmd, timeout=timeout, stdout=subprocess.PIPE, stderr=stderr_file) as handle:
+            result = parse_nmap_xml(handle.process.stdout, target)
+            handle.process.wait()
+        stderr_file.seek(0)
+        stderr = stderr_file.read().decode(errors="replace").strip()
     
+    if handle.timed_out:
+        result.timed_out = True
+        result.errors = []
+    elif handle.process.returncode != 0:
+        result.errors.append(stderr or "Unknown error")
+    return result
+
+# 分割できるのは番号と範囲だけのポート指定（"T:80,U:53" やサービス名はそのまま nmap に渡す）
+_NUMERIC_PORTS = re.compile(r"^\s*(\d+(-\d*)?|-\d+)(\s*,\s*(\d+(-\d*)?|-\d+))*\s*$")
+
+def _expand_ports(ports: str) -> List[int]:
+    """'22,80,8000-8010' -> sorted unique port numbers"""
+    numbers = set()
+    for part in ports.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-", 1)
+            numbers.update(range(int(start or 1), int(end or 65535) + 1))
+        else:
+            numbers.add(int(part))
+    return sorted(numbers)
+
+def _compress_ports(numbers: List[int]) -> str:
+    """Sorted port numbers -> '22,80,8000-8010'"""
+    ranges = []
+    for number in numbers:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+def _target_networks(target: str, shard_hosts: int) -> List[Tuple[str, Any]]:
+    """(item, network to split or None) for each comma separated target"""
+    items = []
+    for item in (part.strip() for part in target.split(",")):
+        if not item:
+            continue
+        try:
+            network = ipaddress.ip_network(item, strict=False)
+        except ValueError:
+            network = None
+        if network is not None and network.num_addresses <= shard_hosts:
+            network = None
+        if network is not None and network.version == 6:
+            # IPv6 のプレフィックスは走査できる大きさではないため分割しない
+            raise ValueError(f"IPv6 range {item} is too large to scan (at most {shard_hosts} addresses). "
+                             f"List the hosts instead.")
+        items.append((item, network))
+    return items
+
+def _subnet_prefix(network: Any, shard_hosts: int) -> int:
+    """Prefix length of the shard_hosts sized subnets of a network"""
+    return max(network.max_prefixlen - max(shard_hosts.bit_length() - 1, 0), network.prefixlen)
+
+def _port_groups(scan_type: str, ports: str, shard_ports: int) -> List[str]:
+    if scan_type != "port":
+        return [""]
+    ports = ports or "1-1000"
+    if not _NUMERIC_PORTS.match(ports):
+        return [ports]
+    numbers = _expand_ports(ports)
+    return [_compress_ports(numbers[i:i + shard_ports]) for i in range(0, len(numbers), shard_ports)]
+
+def count_shards(target: str, scan_type: str = "basic", ports: str = "",
+                 shard_hosts: int = NMAP_SHARD_HOSTS, shard_ports: int = NMAP_SHARD_PORTS) -> int:
+    """Number of shards plan_shards would build, computed without building them"""
+    groups = hosts = 0
+    for _, network in _target_networks(target, shard_hosts):
+        if network is None:
+            hosts += 1
+        else:
+            groups += 2 ** (_subnet_prefix(network, shard_hosts) - network.prefixlen)
+    groups += -(-hosts // shard_hosts)
+    return groups * len(_port_groups(scan_type, ports, shard_ports))
+
+def _split_targets(target: str, shard_hosts: int) -> List[List[str]]:
+    """Split a comma separated host list / CIDR ranges into groups of at most shard_hosts addresses"""
+    groups: List[List[str]] = []
+    hosts: List[str] = []
+    for item, network in _target_networks(target, shard_hosts):
+        if network is None:
+            hosts.append(item)
+            continue
+        # 大きなネットワークは shard_hosts 個ずつのサブネットに分ける
+        groups.extend([str(subnet)] for subnet in network.subnets(new_prefix=_subnet_prefix(network, shard_hosts)))
+    groups.extend(hosts[i:i + shard_hosts] for i in range(0, len(hosts), shard_hosts))
+    return groups
+
+def plan_shards(target: str, scan_type: str = "basic", ports: str = "",
+                shard_hosts: int = NMAP_SHARD_HOSTS, shard_ports: int = NMAP_SHARD_PORTS,
+                max_shards: Optional[int] = NMAP_MAX_SHARDS) -> List[NmapShard]:
+    """Split a scan into target chunks x port chunks
+
+    Raises ValueError before building anything when more than max_shards
+    shards would be needed.
+    """
+    count = count_shards(target, scan_type, ports, shard_hosts, shard_ports)
+    if max_shards is not None and count > max_shards:
+        raise ValueError(f"{target} would need {count} shards (limit {max_shards}). "
+                         f"Narrow the range or the port list.")
+    target_groups = _split_targets(target, shard_hosts)
+    port_groups = _port_groups(scan_type, ports, shard_ports)
+    return [NmapShard(targets=group, ports=port_chunk) for group in target_groups for port_chunk in port_groups]
+
+def run_sharded_nmap(target: str, scan_type: str = "basic", ports: str = "",
+                     shards: Optional[List[NmapShard]] = None, max_parallel: int = NMAP_MAX_PARALLEL,
+                     shard_timeout: int = NMAP_SHARD_TIMEOUT) -> Tuple[NmapScanResult, List[NmapShard]]:
+    """Run shards on a bounded pool of nmap processes and merge their results
+    
+    Each shard has its own timeout; an overrunning shard is killed on its
+    own and contributes whatever hosts it reported before that.
+    """
+    shards = shards if shards is not None else plan_shards(target, scan_type, ports)
+    results: List[NmapScanResult] = []
+    start = time.monotonic()
+    
+    def run_shard(shard: NmapShard) -> NmapScanResult:
+        start = time.monotonic()
+        try:
+            # 同じ対象のポート分割シャードは同じラベルにして停止ホスト数の重複を防ぐ
+            result = run_nmap_scan(",".join(shard.targets), scan_type, shard.ports, shard_timeout, shard.targets)
+            shard.status = "timeout" if result.timed_out else ("error" if result.errors else "ok")
+            shard.error = "; ".join(result.errors)
+            shard.hosts_up = sum(1 for host in result.hosts if host.state == "up")
+        except Exception as e:
+            result = NmapScanResult(target=",".join(shard.targets), errors=[f"{shard.label}: {e}"])
+            shard.status, shard.error = "error", str(e)
+        shard.elapsed = time.monotonic() - start
+        return result
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor:
+        # 呼び出し元の取り消しがシャードの nmap にも届くようにコンテキストを引き継ぐ
+        futures = [executor.submit(contextvars.copy_context().run, run_shard, shard) for shard in shards]
+        results.extend(future.result() for future in futures)
+    
+    merged = merge_results(target, results)
+    merged.command = f"nmap {' '.join(SCAN_OPTIONS[scan_type])} ({len(shards)} shards, {max_parallel} parallel)"
+    merged.elapsed = time.monotonic() - start
+    return merged, shards
+
+def format_shard_report(shards: List[NmapShard], wall_time: float) -> str:
+    """Per-shard timing table appended to a merged report"""
+    counts = Counter(shard.status for shard in shards)
+    summary = ", ".join(f"{count} {status}" for status, count in counts.most_common())
+    lines = ["", f"Shards: {len(shards)} ({summary}) | Wall time: {wall_time:.1f}s"]
+    for shard in shards:
+        line = f"  {shard.label:<45} {shard.status:<8} {shard.elapsed:6.1f}s  {shard.hosts_up} up"
+        if shard.status == "error" and shard.error:
+            line += f"  {shard.error[:80]}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def run_nmap(target: str, scan_type: str = "basic", ports: str = "",
+             shards: Optional[List[NmapShard]] = None) -> str:
+    """Execute nmap scan and return a compact table
+    
+    CIDR ranges, comma separated host lists and large port ranges are split
+    into shards and scanned in parallel. `shards` reuses an existing plan.
+    """
     try:
-        logger.info(f"Running nmap scan: {' '.join(cmd)}")
-        
-        # Execute directly in current environment
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            timeout=300,  # 5 minutes timeout
-            cwd=None
-        )
-        
-        if result.returncode == 0:
-            output = result.stdout.strip()
-            logger.info(f"Nmap scan completed successfully")
-            return f"Nmap scan results for {target}:\n\n{output}"
+        if scan_type not in SCAN_OPTIONS:
+            raise ValueError(f"Unknown scan type '{scan_type}'. Available: basic, port, service, stealth")
+        if shards is None:
+            shards = plan_shards(target, scan_type, ports)
+    except ValueError as e:
+        return f"Error: {str(e)}"
+    
+    try:
+        start = time.monotonic()
+        if len(shards) > 1:
+            result, shards = run_sharded_nmap(target, scan_type, ports, shards)
         else:
-            error_msg = result.stderr.strip() or "Unknown error"
-            logger.error(f"Nmap scan failed: {error_msg}")
-            return f"Nmap scan failed for {target}: {error_msg}"
-            
-    except subprocess.TimeoutExpired:
-        logger.error(f"Nmap scan timed out for {target}")
-        return f"Nmap scan timed out for {target}"
+            result = run_nmap_scan(target, scan_type, ports, targets=shards[0].targets if shards else None)
+            shards = []
+        wall_time = time.monotonic() - start
     except Exception as e:
         logger.error(f"Nmap scan error: {str(e)}")
         return f"Nmap scan error for {target}: {str(e)}"
+    
+    if not result.hosts:
+        if result.timed_out and not shards:
+            logger.error(f"Nmap scan timed out for {target}")
+            return f"Nmap scan timed out for {target}"
+        if result.errors:
+            logger.error(f"Nmap scan failed: {'; '.join(result.errors)}")
+            return f"Nmap scan failed for {target}: {'; '.join(result.errors)}"
+    
+    logger.info(f"Nmap scan completed successfully")
+    return result.to_table() + (format_shard_report(shards, wall_time) if shards else "")
+
+def _is_long_scan(scan_type: str, shards: List[NmapShard]) -> bool:
+    """Service detection and sharded scans can run for minutes"""
+    return scan_type == "service" or len(shards) > 1
 
 def nmap_scan_wrapper(input_str: str) -> str:
     """Wrapper function for nmap tool"""
@@ -79,7 +302,18 @@ def nmap_scan_wrapper(input_str: str) -> str:
         scan_type = parts[1] if len(parts) > 1 else "basic"
         ports = parts[2] if len(parts) > 2 else ""
         
-        return run_nmap(target, scan_type, ports)
+        if scan_type not in SCAN_OPTIONS:
+            return f"Error: Unknown scan type '{scan_type}'. Available: basic, port, service, stealth"
+        try:
+            # 計画は1回だけ立て、判定と実行の両方で使う
+            shards = plan_shards(target, scan_type, ports)
+        except ValueError as e:
+            return f"Error: {str(e)}"
+        
+        if BACKGROUND_JOBS and _is_long_scan(scan_type, shards):
+            # 長時間のスキャンはバックグラウンドジョブとして実行する
+            return run_in_background("nmap_scan", input_str.strip(), lambda: run_nmap(target, scan_type, ports, shards))
+        return run_nmap(target, scan_type, ports, shards)
     except Exception as e:
         return f"Error parsing nmap input: {str(e)}"
 
@@ -90,7 +324,7 @@ nmap_tool = Tool(
     Perform network port scanning using nmap.
     
     Usage: "target [scan_type] [ports]"
-    - target: Host or IP address to scan (required)
+    - target: Host, IP address, CIDR range or comma separated host list (required)
     - scan_type: basic, port, service, or stealth (default: basic)
     - ports: Specific ports like '22,80,443' or '1-1000' (for port scan)
     
@@ -99,6 +333,11 @@ nmap_tool = Tool(
     - "google.com service" - Service detection scan
     - "google.com port 80,443" - Scan specific ports
     - "192.168.1.1 stealth" - Stealth scan
+    - "192.168.1.0/24 port 1-10000" - Sharded scan (CIDR ranges, host lists and
+      large port ranges are split into chunks and scanned in parallel)
+    
+    Service and sharded scans run as background jobs and return a job ID;
+    use job_status to get the result.
     """,
     func=nmap_scan_wrapper
 ) 
\ No newline at end of file
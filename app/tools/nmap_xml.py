@@ -0,0 +1,221 @@
+"""
+Typed nmap result model and streaming XML parser
+
+nmap の `-oX -` 出力を iterparse で host 要素ごとに処理し、処理済みの
+要素は即座に破棄するので、大きな範囲のスキャンでも文書全体を保持しない。
+"""
+
+import ipaddress
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import IO, Dict, List, Optional
+
+
+@dataclass
+class NmapPort:
+    """A single scanned port"""
+    protocol: str
+    port: int
+    state: str
+    reason: str = ""
+    service: str = ""
+    product: str = ""
+    version: str = ""
+    extra_info: str = ""
+
+    @property
+    def service_label(self) -> str:
+        return " ".join(part for part in (self.product, self.version, self.extra_info) if part)
+
+
+@dataclass
+class NmapHost:
+    """A scanned host with its open/filtered ports"""
+    address: str
+    state: str = "unknown"
+    hostnames: List[str] = field(default_factory=list)
+    ports: List[NmapPort] = field(default_factory=list)
+    closed_ports: int = 0
+    os_matches: List[str] = field(default_factory=list)
+
+    @property
+    def open_ports(self) -> List[NmapPort]:
+        return [port for port in self.ports if port.state == "open"]
+
+
+@dataclass
+class NmapScanResult:
+    """Parsed result of one nmap run"""
+    target: str
+    command: str = ""
+    hosts: List[NmapHost] = field(default_factory=list)
+    start_time: Optional[int] = None
+    elapsed: Optional[float] = None
+    hosts_up: int = 0
+    hosts_down: int = 0
+    summary: str = ""
+    timed_out: bool = False
+    errors: List[str] = field(default_factory=list)
+
+    def to_table(self) -> str:
+        """Compact per-host port table for the agent"""
+        lines = [f"Nmap scan results for {self.target}:", ""]
+        if self.command:
+            lines.append(f"Command: {self.command}")
+        lines.append(
+            f"Hosts: {self.hosts_up} up, {self.hosts_down} down"
+            + (f" | Elapsed: {self.elapsed:.1f}s" if self.elapsed is not None else "")
+        )
+
+        for host in self.hosts:
+            if host.state != "up":
+                continue
+            names = f" ({', '.join(host.hostnames)})" if host.hostnames else ""
+            lines.append("")
+            lines.append(f"{host.address}{names}")
+            if host.ports:
+                lines.append("  PORT       STATE          SERVICE         VERSION")
+                for port in host.ports:
+                    lines.append(
+                        f"  {f'{port.port}/{port.protocol}':<10} {port.state:<14} "
+                        f"{port.service or '-':<15} {port.service_label or '-'}"
+                    )
+            if host.closed_ports:
+                lines.append(f"  ({host.closed_ports} closed ports not shown)")
+            if not host.ports and not host.closed_ports:
+                lines.append("  No ports reported")
+            if host.os_matches:
+                lines.append(f"  OS: {', '.join(host.os_matches[:3])}")
+
+        if self.timed_out:
+            lines.append("\n⚠️ Scan timed out (partial results shown)")
+        for error in self.errors:
+            lines.append(f"\n⚠️ {error}")
+        return "\n".join(lines)
+
+
+def merge_results(target: str, results: List[NmapScanResult]) -> NmapScanResult:
+    """Merge shard results, combining the ports of hosts scanned in several shards"""
+    merged = NmapScanResult(target=target)
+    hosts: Dict[str, NmapHost] = {}
+    down: Dict[str, int] = {}
+
+    for result in results:
+        # ポート分割されたシャードは同じホストを重複して数えるため、停止ホスト数は対象ごとに最大値を取る
+        down[result.target] = max(down.get(result.target, 0), result.hosts_down)
+        merged.timed_out = merged.timed_out or result.timed_out
+        merged.errors.extend(result.errors)
+        for host in result.hosts:
+            existing = hosts.get(host.address)
+            if existing is None:
+                hosts[host.address] = NmapHost(host.address, host.state, list(host.hostnames), list(host.ports),
+                                               host.closed_ports, list(host.os_matches))
+                continue
+            if host.state == "up":
+                existing.state = "up"
+            existing.hostnames.extend(name for name in host.hostnames if name not in existing.hostnames)
+            existing.ports.extend(host.ports)
+            existing.closed_ports += host.closed_ports
+            existing.os_matches = existing.os_matches or list(host.os_matches)
+
+    for host in hosts.values():
+        host.ports.sort(key=lambda port: (port.protocol, port.port))
+    merged.hosts = sorted(hosts.values(), key=_address_key)
+    merged.hosts_up = sum(1 for host in merged.hosts if host.state == "up")
+    merged.hosts_down = sum(down.values())
+    return merged
+
+
+def _address_key(host: NmapHost):
+    try:
+        address = ipaddress.ip_address(host.address)
+        return (address.version, int(address), "")
+    except ValueError:
+        return (7, 0, host.address)
+
+
+def _parse_host(element: ET.Element) -> NmapHost:
+    address = ""
+    for addr in element.findall("address"):
+        # IPv4/IPv6 を MAC アドレスより優先する
+        if addr.get("addrtype") in ("ipv4", "ipv6") or not address:
+            address = addr.get("addr", "")
+
+    status = element.find("status")
+    host = NmapHost(address=address, state=status.get("state", "unknown") if status is not None else "unknown")
+    host.hostnames = [name.get("name", "") for name in element.findall("hostnames/hostname") if name.get("name")]
+
+    ports = element.find("ports")
+    if ports is not None:
+        for extra in ports.findall("extraports"):
+            if extra.get("state") == "closed":
+                host.closed_ports += int(extra.get("count", 0))
+        for port in ports.findall("port"):
+            state = port.find("state")
+            service = port.find("service")
+            port_state = state.get("state", "") if state is not None else ""
+            if port_state == "closed":
+                host.closed_ports += 1
+                continue
+            host.ports.append(NmapPort(
+                protocol=port.get("protocol", ""),
+                port=int(port.get("portid", 0)),
+                state=port_state,
+                reason=state.get("reason", "") if state is not None else "",
+                service=service.get("name", "") if service is not None else "",
+                product=service.get("product", "") if service is not None else "",
+                version=service.get("version", "") if service is not None else "",
+                extra_info=service.get("extrainfo", "") if service is not None else "",
+            ))
+
+    host.os_matches = [match.get("name", "") for match in element.findall("os/osmatch")]
+    return host
+
+
+def parse_nmap_xml(source: IO, target: str = "") -> NmapScanResult:
+    """Parse nmap XML from a file object, one <host> element at a time
+
+    Truncated output (e.g. a killed scan) yields the hosts read so far
+    plus an error entry instead of raising; the host counts are then
+    taken from those hosts.
+    """
+    result = NmapScanResult(target=target)
+    root = None
+    counted = False
+
+    try:
+        for event, element in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                    result.command = element.get("args", "")
+                    if element.get("start"):
+                        result.start_time = int(element.get("start"))
+                continue
+
+            if element.tag == "host":
+                result.hosts.append(_parse_host(element))
+                # 解析済みの host 要素をルートから外してメモリを解放する
+                element.clear()
+                try:
+                    root.remove(element)
+                except ValueError:
+                    pass
+            elif element.tag == "finished":
+                result.summary = element.get("summary", "")
+                if element.get("elapsed"):
+                    result.elapsed = float(element.get("elapsed"))
+                if element.get("exit") == "error" and element.get("errormsg"):
+                    result.errors.append(element.get("errormsg"))
+            elif element.tag == "hosts":
+                result.hosts_up = int(element.get("up", 0))
+                result.hosts_down = int(element.get("down", 0))
+                counted = True
+    except ET.ParseError as e:
+        result.errors.append(f"Incomplete nmap XML output: {e}")
+
+    if not counted:
+        # 途中で止まったスキャンには runstats が無いので、読めたホストから数える
+        result.hosts_up = sum(1 for host in result.hosts if host.state == "up")
+        result.hosts_down = sum(1 for host in result.hosts if host.state == "down")
+    return result
@@ -3,9 +3,10 @@ Ping Tool for LangChain Agent using nping
 """
 
 from langchain.tools import Tool
-import subprocess
 import logging
 
+from .process_executor import process_executor
+
 logger = logging.getLogger(__name__)
 
 def run_ping(target: str, count: int = 4) -> str:
@@ -17,14 +18,11 @@ def run_ping(target: str, count: int = 4) -> str:
         # Use nping instead of ping
         cmd = ["nping", "--icmp", "-c", str(count), target]
         
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            timeout=30,  # 30 seconds timeout
-            cwd=None
-        )
+        result = process_executor.run(cmd, timeout=30)  # 30 seconds timeout
         
+        if result.timed_out:
+            logger.error(f"Ping timed out for {target}")
+            return f"Ping timed out for {target}"
         if result.returncode == 0:
             output = result.stdout.strip()
             logger.info(f"Ping completed successfully for {target}")
@@ -34,9 +32,6 @@ def run_ping(target: str, count: int = 4) -> str:
             logger.error(f"Ping failed: {error_msg}")
             return f"Ping failed for {target}: {error_msg}"
             
-    except subprocess.TimeoutExpired:
-        logger.error(f"Ping timed out for {target}")
-        return f"Ping timed out for {target}"
     except Exception as e:
         logger.error(f"Ping error: {str(e)}")
         return f"Ping error for {target}: {str(e)}"
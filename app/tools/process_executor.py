@@ -0,0 +1,292 @@
+"""
+Shared subprocess executor for CLI-backed tools
+
+全ツールの外部プロセスをここで起動し、全体とバイナリごとの同時実行数を
+制限する。タイムアウト時はプロセスグループごと停止するので、sh -c や
+nmap が生成した子プロセスも残らない。
+"""
+
+import os
+import time
+import signal
+import asyncio
+import threading
+import subprocess
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# SIGTERM から SIGKILL までの猶予秒数
+KILL_GRACE = 2.0
+# 取り消しを確認する間隔（秒）
+CANCEL_POLL = 0.2
+
+
+# 呼び出し元が設定する取り消しイベント。cancel を渡さない spawn() もこれに従う
+_current_cancel: ContextVar[Optional[threading.Event]] = ContextVar("process_cancel", default=None)
+
+
+class ProcessCancelled(Exception):
+    """Raised when a command is cancelled before it could start"""
+
+
+@contextmanager
+def cancel_scope(cancel: threading.Event) -> Iterator[None]:
+    """Cancel the processes spawned in this context when the event is set"""
+    token = _current_cancel.set(cancel)
+    try:
+        yield
+    finally:
+        _current_cancel.reset(token)
+
+
+def _parse_limits(value: str) -> Dict[str, int]:
+    """'nmap=4,sqlmap=1' -> {'nmap': 4, 'sqlmap': 1}"""
+    limits = {}
+    for item in value.split(","):
+        name, _, limit = item.partition("=")
+        if name.strip() and limit.strip().isdigit():
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+@dataclass
+class ProcessResult:
+    """Outcome of one executed command"""
+    args: List[str]
+    returncode: Optional[int]
+    stdout: str
+    stderr: str
+    timed_out: bool = False
+    queue_wait: float = 0.0
+    run_time: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out
+
+
+class RunningProcess:
+    """Handle yielded by ProcessExecutor.spawn()"""
+
+    def __init__(self, process: subprocess.Popen, queue_wait: float):
+        self.process = process
+        self.queue_wait = queue_wait
+        self.started = time.monotonic()
+        self._timed_out = threading.Event()
+
+    @property
+    def timed_out(self) -> bool:
+        return self._timed_out.is_set()
+
+    @property
+    def run_time(self) -> float:
+        return time.monotonic() - self.started
+
+    def kill(self, timed_out: bool = False):
+        """Terminate the whole process group, escalating to SIGKILL"""
+        if timed_out:
+            self._timed_out.set()
+        if self.process.poll() is not None:
+            return
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout=KILL_GRACE)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class _BinaryStats:
+    """Counters for a single binary"""
+
+    __slots__ = ("calls", "running", "queued", "timeouts", "failures", "total_wait", "max_wait", "total_run", "max_run")
+
+    def __init__(self):
+        self.calls = 0
+        self.running = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        self.max_run = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "running": self.running,
+            "queued": self.queued,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "avg_wait_ms": round(self.total_wait / self.calls * 1000, 1) if self.calls else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "avg_run_ms": round(self.total_run / self.calls * 1000, 1) if self.calls else 0.0,
+            "max_run_ms": round(self.max_run * 1000, 1),
+        }
+
+
+class ProcessExecutor:
+    """Runs commands under a global and per-binary concurrency cap"""
+
+    def __init__(self, max_processes: int = 8, binary_limits: Optional[Dict[str, int]] = None):
+        self.max_processes = max_processes
+        self.binary_limits = binary_limits or {}
+
+        self._global = threading.BoundedSemaphore(max_processes)
+        self._lock = threading.Lock()
+        self._binary_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._stats: Dict[str, _BinaryStats] = {}
+
+    def _slots(self, binary: str):
+        with self._lock:
+            if binary not in self._binary_semaphores:
+                limit = min(self.binary_limits.get(binary, self.max_processes), self.max_processes)
+                self._binary_semaphores[binary] = threading.BoundedSemaphore(limit)
+                self._stats[binary] = _BinaryStats()
+            return self._binary_semaphores[binary], self._stats[binary]
+
+    @staticmethod
+    def _acquire(semaphore: threading.BoundedSemaphore, cancel: Optional[threading.Event]):
+        if cancel is None:
+            semaphore.acquire()
+            return
+        while not semaphore.acquire(timeout=CANCEL_POLL):
+            if cancel.is_set():
+                raise ProcessCancelled("Cancelled while waiting for a process slot")
+
+    def _reserve(self, binary_slot: threading.BoundedSemaphore, cancel: Optional[threading.Event]):
+        """Take the binary slot, then a global slot (raises ProcessCancelled holding neither)"""
+        # バイナリ枠を先に確保し、全体枠を特定バイナリの待ちで塞がないようにする
+        self._acquire(binary_slot, cancel)
+        try:
+            self._acquire(self._global, cancel)
+            if cancel is not None and cancel.is_set():
+                self._global.release()
+                raise ProcessCancelled("Cancelled while waiting for a process slot")
+        except ProcessCancelled:
+            binary_slot.release()
+            raise
+
+    @staticmethod
+    def _watch_cancel(handle: RunningProcess, cancel: threading.Event):
+        # 取り消されたら実行中のプロセスグループを停止する
+        while handle.process.poll() is None:
+            if cancel.wait(CANCEL_POLL):
+                handle.kill()
+                return
+
+    @contextmanager
+    def spawn(self, args: Sequence[str], timeout: Optional[float] = None, binary: Optional[str] = None,
+              cancel: Optional[threading.Event] = None, **popen_kwargs) -> Iterator[RunningProcess]:
+        """Start a process once slots are free and kill its group after `timeout`
+
+        The caller reads from ``handle.process`` (e.g. a streaming stdout) and
+        the process is reaped and its slots released when the block exits.
+        The timeout counts from the start of the process, not the queue wait.
+        Setting `cancel` (or the event of an enclosing cancel_scope) gives up
+        a queued place (ProcessCancelled) or kills the running process group.
+        """
+        if cancel is None:
+            cancel = _current_cancel.get()
+        args = list(args)
+        binary = binary or os.path.basename(args[0])
+        binary_slot, stats = self._slots(binary)
+
+        queued_at = time.monotonic()
+        with self._lock:
+            stats.queued += 1
+        try:
+            self._reserve(binary_slot, cancel)
+        finally:
+            with self._lock:
+                stats.queued -= 1
+        queue_wait = time.monotonic() - queued_at
+        with self._lock:
+            stats.running += 1
+
+        handle = None
+        timer = None
+        try:
+            process = subprocess.Popen(args, start_new_session=True, **popen_kwargs)
+            handle = RunningProcess(process, queue_wait)
+            if timeout:
+                timer = threading.Timer(timeout, handle.kill, kwargs={"timed_out": True})
+                timer.daemon = True
+                timer.start()
+            if cancel is not None:
+                threading.Thread(target=self._watch_cancel, args=(handle, cancel), daemon=True).start()
+            yield handle
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if handle is not None:
+                if handle.process.poll() is None and not handle.timed_out:
+                    handle.kill()
+                handle.process.wait()
+            self._global.release()
+            binary_slot.release()
+
+            run_time = handle.run_time if handle else 0.0
+            with self._lock:
+                stats.running -= 1
+                stats.calls += 1
+                stats.total_wait += queue_wait
+                stats.max_wait = max(stats.max_wait, queue_wait)
+                stats.total_run += run_time
+                stats.max_run = max(stats.max_run, run_time)
+                if handle is not None and handle.timed_out:
+                    stats.timeouts += 1
+                elif handle is None or handle.process.returncode != 0:
+                    stats.failures += 1
+            logger.debug(f"{binary}: waited {queue_wait * 1000:.0f} ms, ran {run_time * 1000:.0f} ms")
+
+    def run(self, args: Sequence[str], timeout: Optional[float] = None, binary: Optional[str] = None,
+            input: Optional[str] = None, cancel: Optional[threading.Event] = None) -> ProcessResult:
+        """Run a command to completion and capture its output (never raises on timeout)"""
+        with self.spawn(args, timeout, binary, cancel, stdin=subprocess.PIPE if input is not None else None,
+                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                        errors="replace") as handle:
+            stdout, stderr = handle.process.communicate(input)
+        return ProcessResult(
+            args=list(args),
+            returncode=handle.process.returncode,
+            stdout=stdout or "",
+            stderr=stderr or "",
+            timed_out=handle.timed_out,
+            queue_wait=handle.queue_wait,
+            run_time=handle.run_time,
+        )
+
+    async def run_async(self, args: Sequence[str], timeout: Optional[float] = None, binary: Optional[str] = None,
+                        input: Optional[str] = None) -> ProcessResult:
+        """asyncio entry point sharing the same limits as run()
+
+        Cancelling the awaiting task gives up the queued place or kills the
+        process, so the worker thread is freed promptly.
+        """
+        cancel = threading.Event()
+        try:
+            # 上限はスレッドとイベントループをまたいで共有するため、待機と実行はワーカースレッドで行う
+            return await asyncio.to_thread(self.run, args, timeout, binary, input, cancel)
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-binary queue wait / run time statistics"""
+        with self._lock:
+            return {binary: stats.to_dict() for binary, stats in self._stats.items()}
+
+
+process_executor = ProcessExecutor(
+    max_processes=int(os.getenv("PROCESS_MAX_CONCURRENCY", "8")),
+    binary_limits=_parse_limits(os.getenv("PROCESS_BINARY_LIMITS", "nmap=4,nikto=2,sqlmap=2,nping=4,whois=4")),
+)
@@ -0,0 +1,194 @@
+"""
+Subdomain extraction from Certificate Transparency records
+
+crt.sh の name_value には大文字・末尾のドット・ワイルドカード・メールアドレスが
+混在し、同じ証明書がプレ証明書と本証明書の2件として返る。名前を正規化し、
+ワイルドカードは親ドメインのフラグにまとめ、証明書はシリアル番号で重複を除く。
+ラベルを逆順にしたキーのソート済みリストを索引として、あるドメイン配下の
+名前の取り出しとラベルの深さごとのグループ化を行う。
+"""
+
+import os
+import re
+import bisect
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 保持する名前の上限（超えた分は件数だけ数える）
+SUBDOMAIN_MAX_NAMES = int(os.getenv("CT_SUBDOMAIN_MAX_NAMES", "200000"))
+
+# 名前のフラグ: 名前そのものが現れた / "*.名前" として現れた
+HOST = 1
+WILDCARD = 2
+
+_INVALID_CHARS = re.compile(r'[^a-z0-9._-]')
+
+
+def normalize_name(name: str) -> Tuple[Optional[str], bool]:
+    """(host name, wildcard) of a certificate name; the host is None if it is not a DNS name"""
+    name = name.strip().lower().rstrip('.')
+    wildcard = name.startswith('*.')
+    if wildcard:
+        name = name[2:]
+    # メールアドレス・IP 以外の記号・空ラベル・単一ラベルは除外する
+    if (not name or len(name) > 253 or '.' not in name or '..' in name
+            or name[0] in '.-' or _INVALID_CHARS.search(name)):
+        return None, False
+    return name, wildcard
+
+
+def reverse_labels(name: str) -> str:
+    """www.example.com -> com.example.www (sorting groups each subtree together)"""
+    return '.'.join(reversed(name.split('.')))
+
+
+def certificate_key(cert: Dict[str, Any]) -> Optional[int]:
+    """Identity shared by a precertificate and its leaf (issuer + serial, else the crt.sh id)"""
+    serial = cert.get('serial_number')
+    if serial:
+        return hash((cert.get('issuer_name'), serial.lower().lstrip('0')))
+    cert_id = cert.get('id')
+    return hash(('id', cert_id)) if cert_id is not None else None
+
+
+class SubdomainIndex:
+    """Deduplicated host names from CT records with a reversed-label suffix index"""
+
+    def __init__(self, max_names: int = SUBDOMAIN_MAX_NAMES):
+        self.max_names = max_names
+        self.duplicates = 0
+        self.dropped = 0
+        # 名前 -> HOST / WILDCARD フラグ
+        self._names: Dict[str, int] = {}
+        # 証明書キーはハッシュ値だけを保持する
+        self._seen_certs: Set[int] = set()
+        # 逆順ラベルのキーと、同じ順に並べた名前
+        self._sorted_keys: Optional[List[str]] = None
+        self._tree_names: List[str] = []
+
+    def add(self, name: str) -> bool:
+        """Add one certificate name; False if it is not a usable host name"""
+        host, wildcard = normalize_name(name)
+        if host is None:
+            return False
+        flag = WILDCARD if wildcard else HOST
+        flags = self._names.get(host)
+        if flags is None:
+            if len(self._names) >= self.max_names:
+                self.dropped += 1
+                return False
+            self._names[host] = flag
+            self._sorted_keys = None
+        elif not flags & flag:
+            self._names[host] = flags | flag
+        return True
+
+    def add_names(self, names: Iterable[str]):
+        for name in names:
+            self.add(name)
+
+    def add_certificate(self, cert: Dict[str, Any]) -> bool:
+        """Add the names of a crt.sh record; False if the certificate was already seen"""
+        key = certificate_key(cert)
+        if key is not None:
+            if key in self._seen_certs:
+                self.duplicates += 1
+                return False
+            self._seen_certs.add(key)
+
+        common_name = cert.get('common_name')
+        if common_name:
+            self.add(common_name)
+        name_value = cert.get('name_value')
+        if name_value:
+            for name in name_value.split('\n'):
+                self.add(name)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.hosts())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._names
+
+    def hosts(self) -> List[str]:
+        """All names (wildcard parents included), sorted"""
+        return sorted(self._names)
+
+    def wildcards(self) -> List[str]:
+        """Parents of the wildcard names (example.com for *.example.com), sorted"""
+        return sorted(name for name, flags in self._names.items() if flags & WILDCARD)
+
+    def is_wildcard(self, name: str) -> bool:
+        return bool(self._names.get(name, 0) & WILDCARD)
+
+    def label(self, name: str) -> str:
+        """Display form: "*.x" for wildcard-only names, "x, *.x" when both were seen"""
+        flags = self._names.get(name, HOST)
+        if not flags & WILDCARD:
+            return name
+        return f"*.{name}" if not flags & HOST else f"{name}, *.{name}"
+
+    def covered_by_wildcard(self, name: str) -> bool:
+        """Whether a *.parent name already covers this name"""
+        parent = name.partition('.')[2]
+        return bool(self._names.get(parent, 0) & WILDCARD)
+
+    def _subtree(self, suffix: str) -> Tuple[List[str], int, int]:
+        """(names in tree order, start, end) of the names strictly below suffix"""
+        # 追加が終わってから最初の検索時にだけ並べ替える
+        if self._sorted_keys is None:
+            pairs = sorted((reverse_labels(name), name) for name in self._names)
+            self._sorted_keys = [key for key, _ in pairs]
+            self._tree_names = [name for _, name in pairs]
+        keys = self._sorted_keys
+        base = reverse_labels(suffix)
+        # "com.example." で始まるキーは "com.example/" の直前までに並ぶ
+        start = bisect.bisect_left(keys, base + '.')
+        end = bisect.bisect_left(keys, base + '/', start)
+        return self._tree_names, start, end
+
+    def under(self, suffix: str) -> List[str]:
+        """The suffix itself and every name below it, in tree order"""
+        suffix = suffix.strip().lower().rstrip('.')
+        names, start, end = self._subtree(suffix)
+        return ([suffix] if suffix in self._names else []) + names[start:end]
+
+    def by_depth(self, apex: str) -> Dict[int, List[str]]:
+        """Names under apex grouped by the number of labels below it (0 = apex itself)"""
+        apex = apex.strip().lower().rstrip('.')
+        apex_labels = apex.count('.')
+        groups: Dict[int, List[str]] = {}
+        for name in self.under(apex):
+            groups.setdefault(name.count('.') - apex_labels, []).append(name)
+        for names in groups.values():
+            names.sort()
+        return dict(sorted(groups.items()))
+
+    def outside(self, apex: str) -> List[str]:
+        """Names that are not under apex (other domains sharing the certificates), sorted"""
+        apex = apex.strip().lower().rstrip('.')
+        names, start, end = self._subtree(apex)
+        return sorted(name for name in names[:start] + names[end:] if name != apex)
+
+    def to_list(self) -> List[str]:
+        """Names as certificate names ("*.x" for wildcards), for serialisation"""
+        entries = []
+        for name in self.hosts():
+            flags = self._names[name]
+            if flags & HOST:
+                entries.append(name)
+            if flags & WILDCARD:
+                entries.append(f"*.{name}")
+        return entries
+
+    @classmethod
+    def from_list(cls, entries: Iterable[str], max_names: int = SUBDOMAIN_MAX_NAMES) -> "SubdomainIndex":
+        index = cls(max_names)
+        index.add_names(entries)
+        return index
@@ -0,0 +1,192 @@
+"""
+Paginated Wayback Machine CDX client
+
+CDX の結果を showResumeKey（または page）でページ送りしながら取得し、
+行をそのまま集計器に流し込む。行数・時間の予算を超えた時点で停止し、
+再開用のキーを残す。
+"""
+
+import os
+import time
+import heapq
+import logging
+import requests
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from utils.json_stream import iter_json_array
+from .http_client import http_client
+
+logger = logging.getLogger(__name__)
+
+CDX_URL = "https://web.archive.org/cdx/search/cdx"
+CDX_FIELDS = ("timestamp", "original", "mimetype", "statuscode")
+CDX_TIMEOUT = int(os.getenv("WAYBACK_TIMEOUT", "30"))
+CDX_PAGE_SIZE = int(os.getenv("WAYBACK_PAGE_SIZE", "5000"))
+CDX_ROW_BUDGET = int(os.getenv("WAYBACK_ROW_BUDGET", "50000"))
+CDX_TIME_BUDGET = float(os.getenv("WAYBACK_TIME_BUDGET", "45"))
+CDX_COLLAPSE = os.getenv("WAYBACK_COLLAPSE", "digest")
+CDX_MATCH_TYPE = os.getenv("WAYBACK_MATCH_TYPE", "domain")
+
+# 直近のアーカイブとして保持する件数（タイムラインの最新20件に対応）
+RECENT_KEEP = 20
+
+
+class WaybackAggregate:
+    """Histograms and boundary rows built while CDX rows stream in"""
+
+    def __init__(self, query: str):
+        self.query = query
+        self.total = 0
+        self.years: Counter = Counter()
+        self.status_codes: Counter = Counter()
+        self.hosts: Counter = Counter()
+        self.first_row: Optional[List[str]] = None
+        self.last_row: Optional[List[str]] = None
+        self.pages = 0
+        self.resume_key: Optional[str] = None
+        self.stop_reason: Optional[str] = None
+        self._recent: List = []
+
+    def add(self, row: List[str]):
+        """Fold a single [timestamp, original, mimetype, statuscode] row"""
+        timestamp = row[0]
+        self.total += 1
+        self.years[timestamp[:4]] += 1
+        self.status_codes[row[3] if len(row) > 3 else 'N/A'] += 1
+        self.hosts[urlsplit(row[1]).hostname or row[1]] += 1
+
+        # matchType=domain の結果は urlkey 順なので時刻の最小・最大は別途追跡する
+        if self.first_row is None or timestamp < self.first_row[0]:
+            self.first_row = row
+        if self.last_row is None or timestamp >= self.last_row[0]:
+            self.last_row = row
+
+        item = (timestamp, self.total, row)
+        if len(self._recent) < RECENT_KEEP:
+            heapq.heappush(self._recent, item)
+        elif item > self._recent[0]:
+            heapq.heapreplace(self._recent, item)
+
+    @property
+    def recent(self) -> List[List[str]]:
+        """Most recent rows, oldest first"""
+        return [row for _, _, row in sorted(self._recent)]
+
+    @property
+    def complete(self) -> bool:
+        return self.stop_reason is None
+
+    def __len__(self) -> int:
+        return self.total
+
+
+def _iter_page_rows(params: Dict[str, Any], state: Dict[str, Any]) -> Iterator[List[str]]:
+    """Stream the data rows of one CDX page, capturing a trailing resume key"""
+    response = http_client.get(CDX_URL, params=params, timeout=CDX_TIMEOUT, stream=True)
+    try:
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(f"CDX HTTP {response.status_code}")
+
+        expect_resume_key = False
+        for index, row in enumerate(iter_json_array(response.iter_content(chunk_size=64 * 1024))):
+            if expect_resume_key:
+                state["resume_key"] = row[0] if row else None
+                break
+            if index == 0 and row and row[0] == CDX_FIELDS[0]:
+                continue  # ヘッダー行
+            if not row:
+                # 空行の次が再開キー
+                expect_resume_key = True
+                continue
+            yield row
+    finally:
+        response.close()
+
+
+def fetch_cdx(
+    url: str,
+    match_type: str = CDX_MATCH_TYPE,
+    collapse: Optional[str] = CDX_COLLAPSE,
+    row_budget: int = CDX_ROW_BUDGET,
+    time_budget: float = CDX_TIME_BUDGET,
+    page_size: int = CDX_PAGE_SIZE,
+    resume_key: Optional[str] = None,
+    use_pages: bool = False,
+    aggregate: Optional[WaybackAggregate] = None,
+) -> WaybackAggregate:
+    """Fetch CDX rows page by page into a WaybackAggregate
+
+    Budgets are checked at page boundaries, so when one runs out the
+    aggregate carries an exact resume key (or next page number). Pass the
+    previous aggregate together with its resume key to continue it.
+    """
+    if aggregate is None:
+        aggregate = WaybackAggregate(url)
+    aggregate.stop_reason = None
+    if aggregate.total >= row_budget:
+        # 再開した集計が既に予算を使い切っている場合は要求せず、再開キーをそのまま返す
+        aggregate.stop_reason = "row_budget"
+        aggregate.resume_key = resume_key
+        return aggregate
+    base_params = {"url": url, "output": "json", "fl": ",".join(CDX_FIELDS)}
+    if match_type:
+        base_params["matchType"] = match_type
+    if collapse:
+        base_params["collapse"] = collapse
+
+    deadline = time.monotonic() + time_budget
+    page = 0
+    total_pages = None
+    if use_pages:
+        response = http_client.get(CDX_URL, params={**base_params, "showNumPages": "true"}, timeout=CDX_TIMEOUT)
+        if response.status_code != 200:
+            raise requests.exceptions.HTTPError(f"CDX HTTP {response.status_code}")
+        text = response.text.strip()
+        # 混雑時などに HTML のエラーページが 200 で返ることがある
+        if text and not text.isdigit():
+            raise requests.exceptions.HTTPError(f"CDX page count is not a number: {text[:80]!r}")
+        total_pages = int(text or 0)
+        page = int(resume_key or 0)
+
+    while True:
+        params = dict(base_params)
+        if use_pages:
+            if page >= total_pages:
+                break
+            params["page"] = page
+        else:
+            # 予算の残りだけ要求し、ページ境界で止まるようにして再開キーを正確に保つ
+            params.update({"limit": min(page_size, row_budget - aggregate.total), "showResumeKey": "true"})
+            if resume_key:
+                params["resumeKey"] = resume_key
+
+        state = {"resume_key": None}
+        for row in _iter_page_rows(params, state):
+            aggregate.add(row)
+        aggregate.pages += 1
+
+        if use_pages:
+            page += 1
+            resume_key = str(page) if page < total_pages else None
+        else:
+            resume_key = state["resume_key"]
+        aggregate.resume_key = resume_key
+
+        if not resume_key:
+            break
+        if aggregate.total >= row_budget:
+            aggregate.stop_reason = "row_budget"
+            break
+        if time.monotonic() > deadline:
+            aggregate.stop_reason = "time_budget"
+            break
+
+    if aggregate.stop_reason is None:
+        aggregate.resume_key = None
+    logger.info(
+        f"CDX {url}: {aggregate.total} rows in {aggregate.pages} pages"
+        + (f" (stopped: {aggregate.stop_reason})" if aggregate.stop_reason else "")
+    )
+    return aggregate
@@ -1,9 +1,18 @@
+import os
 import json
+import contextvars
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Tuple
 import traceback
 
+from .crtsh import get_certificates, CertificateDataset
+from .wayback_cdx import fetch_cdx, WaybackAggregate
+
+# 1回の調査でリモート取得を待つ最大秒数（最も遅いソースの待ち時間）
+FETCH_TIMEOUT = float(os.getenv("WEB_HISTORY_FETCH_TIMEOUT", "60"))
+
 def web_history_lookup(domain: str, query_type: str = "COMPREHENSIVE") -> str:
     """
     Web履歴調査を実行する関数
@@ -38,16 +47,55 @@ def web_history_lookup(domain: str, query_type: str = "COMPREHENSIVE") -> str:
     except Exception as e:
         return f"Web履歴調査エラー: {str(e)}\n{traceback.format_exc()}"
 
+def _fetch_sources(fetchers: Dict[str, Callable[[], Any]]) -> Tuple[Dict[str, Any], List[str]]:
+    """リモートデータを並行取得する
+
+    全ソースを同時に取得するため、待ち時間は最も遅いソース1件分になる。
+    タイムアウトや例外になったソースはNoneとして返す。
+    """
+    results = {name: None for name in fetchers}
+    executor = ThreadPoolExecutor(max_workers=len(fetchers), thread_name_prefix="web-history")
+    try:
+        # REFRESH によるキャッシュ迂回を取得スレッドにも引き継ぐ
+        futures = {executor.submit(contextvars.copy_context().run, fetch): name for name, fetch in fetchers.items()}
+        done, not_done = wait(futures, timeout=FETCH_TIMEOUT)
+        
+        for future in done:
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                print(f"{futures[future]} 取得エラー: {e}")
+        
+        timed_out = [futures[future] for future in not_done]
+    finally:
+        # タイムアウトしたスレッドは待たずに部分結果を返す
+        executor.shutdown(wait=False)
+    
+    return results, timed_out
+
+def _format_timeout_notice(timed_out: List[str]) -> str:
+    """タイムアウトしたソースの注記"""
+    if not timed_out:
+        return ""
+    return f"⚠️ タイムアウトにより取得できなかったソース: {', '.join(timed_out)}\n\n"
+
 def _comprehensive_analysis(domain: str) -> str:
     """包括的な分析を実行"""
     result = f"=== {domain} 包括的Web履歴調査 ===\n\n"
     
+    sources, timed_out = _fetch_sources({
+        "Certificate Transparency": lambda: _get_certificate_data(domain),
+        "Wayback Machine": lambda: _get_wayback_data(domain),
+    })
+    cert_data = sources["Certificate Transparency"]
+    archive_data = sources["Wayback Machine"]
+    result += _format_timeout_notice(timed_out)
+    
     # Certificate Transparency分析
     result += "🔐 Certificate Transparency分析\n"
     result += "=" * 50 + "\n"
-    cert_data = _get_certificate_data(domain)
     if cert_data:
-        result += _format_certificate_analysis(cert_data)
+        result += _format_certificate_analysis(cert_data, domain)
     else:
         result += "証明書データが見つかりませんでした\n"
     result += "\n"
@@ -55,7 +103,6 @@ def _comprehensive_analysis(domain: str) -> str:
     # Wayback Machine分析
     result += "🌐 Wayback Machine履歴分析\n"
     result += "=" * 50 + "\n"
-    archive_data = _get_wayback_data(domain)
     if archive_data:
         result += _format_wayback_analysis(archive_data)
     else:
@@ -82,19 +129,21 @@ def _web_archive_analysis(domain: str) -> str:
     """Wayback Machine専用分析"""
     result = f"=== {domain} Wayback Machine履歴調査 ===\n\n"
     
-    # メインドメインとwwwサブドメインの両方を調査
-    domains_to_check = [domain, f"www.{domain}"]
+    # matchType=domain の1クエリでメインドメインと全サブドメインを調査
+    sources, timed_out = _fetch_sources({
+        "Wayback Machine": lambda: _get_wayback_data(domain),
+    })
+    result += _format_timeout_notice(timed_out)
     
-    for check_domain in domains_to_check:
-        result += f"📋 {check_domain} のアーカイブ履歴\n"
-        result += "-" * 40 + "\n"
-        
-        archive_data = _get_wayback_data(check_domain)
-        if archive_data:
-            result += _format_wayback_analysis(archive_data)
-        else:
-            result += f"{check_domain} のアーカイブが見つかりませんでした\n"
-        result += "\n"
+    result += f"📋 {domain} および全サブドメインのアーカイブ履歴\n"
+    result += "-" * 40 + "\n"
+    
+    archive_data = sources["Wayback Machine"]
+    if archive_data:
+        result += _format_wayback_analysis(archive_data)
+    else:
+        result += f"{domain} のアーカイブが見つかりませんでした\n"
+    result += "\n"
     
     return result
 
@@ -104,7 +153,7 @@ def _certificate_analysis(domain: str) -> str:
     
     cert_data = _get_certificate_data(domain)
     if cert_data:
-        result += _format_certificate_analysis(cert_data)
+        result += _format_certificate_analysis(cert_data, domain)
         result += "\n"
         result += _format_technical_analysis(cert_data)
     else:
@@ -128,182 +177,161 @@ def _domain_timeline(domain: str) -> str:
     """ドメインタイムライン専用分析"""
     result = f"=== {domain} ドメインタイムライン ===\n\n"
     
-    cert_data = _get_certificate_data(domain)
-    archive_data = _get_wayback_data(domain)
+    sources, timed_out = _fetch_sources({
+        "Certificate Transparency": lambda: _get_certificate_data(domain),
+        "Wayback Machine": lambda: _get_wayback_data(domain),
+    })
+    result += _format_timeout_notice(timed_out)
     
-    result += _format_timeline_analysis(cert_data, archive_data)
+    result += _format_timeline_analysis(sources["Certificate Transparency"], sources["Wayback Machine"])
     
     return result
 
-def _get_certificate_data(domain: str) -> Optional[List[Dict]]:
+def _get_certificate_data(domain: str) -> Optional[CertificateDataset]:
     """Certificate Transparencyデータを取得"""
     try:
-        url = f'https://crt.sh/?q={domain}&output=json'
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if isinstance(data, list) and len(data) > 0:
-                return data
+        data = get_certificates(domain)
+        if data.total > 0:
+            return data
     except Exception as e:
         print(f"Certificate Transparency取得エラー: {e}")
     
     return None
 
-def _get_wayback_data(domain: str) -> Optional[List[List]]:
+def _get_wayback_data(domain: str) -> Optional[WaybackAggregate]:
     """Wayback Machineデータを取得"""
     try:
-        url = f'https://web.archive.org/cdx/search/cdx?url={domain}&output=json&limit=50'
-        response = requests.get(url, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if isinstance(data, list) and len(data) > 1:  # ヘッダー行を除く
-                return data
+        data = fetch_cdx(domain)
+        if data.total > 0:
+            return data
     except Exception as e:
         print(f"Wayback Machine取得エラー: {e}")
     
     return None
 
-def _format_certificate_analysis(cert_data: List[Dict]) -> str:
+def _format_certificate_analysis(cert_data: CertificateDataset, domain: str) -> str:
     """証明書分析結果をフォーマット"""
-    result = f"総証明書数: {len(cert_data)}件\n\n"
-    
-    # 証明書を日付順にソート
-    sorted_certs = sorted(cert_data, key=lambda x: x.get('not_before', ''))
+    result = f"総証明書数: {cert_data.total}件\n"
+    if cert_data.duplicates:
+        result += f"  (プレ証明書などの重複 {cert_data.duplicates}件を除外)\n"
+    # 集計はストリーミング時に全件分を構築済み
+    if cert_data.truncated:
+        result += f"  (詳細分析は最新 {cert_data.retained}件を対象)\n"
+    # キャッシュから復元したデータには解析時の計測値がない
+    if cert_data.parse_memory_mb is not None:
+        result += f"  解析時のメモリ増加: {cert_data.parse_memory_mb:.1f} MB\n"
+    result += "\n"
     
     # 最初と最後の証明書
-    if sorted_certs:
-        first_cert = sorted_certs[0]
-        last_cert = sorted_certs[-1]
-        
+    first_cert, last_cert = cert_data.boundaries
+    if first_cert and last_cert:
         result += "🔍 証明書の使用期間\n"
-        result += f"  最初の証明書: {first_cert.get('not_before', 'N/A')}\n"
-        result += f"  最新の証明書: {last_cert.get('not_before', 'N/A')}\n"
-        result += f"  最新の有効期限: {last_cert.get('not_after', 'N/A')}\n\n"
+        result += f"  最初の証明書: {first_cert.not_before_text or 'N/A'}\n"
+        result += f"  最新の証明書: {last_cert.not_before_text or 'N/A'}\n"
+        result += f"  最新の有効期限: {last_cert.not_after_text or 'N/A'}\n\n"
     
     # 証明書発行者の分析
-    issuers = {}
-    for cert in cert_data:
-        issuer = cert.get('issuer_name', 'Unknown')
-        issuers[issuer] = issuers.get(issuer, 0) + 1
-    
     result += "🔍 証明書発行者の分析\n"
-    for issuer, count in sorted(issuers.items(), key=lambda x: x[1], reverse=True):
+    for issuer, count in cert_data.issuers.most_common():
         result += f"  {issuer}: {count}件\n"
     result += "\n"
     
     # 年別の証明書発行数
-    years = {}
-    for cert in cert_data:
-        date_str = cert.get('not_before', '')
-        if date_str:
-            try:
-                year = date_str[:4]
-                years[year] = years.get(year, 0) + 1
-            except:
-                pass
-    
     result += "🔍 年別証明書発行数\n"
-    for year, count in sorted(years.items()):
+    for year, count in sorted(cert_data.years.items()):
         result += f"  {year}年: {count}件\n"
     result += "\n"
     
-    # サブドメインの確認
-    subdomains = set()
-    for cert in cert_data:
-        common_name = cert.get('common_name', '')
-        name_value = cert.get('name_value', '')
-        if common_name:
-            subdomains.add(common_name)
-        if name_value:
-            for name in name_value.split('\n'):
-                if name.strip():
-                    subdomains.add(name.strip())
-    
-    result += "🔍 発見されたサブドメイン\n"
-    for subdomain in sorted(subdomains):
-        result += f"  {subdomain}\n"
+    # サブドメインの確認（調査対象からのラベルの深さごと）
+    subdomains = cert_data.subdomains
+    result += f"🔍 発見されたサブドメイン（{len(subdomains)}件、ワイルドカード {len(subdomains.wildcards())}件）\n"
+    if subdomains.dropped:
+        result += f"  (上限に達したため {subdomains.dropped}件の名前を省略)\n"
+    for depth, names in subdomains.by_depth(domain).items():
+        result += f"  深さ{depth}（{len(names)}件）\n"
+        for name in names:
+            result += f"    {subdomains.label(name)}\n"
+    others = subdomains.outside(domain)
+    if others:
+        result += f"  その他のドメイン（{len(others)}件）\n"
+        for name in others:
+            result += f"    {subdomains.label(name)}\n"
     result += "\n"
     
     return result
 
-def _format_wayback_analysis(archive_data: List[List]) -> str:
+def _format_wayback_analysis(archive_data: WaybackAggregate) -> str:
     """Wayback Machine分析結果をフォーマット"""
-    archives = archive_data[1:]  # ヘッダー行を除く
-    result = f"総アーカイブ数: {len(archives)}件\n\n"
+    result = f"総アーカイブ数: {archive_data.total}件\n"
+    if not archive_data.complete:
+        reason = "行数上限" if archive_data.stop_reason == "row_budget" else "時間上限"
+        result += f"  ⚠️ {reason}に達したため取得を打ち切りました（{archive_data.pages}ページ取得済み）\n"
+    result += "\n"
     
-    if archives:
+    if archive_data.total:
         # 最初と最後のアーカイブ
-        first_archive = archives[0]
-        last_archive = archives[-1]
+        first_archive = archive_data.first_row
+        last_archive = archive_data.last_row
         
         result += "🔍 アーカイブの期間\n"
-        result += f"  最初のアーカイブ: {first_archive[1]} - {first_archive[2]}\n"
-        result += f"  最後のアーカイブ: {last_archive[1]} - {last_archive[2]}\n\n"
+        result += f"  最初のアーカイブ: {first_archive[0]} - {first_archive[1]}\n"
+        result += f"  最後のアーカイブ: {last_archive[0]} - {last_archive[1]}\n\n"
         
         # 年別アーカイブ数
-        years = {}
-        for archive in archives:
-            year = archive[1][:4]
-            years[year] = years.get(year, 0) + 1
-        
         result += "🔍 年別アーカイブ数\n"
-        for year, count in sorted(years.items()):
+        for year, count in sorted(archive_data.years.items()):
             result += f"  {year}年: {count}件\n"
         result += "\n"
         
         # HTTPステータスコード分析
-        status_codes = {}
-        for archive in archives:
-            if len(archive) > 4:
-                status = archive[4]
-                status_codes[status] = status_codes.get(status, 0) + 1
-        
         result += "🔍 HTTPステータスコード分布\n"
-        for status, count in sorted(status_codes.items()):
+        for status, count in sorted(archive_data.status_codes.items()):
             result += f"  {status}: {count}件\n"
         result += "\n"
         
+        # ホスト別アーカイブ数
+        result += "🔍 ホスト別アーカイブ数（上位10件）\n"
+        for host, count in archive_data.hosts.most_common(10):
+            result += f"  {host}: {count}件\n"
+        result += "\n"
+        
         # 最近のアーカイブ詳細
         result += "🔍 最近のアーカイブ詳細\n"
-        for archive in archives[-5:]:
-            timestamp = archive[1]
-            url = archive[2]
-            status = archive[4] if len(archive) > 4 else 'N/A'
-            mimetype = archive[3] if len(archive) > 3 else 'N/A'
+        for archive in archive_data.recent[-5:]:
+            timestamp = archive[0]
+            url = archive[1]
+            status = archive[3] if len(archive) > 3 else 'N/A'
+            mimetype = archive[2] if len(archive) > 2 else 'N/A'
             result += f"  {timestamp}: {url} (Status: {status}, Type: {mimetype})\n"
         result += "\n"
     
     return result
 
-def _format_technical_analysis(cert_data: List[Dict]) -> str:
+def _format_technical_analysis(dataset: CertificateDataset) -> str:
     """技術分析結果をフォーマット"""
     result = ""
+    # 発行日順に並べ替え済み
+    cert_data = dataset.records
     
-    # Cloudflareの使用履歴分析
-    cloudflare_certs = [cert for cert in cert_data if 'cloudflare' in cert.get('issuer_name', '').lower()]
+    # Cloudflareの使用履歴分析（発行者名の判定は発行者ごとに1回）
+    cloudflare_ids = {issuer_id for issuer_id, name in enumerate(dataset.issuer_names) if 'cloudflare' in name.lower()}
+    cloudflare_certs = [cert for cert in cert_data if cert.issuer_id in cloudflare_ids]
     
     if cloudflare_certs:
         result += "🔍 Cloudflareの使用履歴\n"
         result += f"  Cloudflare証明書: {len(cloudflare_certs)}件\n"
         for cert in cloudflare_certs:
-            result += f"  発行期間: {cert.get('not_before', 'N/A')} ～ {cert.get('not_after', 'N/A')}\n"
+            result += f"  発行期間: {cert.not_before_text or 'N/A'} ～ {cert.not_after_text or 'N/A'}\n"
         result += "\n"
     
     # 証明書更新パターン分析
-    sorted_certs = sorted(cert_data, key=lambda x: x.get('not_before', ''))
+    issued = [cert.not_before for cert in cert_data if cert.not_before]
     renewal_intervals = []
     
-    for i in range(1, len(sorted_certs)):
-        try:
-            prev_date = datetime.fromisoformat(sorted_certs[i-1].get('not_before', '').replace('Z', '+00:00'))
-            curr_date = datetime.fromisoformat(sorted_certs[i].get('not_before', '').replace('Z', '+00:00'))
-            interval = (curr_date - prev_date).days
-            if 0 < interval < 365:  # 1年以内の更新
-                renewal_intervals.append(interval)
-        except:
-            pass
+    for prev_date, curr_date in zip(issued, issued[1:]):
+        interval = (curr_date - prev_date).days
+        if 0 < interval < 365:  # 1年以内の更新
+            renewal_intervals.append(interval)
     
     if renewal_intervals:
         avg_interval = sum(renewal_intervals) / len(renewal_intervals)
@@ -325,10 +353,7 @@ def _format_technical_analysis(cert_data: List[Dict]) -> str:
     cert_types = {'DV': 0, 'OV': 0, 'EV': 0, 'Wildcard': 0}
     
     for cert in cert_data:
-        common_name = cert.get('common_name', '')
-        name_value = cert.get('name_value', '')
-        
-        if common_name.startswith('*.') or '*.artoautio.com' in name_value:
+        if cert.wildcard:
             cert_types['Wildcard'] += 1
         else:
             cert_types['DV'] += 1  # 基本的にはDV証明書
@@ -340,55 +365,53 @@ def _format_technical_analysis(cert_data: List[Dict]) -> str:
     result += "\n"
     
     # 活動停止時期の推定
-    if sorted_certs:
-        latest_cert = sorted_certs[-1]
-        latest_date = latest_cert.get('not_before', '')
-        expiry_date = latest_cert.get('not_after', '')
+    if cert_data:
+        latest_cert = cert_data[-1]
         
         result += "🔍 活動停止時期の推定\n"
-        result += f"  最新の証明書発行: {latest_date}\n"
-        result += f"  最新の証明書有効期限: {expiry_date}\n"
+        result += f"  最新の証明書発行: {latest_cert.not_before_text}\n"
+        result += f"  最新の証明書有効期限: {latest_cert.not_after_text}\n"
         
-        try:
-            expiry_dt = datetime.fromisoformat(expiry_date.replace('Z', '+00:00'))
-            now = datetime.now(timezone.utc)
-            if now > expiry_dt:
-                result += "  🔴 証明書は既に期限切れ - サイトは停止している可能性が高い\n"
-            else:
-                days_remaining = (expiry_dt - now).days
-                result += f"  🟡 証明書有効期限まで残り {days_remaining} 日\n"
-        except:
+        # 日時は UTC に正規化済み
+        expiry_dt = latest_cert.not_after
+        now = datetime.now(timezone.utc)
+        if expiry_dt is None:
             result += "  🔴 証明書期限の確認に失敗\n"
+        elif now > expiry_dt:
+            result += "  🔴 証明書は既に期限切れ - サイトは停止している可能性が高い\n"
+        else:
+            days_remaining = (expiry_dt - now).days
+            result += f"  🟡 証明書有効期限まで残り {days_remaining} 日\n"
         result += "\n"
     
     return result
 
-def _format_timeline_analysis(cert_data: Optional[List[Dict]], archive_data: Optional[List[List]]) -> str:
+def _format_timeline_analysis(dataset: Optional[CertificateDataset], archive_data: Optional[WaybackAggregate]) -> str:
     """タイムライン分析結果をフォーマット"""
     result = ""
     
-    # 証明書とアーカイブの統合タイムライン
+    # 証明書とアーカイブの統合タイムライン（どちらも UTC の aware な日時）
     events = []
     
-    if cert_data:
+    if dataset:
+        cert_data = dataset.records
+        # 長すぎる発行者名は切り詰める（発行者ごとに1回）
+        issuer_labels = [f"証明書発行: {name[:50]}" for name in dataset.issuer_names]
         for cert in cert_data:
-            date_str = cert.get('not_before', '')
-            if date_str:
-                try:
-                    date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-                    issuer = cert.get('issuer_name', 'Unknown')[:50]  # 長すぎる場合は切り詰め
-                    events.append((date, 'CERT', f"証明書発行: {issuer}"))
-                except:
-                    pass
+            if cert.not_before:
+                events.append((cert.not_before, 'CERT', issuer_labels[cert.issuer_id]))
     
     if archive_data:
-        archives = archive_data[1:]  # ヘッダー行を除く
+        # 表示は最新20件のみなので、集計時に保持した直近の行と活動開始日用の最古の行だけを使う
+        archives = archive_data.recent
+        if archive_data.first_row is not None and archive_data.first_row not in archives:
+            archives = [archive_data.first_row] + archives
         for archive in archives:
-            timestamp = archive[1]
+            timestamp = archive[0]
             try:
                 date = datetime.strptime(timestamp, '%Y%m%d%H%M%S').replace(tzinfo=timezone.utc)
-                url = archive[2]
-                status = archive[4] if len(archive) > 4 else 'N/A'
+                url = archive[1]
+                status = archive[3] if len(archive) > 3 else 'N/A'
                 events.append((date, 'ARCHIVE', f"アーカイブ: {url} (Status: {status})"))
             except:
                 pass
@@ -0,0 +1,237 @@
+"""
+Structured, cached WHOIS client
+
+IANA → レジストリ → レジストラの参照チェーンを WHOIS プロトコル（TCP/43）で
+たどり、TLD ごとのレジストリサーバーを記憶する。パース済みレコードは TTL 付きで
+キャッシュし、生テキストは必要な時だけ取り出せるようにする。
+"""
+
+import os
+import re
+import socket
+import ipaddress
+import logging
+from typing import Any, Dict, List, Optional
+
+from utils.ttl_cache import PersistentTTLCache
+
+logger = logging.getLogger(__name__)
+
+WHOIS_PORT = 43
+IANA_SERVER = "whois.iana.org"
+WHOIS_TIMEOUT = float(os.getenv("WHOIS_TIMEOUT", "15"))
+MAX_RESPONSE_BYTES = 1024 * 1024
+
+# UTF-8 以外で応答するサーバー（JPRS は日本語の項目名を ISO-2022-JP で返す）
+SERVER_CHARSETS = {
+    "whois.jprs.jp": "iso-2022-jp",
+}
+
+# 未登録ドメインに対する応答（項目が取れなくても正しい結果として扱う）
+_NOT_FOUND_PATTERN = re.compile(
+    r"no match|not found|no entries found|no data found|no object found|nothing found"
+    r"|status:\s*(free|available)|is available for registration",
+    re.IGNORECASE,
+)
+
+# TLD → レジストリ WHOIS サーバー（ほとんど変わらないので長めに保持）
+referral_cache = PersistentTTLCache(
+    namespace="whois_referral",
+    default_ttl=float(os.getenv("WHOIS_REFERRAL_CACHE_TTL", str(7 * 86400))),
+    negative_ttl=86400,
+    max_entries=2000,
+)
+
+# ドメイン → パース済みレコード（生テキスト含む）
+record_cache = PersistentTTLCache(
+    namespace="whois_record",
+    default_ttl=float(os.getenv("WHOIS_CACHE_TTL", "86400")),
+    negative_ttl=3600,
+    max_entries=int(os.getenv("WHOIS_CACHE_MAX_ENTRIES", "5000")),
+)
+
+# 要約に含める項目と、レジストリごとに異なるキー名
+FIELD_KEYS = {
+    "registrar": ["registrar", "sponsoring registrar", "registrar name"],
+    "created": ["creation date", "created", "created on", "registered on", "registration time",
+                "domain record activated", "登録年月日"],
+    "expires": ["registry expiry date", "registrar registration expiration date", "expiration date",
+                "expiry date", "expires on", "expires", "paid-till", "expiration time", "有効期限"],
+    "updated": ["updated date", "last updated", "last update", "last-update", "last modified", "changed", "最終更新"],
+    "nameservers": ["name server", "nameserver", "nameservers", "nserver", "ネームサーバ"],
+    "status": ["domain status", "status", "state", "状態"],
+    "registrant": ["registrant organization", "registrant", "org", "organization", "登録者名", "組織名"],
+}
+_KEY_TO_FIELD = {key: field for field, keys in FIELD_KEYS.items() for key in keys}
+_LIST_FIELDS = {"nameservers", "status"}
+
+# "Key: Value" 形式と JPRS の "[Key]   Value" 形式
+_LINE_PATTERNS = [
+    re.compile(r"^\s*([A-Za-z][A-Za-z0-9 /\-_.]{1,60}?)\s*:\s*(.+?)\s*$"),
+    re.compile(r"^\s*[a-z]?\.?\s*\[([^\]]{1,60})\]\s+(.+?)\s*$"),
+]
+_REFERRAL_KEYS = ("registrar whois server", "whois server", "referralserver", "refer", "whois")
+
+
+class WhoisError(Exception):
+    """Raised when no WHOIS server could be queried"""
+
+
+def query_server(server: str, query: str, timeout: float = WHOIS_TIMEOUT) -> str:
+    """Send one WHOIS query over TCP/43 and return the raw response"""
+    chunks = []
+    received = 0
+    with socket.create_connection((server, WHOIS_PORT), timeout=timeout) as sock:
+        sock.sendall(f"{query}\r\n".encode("idna" if not query.isascii() else "ascii"))
+        while received < MAX_RESPONSE_BYTES:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            received += len(chunk)
+    data = b"".join(chunks)
+    charset = SERVER_CHARSETS.get(server.lower(), "utf-8")
+    try:
+        return data.decode(charset)
+    except UnicodeDecodeError:
+        return data.decode("utf-8", errors="replace")
+
+
+def parse_whois(raw: str) -> Dict[str, Any]:
+    """Extract registrar, dates, nameservers and status from raw WHOIS text"""
+    record: Dict[str, Any] = {"nameservers": [], "status": []}
+    for line in raw.splitlines():
+        if line.startswith(("%", "#", ">>>")):
+            continue
+        for pattern in _LINE_PATTERNS:
+            match = pattern.match(line)
+            if match:
+                break
+        else:
+            continue
+
+        key = match.group(1).strip().lower()
+        field = _KEY_TO_FIELD.get(key)
+        value = match.group(2).strip()
+        if not field or not value:
+            continue
+
+        if field in _LIST_FIELDS:
+            # "clientTransferProhibited https://icann.org/epp#..." の URL 部分は落とす
+            value = value.split()[0].rstrip(".").lower() if field == "nameservers" else value.split(" http")[0]
+            if value not in record[field]:
+                record[field].append(value)
+        elif field not in record:
+            record[field] = value
+    return record
+
+
+def _find_referral(raw: str, current: str) -> Optional[str]:
+    """Return the next WHOIS server mentioned in a response, if any"""
+    for line in raw.splitlines():
+        if ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        if key.strip().lower() in _REFERRAL_KEYS:
+            server = value.strip().replace("whois://", "").replace("rwhois://", "").split(":")[0].strip("/ ")
+            if server and "." in server and server.lower() != current.lower():
+                return server.lower()
+    return None
+
+
+def registry_server(tld: str) -> Optional[str]:
+    """Return the registry WHOIS server for a TLD, memoized via IANA"""
+    hit, server = referral_cache.lookup(tld)
+    if hit:
+        return server or None
+
+    raw = query_server(IANA_SERVER, tld)
+    server = _find_referral(raw, IANA_SERVER)
+    referral_cache.set(tld, server or "")
+    return server
+
+
+def lookup(domain: str, use_cache: bool = True) -> Dict[str, Any]:
+    """Return the structured WHOIS record for a domain
+
+    The record contains the parsed summary fields, the referral chain that
+    was followed and the raw text of each server's response. A response
+    that cannot be parsed raises WhoisError so the caller can fall back.
+    """
+    domain = domain.strip().lower().rstrip(".")
+    if use_cache:
+        hit, record = record_cache.lookup(domain)
+        if hit:
+            record["cached"] = True
+            return record
+
+    try:
+        ipaddress.ip_address(domain)
+        # IP アドレスは IANA が担当 RIR（ARIN, APNIC 等）を案内する
+        server = _find_referral(query_server(IANA_SERVER, domain), IANA_SERVER)
+    except ValueError:
+        server = registry_server(domain.rsplit(".", 1)[-1])
+    if not server:
+        raise WhoisError(f"No WHOIS server known for {domain}")
+
+    chain: List[str] = []
+    raw_responses: Dict[str, str] = {}
+    summary: Dict[str, Any] = {"nameservers": [], "status": []}
+    # レジストリ → レジストラの順にたどり、後のサーバーの値を優先する
+    while server and server not in chain and len(chain) < 3:
+        try:
+            raw = query_server(server, domain)
+        except OSError as e:
+            if not chain:
+                raise WhoisError(f"{server}: {e}") from e
+            logger.warning(f"WHOIS referral {server} failed: {e}")
+            break
+        chain.append(server)
+        raw_responses[server] = raw
+
+        parsed = parse_whois(raw)
+        for field, value in parsed.items():
+            if field in _LIST_FIELDS:
+                if value:
+                    summary[field] = value
+            else:
+                summary[field] = value
+        server = _find_referral(raw, server)
+
+    record = {"domain": domain, "summary": summary, "chain": chain, "raw": raw_responses}
+    found = any(summary.get(field) for field in ("registrar", "created", "expires", "nameservers"))
+    if not found and not any(_NOT_FOUND_PATTERN.search(raw) for raw in raw_responses.values()):
+        # 応答はあるのに項目を読み取れない場合は失敗として扱い、キャッシュしない
+        raise WhoisError(f"Could not parse the WHOIS response for {domain} from {' -> '.join(chain)}")
+    record_cache.set(domain, record, negative=not found)
+    record["cached"] = False
+    return record
+
+
+def format_summary(record: Dict[str, Any]) -> str:
+    """Render a compact summary for the agent"""
+    summary = record["summary"]
+    lines = [f"Whois summary for {record['domain']}:", ""]
+    for label, field in (("Registrar", "registrar"), ("Registrant", "registrant"), ("Created", "created"),
+                         ("Updated", "updated"), ("Expires", "expires")):
+        if summary.get(field):
+            lines.append(f"{label}: {summary[field]}")
+    if summary.get("nameservers"):
+        lines.append(f"Name servers: {', '.join(summary['nameservers'])}")
+    if summary.get("status"):
+        lines.append(f"Status: {', '.join(summary['status'])}")
+    if len(lines) == 2:
+        lines.append("No registration data found (domain may be unregistered)")
+
+    lines.append("")
+    lines.append(f"WHOIS servers: {' -> '.join(record['chain'])}{' (cached)' if record.get('cached') else ''}")
+    lines.append(f"Full record: use \"{record['domain']} RAW\"")
+    return "\n".join(lines)
+
+
+def format_raw(record: Dict[str, Any]) -> str:
+    """Render the raw text of every server in the referral chain"""
+    parts = [f"Whois information for {record['domain']}:"]
+    for server in record["chain"]:
+        parts.append(f"\n--- {server} ---\n{record['raw'][server].strip()}")
+    return "\n".join(parts)
@@ -3,28 +3,25 @@ Whois Tool for LangChain Agent
 """
 
 from langchain.tools import Tool
-import subprocess
 import logging
 
+from . import whois_client
+from .process_executor import process_executor
+
 logger = logging.getLogger(__name__)
 
-def run_whois(domain: str) -> str:
-    """Execute whois lookup directly"""
+def run_whois_binary(domain: str) -> str:
+    """Execute the whois binary (fallback when the WHOIS client fails)"""
     
     try:
-        logger.info(f"Running whois lookup for: {domain}")
-        
         # Execute directly in current environment
         cmd = ["whois", domain]
         
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True, 
-            timeout=60,  # 1 minute timeout
-            cwd=None
-        )
+        result = process_executor.run(cmd, timeout=60)  # 1 minute timeout
         
+        if result.timed_out:
+            logger.error(f"Whois lookup timed out for {domain}")
+            return f"Whois lookup timed out for {domain}"
         if result.returncode == 0:
             output = result.stdout.strip()
             logger.info(f"Whois lookup completed successfully for {domain}")
@@ -34,21 +31,34 @@ def run_whois(domain: str) -> str:
             logger.error(f"Whois lookup failed: {error_msg}")
             return f"Whois lookup failed for {domain}: {error_msg}"
             
-    except subprocess.TimeoutExpired:
-        logger.error(f"Whois lookup timed out for {domain}")
-        return f"Whois lookup timed out for {domain}"
     except Exception as e:
         logger.error(f"Whois lookup error: {str(e)}")
         return f"Whois lookup error for {domain}: {str(e)}"
 
+def run_whois(domain: str, raw: bool = False) -> str:
+    """Execute whois lookup and return a compact summary (or the raw record)"""
+    
+    try:
+        logger.info(f"Running whois lookup for: {domain}")
+        record = whois_client.lookup(domain)
+        logger.info(f"Whois lookup completed for {domain} via {' -> '.join(record['chain'])}"
+                    f"{' (cached)' if record.get('cached') else ''}")
+        return whois_client.format_raw(record) if raw else whois_client.format_summary(record)
+    except Exception as e:
+        logger.warning(f"WHOIS client failed for {domain}: {str(e)}; falling back to whois binary")
+        return run_whois_binary(domain)
+
 def whois_lookup_wrapper(input_str: str) -> str:
     """Wrapper function for whois tool"""
     try:
-        domain = input_str.strip()
-        if not domain:
+        parts = input_str.strip().split()
+        if not parts:
             return "Error: Please provide a domain name"
         
-        return run_whois(domain)
+        domain = parts[0]
+        raw = len(parts) > 1 and parts[1].upper() == "RAW"
+        
+        return run_whois(domain, raw)
     except Exception as e:
         return f"Error parsing whois input: {str(e)}"
 
@@ -58,13 +68,15 @@ whois_tool = Tool(
     description="""
     Perform WHOIS domain lookup to get registration information.
     
-    Usage: "domain.com"
+    Usage: "domain.com [RAW]"
     
     Examples:
-    - "google.com" - Get whois info for Google
-    - "example.org" - Get whois info for any domain
+    - "google.com" - Get a whois summary for Google
+    - "example.org" - Get a whois summary for any domain
+    - "google.com RAW" - Get the full raw whois record
     
-    Returns registration details, nameservers, contacts, etc.
+    Returns a compact summary: registrar, creation/update/expiry dates, nameservers and status.
+    Use RAW only when the summary lacks a detail you need.
     """,
     func=whois_lookup_wrapper
 ) 
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""
+Background jobs for long-running tools
+
+サービス検出スキャンや sqlmap などの長時間の処理を Streamlit のスクリプト
+スレッドから切り離し、ワーカースレッドで実行する。ジョブの状態と結果は
+/data の SQLite に保存するため、ブラウザを再読み込みしても失われない。
+"""
+
+import os
+import time
+import contextvars
+import uuid
+import zlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from utils.storage import data_path, connect_sqlite
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_JOBS = os.getenv("OSINT_BACKGROUND_JOBS", "true").lower() == "true"
+JOB_WORKERS = int(os.getenv("OSINT_JOB_WORKERS", "4"))
+# 投入直後にこの秒数だけ完了を待ち、終われば結果をそのまま返す
+JOB_INLINE_WAIT = float(os.getenv("OSINT_JOB_INLINE_WAIT", "0"))
+JOB_RETENTION_DAYS = float(os.getenv("OSINT_JOB_RETENTION_DAYS", "7"))
+
+FINISHED_STATUSES = ("done", "error", "interrupted")
+STATUS_LABELS = {
+    "queued": "⏳ 待機中",
+    "running": "🔄 実行中",
+    "done": "✅ 完了",
+    "error": "❌ エラー",
+    "interrupted": "⚠️ 中断",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    tool TEXT NOT NULL,
+    input TEXT NOT NULL,
+    status TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    output BLOB,
+    error TEXT,
+    session_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+"""
+
+# 実行中のエージェントのセッション（ジョブの所有者として記録し、一覧を絞り込む）
+current_session: ContextVar[Optional[str]] = ContextVar("job_session", default=None)
+
+
+@contextmanager
+def session_scope(session_id: Optional[str]) -> Iterator[None]:
+    """Attribute jobs submitted in this context to a session"""
+    token = current_session.set(session_id)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+class JobTicket(str):
+    """Tool output announcing a submitted job (not a result, so it is never stored)"""
+
+
+@dataclass
+class Job:
+    id: str
+    tool: str
+    input: str
+    status: str
+    pid: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    output: Optional[str] = None
+    error: Optional[str] = None
+    session_id: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def elapsed(self) -> float:
+        """Run time so far (or total run time once finished)"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def describe(self) -> str:
+        return f"{self.id} [{self.status}] {self.tool} {self.input} ({self.elapsed:.0f}s)"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobRunner:
+    """Thread pool executing tool calls with a persisted job table"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, filename: str = "jobs.sqlite3"):
+        self.max_workers = max_workers
+        self.filename = filename
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._events: Dict[str, threading.Event] = {}
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        # 初回アクセスまで DB を開かない
+        if self._conn is None:
+            path = data_path(self.filename)
+            try:
+                self._conn = connect_sqlite(path)
+                self._conn.executescript(_SCHEMA)
+            except Exception as e:
+                logger.warning(f"Job database unavailable ({path}): {e}; using in-memory job table")
+                self._conn = connect_sqlite(":memory:")
+                self._conn.executescript(_SCHEMA)
+            self._migrate(self._conn)
+            self._recover(self._conn)
+        return self._conn
+
+    @staticmethod
+    def _migrate(conn):
+        """Add the session column to job tables created before it existed"""
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+        if "session_id" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN session_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs (session_id, created_at)")
+
+    def _recover(self, conn):
+        """Mark jobs of dead processes as interrupted and drop old ones"""
+        rows = conn.execute("SELECT id, pid FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        dead = [(time.time(), job_id) for job_id, pid in rows if pid == os.getpid() or not _pid_alive(pid)]
+        if dead:
+            conn.executemany(
+                "UPDATE jobs SET status = 'interrupted', finished_at = ?, error = 'Process exited before the job finished' "
+                "WHERE id = ?",
+                dead,
+            )
+            logger.info(f"Marked {len(dead)} unfinished jobs as interrupted")
+        if JOB_RETENTION_DAYS > 0:
+            conn.execute("DELETE FROM jobs WHERE created_at < ?", (time.time() - JOB_RETENTION_DAYS * 86400,))
+
+    def _update(self, job_id: str, **fields: Any):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._connection().execute(f"UPDATE jobs SET {assignments} WHERE id = ?", list(fields.values()) + [job_id])
+
+    def submit(self, tool: str, input_str: str, func: Callable[[], Any]) -> str:
+        """Queue func() and return the job ID"""
+        job_id = f"job-{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self._connection().execute(
+                "INSERT INTO jobs (id, tool, input, status, pid, created_at, session_id) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, tool, input_str, os.getpid(), time.time(), current_session.get()),
+            )
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="osint-job")
+            self._events[job_id] = threading.Event()
+            # REFRESH によるキャッシュ迂回などのコンテキストをジョブにも引き継ぐ
+            self._executor.submit(contextvars.copy_context().run, self._run, job_id, tool, input_str, func)
+        logger.info(f"Submitted {job_id}: {tool} {input_str}")
+        return job_id
+
+    def _run(self, job_id: str, tool: str, input_str: str, func: Callable[[], Any]):
+        started = time.time()
+        self._update(job_id, status="running", started_at=started)
+        try:
+            output = str(func())
+            self._update(job_id, status="done", finished_at=time.time(), output=zlib.compress(output.encode("utf-8")))
+            logger.info(f"{job_id} finished in {time.time() - started:.1f}s")
+            self._record_result(tool, input_str, output, time.time() - started)
+        except Exception as e:
+            logger.error(f"{job_id} failed: {e}")
+            self._update(job_id, status="error", finished_at=time.time(), error=str(e))
+        finally:
+            with self._lock:
+                event = self._events.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    @staticmethod
+    def _record_result(tool: str, input_str: str, output: str, duration: float):
+        """Make the finished result available to later identical tool calls"""
+        from utils.result_store import RESULT_STORE_ENABLED, output_status, result_store
+        if not RESULT_STORE_ENABLED:
+            return
+        try:
+            result_store.record(tool, input_str, output, duration, output_status(output))
+        except Exception as e:
+            logger.warning(f"Failed to record job result: {e}")
+
+    def get(self, job_id: str, session_id: Optional[str] = None) -> Optional[Job]:
+        """A job with its output; with session_id, only if that session submitted it"""
+        where, args = ("AND session_id = ?", [session_id]) if session_id else ("", [])
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, tool, input, status, pid, created_at, started_at, finished_at, output, error, session_id "
+                f"FROM jobs WHERE id = ? {where}",
+                [job_id.strip()] + args,
+            ).fetchone()
+        if row is None:
+            return None
+        job = Job(*row)
+        if job.output is not None:
+            job.output = zlib.decompress(job.output).decode("utf-8")
+        return job
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """Block until the job finishes or the timeout expires, then return it"""
+        with self._lock:
+            event = self._events.get(job_id)
+        if event is not None:
+            event.wait(timeout)
+        else:
+            # 別プロセスのジョブは DB を見て待つ
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                job = self.get(job_id)
+                if job is None or job.finished or (deadline is not None and time.monotonic() >= deadline):
+                    return job
+                time.sleep(1.0)
+        return self.get(job_id)
+
+    def list_jobs(self, limit: int = 20, status: Optional[str] = None,
+                  session_id: Optional[str] = None) -> List[Job]:
+        """Newest jobs first, without outputs (only those of session_id when given)"""
+        conditions, args = [], []
+        if status:
+            conditions.append("status = ?")
+            args.append(status)
+        if session_id:
+            conditions.append("session_id = ?")
+            args.append(session_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, tool, input, status, pid, created_at, started_at, finished_at, NULL, error, session_id "
+                f"FROM jobs {where} ORDER BY created_at DESC LIMIT ?",
+                args + [limit],
+            ).fetchall()
+        return [Job(*row) for row in rows]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+job_runner = JobRunner()
+
+
+def run_in_background(tool: str, input_str: str, func: Callable[[], Any]) -> str:
+    """Submit a long tool call and return a ticket (or the result if it finishes within the inline wait)"""
+    job_id = job_runner.submit(tool, input_str, func)
+    if JOB_INLINE_WAIT > 0:
+        job = job_runner.wait(job_id, JOB_INLINE_WAIT)
+        if job is not None and job.status == "done":
+            return job.output
+    return JobTicket(
+        f"バックグラウンドジョブ {job_id} を開始しました（{tool}: {input_str}）。\n"
+        f"結果は job_status \"{job_id}\" で確認、job_status \"{job_id} wait\" で完了まで待機できます。"
+    )
@@ -0,0 +1,51 @@
+"""
+Incremental JSON parsing helpers
+"""
+
+import json
+import codecs
+from typing import Any, Iterable, Iterator
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Yield the elements of a top-level JSON array from a byte stream
+
+    Only the current partial element is buffered, so memory stays bounded
+    by the largest single element rather than the whole document.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buffer = ""
+    pos = 0
+    started = False
+
+    for chunk in chunks:
+        buffer = buffer[pos:] + text_decoder.decode(chunk)
+        pos = 0
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buffer):
+                break
+
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError("Response is not a JSON array")
+                started = True
+                pos += 1
+                continue
+
+            if buffer[pos] == "]":
+                return
+
+            try:
+                element, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # 要素の途中でチャンクが切れているので続きを待つ
+                break
+            yield element
+
+    if not started:
+        raise ValueError("Empty response")
+    raise ValueError("Truncated JSON array")
@@ -0,0 +1,332 @@
+"""
+Persistent store of tool invocations indexed by target and tool
+
+ツールの実行結果（正規化したターゲット・パラメータ・実行時刻・所要時間・
+圧縮した出力）を /data の SQLite に記録する。ツールごとの鮮度ポリシー内の
+結果があれば、ネットワークやサブプロセスを使わずにそれを返す。
+"""
+
+import os
+import re
+import time
+import zlib
+import hashlib
+import ipaddress
+import threading
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.job_runner import JobTicket
+from utils.ttl_cache import bypass_caches
+from utils.storage import data_path, connect_sqlite
+
+logger = logging.getLogger(__name__)
+
+RESULT_STORE_ENABLED = os.getenv("OSINT_RESULT_STORE", "true").lower() == "true"
+RETENTION_DAYS = float(os.getenv("OSINT_RESULT_RETENTION_DAYS", "30"))
+
+# ツールごとの再利用可能な期間（秒）。0 は記録のみで再利用しない
+FRESHNESS = {
+    "whois_lookup": 86400,
+    "dns_lookup": 3600,
+    "dns_history_lookup": 86400,
+    "web_history_lookup": 6 * 3600,
+    "nmap_scan": 3600,
+    "ping_test": 0,
+    "execute_command": 0,
+}
+# "nmap_scan=0,whois_lookup=604800" 形式で上書きできる
+for _item in os.getenv("OSINT_RESULT_FRESHNESS", "").split(","):
+    _name, _, _value = _item.partition("=")
+    if _name.strip() and _value.strip().isdigit():
+        FRESHNESS[_name.strip()] = int(_value)
+
+# 入力にこの語を含めると保存済みの結果と下層のキャッシュを使わずに実行し直す
+REFRESH_KEYWORD = "REFRESH"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tool_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target TEXT NOT NULL,
+    tool TEXT NOT NULL,
+    params TEXT NOT NULL,
+    params_hash TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    status TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    output BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_target_tool ON tool_results (target, tool, created_at);
+CREATE INDEX IF NOT EXISTS idx_results_lookup ON tool_results (tool, params_hash, created_at);
+"""
+
+_SCHEME_PATTERN = re.compile(r"^[a-z][a-z0-9+.-]*://", re.IGNORECASE)
+# 先頭数行か警告行（⚠️）にこれらが含まれる出力は失敗・部分的な結果として再利用しない
+_FAILURE_PATTERN = re.compile(r"^(Error|エラー)|\b(error|failed|timed out)\b|エラー|タイムアウト", re.IGNORECASE)
+
+
+def normalize_target(token: str) -> str:
+    """Lower-case host, IP or CIDR without scheme, path, port or trailing dot ("" if not a host)"""
+    value = _SCHEME_PATTERN.sub("", token.strip().strip("\"'"))
+    try:
+        return str(ipaddress.ip_network(value, strict=False)) if "/" in value else str(ipaddress.ip_address(value))
+    except ValueError:
+        pass
+    value = value.split("/", 1)[0].rsplit("@", 1)[-1]
+    if value.count(":") == 1:
+        value = value.split(":", 1)[0]
+    value = value.lower().rstrip(".")
+    if "." in value and re.fullmatch(r"[a-z0-9*_.-]+", value) and not value.startswith("-"):
+        return value
+    return ""
+
+
+def output_status(output: str) -> str:
+    """"ok", or "error" for failed and partial outputs (tools report errors as text)"""
+    lines = [line.strip() for line in output.splitlines() if line.strip()]
+    checked = lines[:3] + [line for line in lines[3:] if line.startswith("⚠️")]
+    return "error" if any(_FAILURE_PATTERN.search(line) for line in checked) else "ok"
+
+
+def split_invocation(input_str: str) -> Tuple[str, str]:
+    """(normalised target, normalised parameters) of a tool input string"""
+    tokens = input_str.strip().strip("\"'").split()
+    for index, token in enumerate(tokens):
+        # "@8.8.8.8" は DNS の問い合わせ先でありターゲットではない
+        if token.startswith("@"):
+            continue
+        target = normalize_target(token)
+        if target:
+            return target, " ".join(tokens[:index] + tokens[index + 1:])
+    return "", " ".join(tokens)
+
+
+@dataclass
+class StoredResult:
+    id: int
+    target: str
+    tool: str
+    params: str
+    created_at: float
+    duration: float
+    status: str
+    size: int
+    output: Optional[str] = None
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created_at
+
+    def describe(self) -> str:
+        created = datetime.fromtimestamp(self.created_at).strftime("%Y-%m-%d %H:%M")
+        return f"#{self.id} {created} {self.tool} {self.target} {self.params}".rstrip() + f" ({self.duration:.1f}s, {self.status})"
+
+
+class ResultStore:
+    """SQLite store of tool invocations"""
+
+    def __init__(self, filename: str = "results.sqlite3", retention_days: float = RETENTION_DAYS):
+        self.filename = filename
+        self.retention_days = retention_days
+        self._conn = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0}
+
+    def _connection(self):
+        # 初回アクセスまで DB を開かない
+        if self._conn is None:
+            path = data_path(self.filename)
+            try:
+                self._conn = connect_sqlite(path)
+                self._conn.executescript(_SCHEMA)
+            except Exception as e:
+                logger.warning(f"Result store unavailable ({path}): {e}; using in-memory store")
+                self._conn = connect_sqlite(":memory:")
+                self._conn.executescript(_SCHEMA)
+            if self.retention_days > 0:
+                self._conn.execute(
+                    "DELETE FROM tool_results WHERE created_at < ?",
+                    (time.time() - self.retention_days * 86400,),
+                )
+        return self._conn
+
+    @staticmethod
+    def _params_hash(target: str, params: str) -> str:
+        return hashlib.sha256(f"{target}\n{params.lower()}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _row(row: Tuple, with_output: bool) -> StoredResult:
+        result = StoredResult(*row[:8])
+        if with_output:
+            result.output = zlib.decompress(row[8]).decode("utf-8")
+        return result
+
+    def record(self, tool: str, input_str: str, output: str, duration: float, status: str = "ok") -> Optional[int]:
+        """Store one invocation and return its ID
+
+        Inputs without a target (e.g. a bare "BULK_CT") depend on state outside
+        the input and are not stored.
+        """
+        target, params = split_invocation(input_str)
+        if not target:
+            return None
+        blob = zlib.compress(str(output).encode("utf-8"))
+        with self._lock:
+            cursor = self._connection().execute(
+                "INSERT INTO tool_results (target, tool, params, params_hash, created_at, duration, status, size, output) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (target, tool, params, self._params_hash(target, params), time.time(), duration, status, len(blob), blob),
+            )
+            self._stats["writes"] += 1
+            return cursor.lastrowid
+
+    def lookup(self, tool: str, input_str: str, max_age: float) -> Optional[StoredResult]:
+        """Newest successful result of the same invocation younger than max_age"""
+        target, params = split_invocation(input_str)
+        if max_age <= 0 or not target:
+            return None
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, target, tool, params, created_at, duration, status, size, output FROM tool_results "
+                "WHERE tool = ? AND params_hash = ? AND status = 'ok' AND created_at >= ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (tool, self._params_hash(target, params), time.time() - max_age),
+            ).fetchone()
+            self._stats["hits" if row else "misses"] += 1
+        return self._row(row, True) if row else None
+
+    def get(self, result_id: int) -> Optional[StoredResult]:
+        """A stored result with its output"""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, target, tool, params, created_at, duration, status, size, output FROM tool_results WHERE id = ?",
+                (result_id,),
+            ).fetchone()
+        return self._row(row, True) if row else None
+
+    def list_results(self, target: Optional[str] = None, tool: Optional[str] = None,
+                     since: Optional[float] = None, limit: int = 100) -> List[StoredResult]:
+        """Invocations (newest first) without outputs, optionally for one target and/or tool
+
+        A domain target also matches its subdomains.
+        """
+        clauses, args = [], []
+        if target:
+            target = normalize_target(target) or target.lower()
+            clauses.append("(target = ? OR target LIKE ?)")
+            args += [target, f"%.{target}"]
+        if tool:
+            clauses.append("tool = ?")
+            args.append(tool)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            args.append(since)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT id, target, tool, params, created_at, duration, status, size FROM tool_results "
+                f"{where} ORDER BY created_at DESC LIMIT ?",
+                args + [limit],
+            ).fetchall()
+        return [self._row(row, False) for row in rows]
+
+    def targets(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Known targets with their invocation count, tools and last run time"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT target, COUNT(*), GROUP_CONCAT(DISTINCT tool), MAX(created_at) FROM tool_results "
+                "WHERE target != '' GROUP BY target ORDER BY MAX(created_at) DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [
+            {"target": target, "results": count, "tools": sorted((tools or "").split(",")), "last_run": last_run}
+            for target, count, tools, last_run in rows
+        ]
+
+    def purge(self, older_than: float):
+        """Delete invocations older than the given number of seconds"""
+        with self._lock:
+            self._connection().execute("DELETE FROM tool_results WHERE created_at < ?", (time.time() - older_than,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tool_results"
+            ).fetchone()
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["entries"] = count
+        stats["bytes"] = total
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+result_store = ResultStore()
+
+
+def run_with_store(tool: str, func: Callable[[str], Any], input_str: str,
+                   store: Optional[ResultStore] = None) -> str:
+    """Serve a fresh stored result or run the tool and record its output"""
+    store = store or result_store
+    tokens = input_str.split()
+    refresh = REFRESH_KEYWORD in tokens
+    if refresh:
+        input_str = " ".join(token for token in tokens if token != REFRESH_KEYWORD)
+
+    max_age = FRESHNESS.get(tool, 0)
+    if not refresh:
+        try:
+            stored = store.lookup(tool, input_str, max_age)
+        except Exception as e:
+            logger.warning(f"Result store lookup failed: {e}")
+            stored = None
+        if stored is not None:
+            minutes = int(stored.age // 60)
+            logger.info(f"Reusing stored {tool} result #{stored.id} for {stored.target or input_str} ({minutes} min old)")
+            return (
+                f"[保存済みの結果 #{stored.id} を再利用 "
+                f"({datetime.fromtimestamp(stored.created_at).strftime('%Y-%m-%d %H:%M')}、{minutes}分前)。"
+                f"最新の結果が必要な場合は入力に {REFRESH_KEYWORD} を付けて再実行]\n{stored.output}"
+            )
+
+    start = time.monotonic()
+    if refresh:
+        # crt.sh / WHOIS / DNS のキャッシュも使わずに取得し直す
+        with bypass_caches():
+            output = func(input_str)
+    else:
+        output = func(input_str)
+    duration = time.monotonic() - start
+    if isinstance(output, JobTicket):
+        # バックグラウンドジョブは完了時に job_runner が記録する
+        return output
+    try:
+        store.record(tool, input_str, str(output), duration, output_status(str(output)))
+    except Exception as e:
+        logger.warning(f"Failed to record {tool} result: {e}")
+    return output
+
+
+def store_tool(tool):
+    """Wrap a LangChain Tool so that its invocations go through the result store"""
+    from langchain.tools import Tool
+
+    func = tool.func
+    description = tool.description
+    if FRESHNESS.get(tool.name, 0) > 0:
+        description = description.rstrip() + f"\n    Recent results are reused; add {REFRESH_KEYWORD} to the input to force a new run.\n"
+
+    def stored(input_str: str) -> str:
+        return run_with_store(tool.name, func, input_str)
+
+    return Tool(name=tool.name, description=description, func=stored)
+
+
+def store_tools(tools: List[Any]) -> List[Any]:
+    """Wrap the tools that have a freshness policy (no-op when OSINT_RESULT_STORE=false)"""
+    if not RESULT_STORE_ENABLED:
+        return list(tools)
+    return [store_tool(tool) if tool.name in FRESHNESS else tool for tool in tools]
@@ -0,0 +1,38 @@
+"""
+Local storage helpers for MenZ-OSINT
+
+永続データは Docker の /data ボリュームに保存する。
+OSINT_DATA_DIR 環境変数で保存先を変更できる。
+"""
+
+import os
+import logging
+import sqlite3
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.getenv("OSINT_DATA_DIR", "/data")
+
+
+def data_path(filename: str) -> str:
+    """Return an absolute path for a file under the data directory"""
+    for directory in (DATA_DIR, os.path.join(tempfile.gettempdir(), "menz-osint")):
+        try:
+            os.makedirs(directory, exist_ok=True)
+            if os.access(directory, os.W_OK):
+                return os.path.join(directory, filename)
+        except OSError:
+            continue
+        logger.warning(f"Data directory is not writable: {directory}")
+    return ":memory:"
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Open a SQLite connection shared between threads (callers must lock)"""
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    if path != ":memory:":
+        # Streamlit と CLI など複数プロセスからの同時アクセスに備える
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
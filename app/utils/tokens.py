@@ -0,0 +1,49 @@
+"""
+Lightweight token estimation
+
+トークナイザを読み込まずに概算する。英数字は約4文字で1トークン、
+日本語などの全角文字は1文字で約1トークンとして数える。
+"""
+
+from typing import Iterable
+
+
+def _is_wide(char: str) -> bool:
+    return ord(char) >= 0x2E80
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of LLM tokens in a string"""
+    if not text:
+        return 0
+    wide = sum(1 for char in text if _is_wide(char))
+    return wide + (len(text) - wide + 3) // 4
+
+
+def estimate_tokens_many(texts: Iterable[str]) -> int:
+    return sum(estimate_tokens(text) for text in texts)
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cut a string at a line boundary so that it fits the token budget"""
+    if estimate_tokens(text) <= budget:
+        return text
+
+    lines = []
+    used = 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        lines.append(line)
+        used += cost
+    if not lines:
+        # 1行目だけで予算を超える場合は文字単位で切る
+        keep = []
+        for char in text:
+            used += 1 if _is_wide(char) else 0.25
+            if used > budget:
+                break
+            keep.append(char)
+        return "".join(keep)
+    return "\n".join(lines)
@@ -0,0 +1,211 @@
+"""
+Persistent TTL cache backed by SQLite
+
+Entries expire after a per-entry TTL and the least recently used entries
+are evicted once a namespace exceeds its entry or byte cap.
+"""
+
+import json
+import logging
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from utils.storage import data_path, connect_sqlite
+
+logger = logging.getLogger(__name__)
+
+# REFRESH 付きの実行中は True（別スレッドへは contextvars.copy_context() で引き継ぐ）
+_bypass: ContextVar[bool] = ContextVar("cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_caches() -> Iterator[None]:
+    """Treat every cache lookup in this context as a miss (results are still stored)"""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def caches_bypassed() -> bool:
+    return _bypass.get()
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    negative INTEGER NOT NULL DEFAULT 0,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_lru ON cache_entries (namespace, last_access);
+"""
+
+
+class PersistentTTLCache:
+    """SQLite-backed cache with TTL, LRU eviction and negative caching"""
+
+    def __init__(
+        self,
+        namespace: str,
+        default_ttl: float = 86400,
+        negative_ttl: float = 3600,
+        max_entries: int = 1000,
+        max_bytes: int = 256 * 1024 * 1024,
+        filename: str = "cache.sqlite3",
+    ):
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.filename = filename
+
+        self._conn = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "negative_hits": 0, "misses": 0, "expired": 0, "evictions": 0, "writes": 0}
+
+    def _connection(self):
+        # 初回アクセスまで DB を開かない
+        if self._conn is None:
+            path = data_path(self.filename)
+            try:
+                self._conn = connect_sqlite(path)
+                self._conn.executescript(_SCHEMA)
+            except Exception as e:
+                logger.warning(f"Cache database unavailable ({path}): {e}; using in-memory cache")
+                self._conn = connect_sqlite(":memory:")
+                self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    @staticmethod
+    def is_negative(value: Any) -> bool:
+        """Whether a value should be cached as a negative (empty) result"""
+        return value is None or (hasattr(value, "__len__") and len(value) == 0)
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """Return (hit, value) for a key"""
+        if _bypass.get():
+            with self._lock:
+                self._stats["misses"] += 1
+            return False, None
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, negative, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+
+            if row is None:
+                self._stats["misses"] += 1
+                return False, None
+
+            value, negative, expires_at = row
+            if expires_at <= now:
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                    (self.namespace, key),
+                )
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return False, None
+
+            conn.execute(
+                "UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+            self._stats["negative_hits" if negative else "hits"] += 1
+
+        return True, json.loads(zlib.decompress(value).decode("utf-8"))
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value or default"""
+        hit, value = self.lookup(key)
+        return value if hit else default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None, negative: Optional[bool] = None):
+        """Store a JSON-serialisable value"""
+        if negative is None:
+            negative = self.is_negative(value)
+        if ttl is None:
+            ttl = self.negative_ttl if negative else self.default_ttl
+
+        blob = zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries "
+                "(namespace, key, value, size, negative, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, blob, len(blob), int(negative), now + ttl, now),
+            )
+            self._stats["writes"] += 1
+            self._evict(conn, now)
+
+    def _evict(self, conn, now: float):
+        """Drop expired entries, then least recently used ones over the caps"""
+        conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?",
+            (self.namespace, now),
+        )
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()
+
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        rows = conn.execute(
+            "SELECT key, size FROM cache_entries WHERE namespace = ? ORDER BY last_access ASC",
+            (self.namespace,),
+        )
+        victims = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((self.namespace, key))
+            count -= 1
+            total -= size
+
+        conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+        self._stats["evictions"] += len(victims)
+
+    def delete(self, key: str):
+        """Remove a single entry"""
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            )
+
+    def clear(self):
+        """Remove all entries of this namespace"""
+        with self._lock:
+            self._connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            count, total = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?",
+                (self.namespace,),
+            ).fetchone()
+            stats = dict(self._stats)
+
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["entries"] = count
+        stats["bytes"] = total
+        stats["hit_ratio"] = (stats["hits"] + stats["negative_hits"]) / lookups if lookups else 0.0
+        return stats